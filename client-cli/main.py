@@ -1,4 +1,12 @@
 import argparse
+import glob
+import mmap
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+
 import requests
 import yaml
 from dotenv import load_dotenv
@@ -10,6 +18,12 @@ load_dotenv()
 rest_endpoint = os.getenv("REST_ENDPOINT")
 ws_endpoint = os.getenv("WS_ENDPOINT")
 
+# videos above this size are uploaded in parts
+MULTIPART_THRESHOLD = 64 * 1024 * 1024  # 64 MB
+PART_ATTEMPTS = 3
+# duration of the segments of --presegment, matches the chunk duration of the server-side split
+SEGMENT_SECS = 10
+
 
 def parse_arguments():
   if rest_endpoint is None:
@@ -19,6 +33,11 @@ def parse_arguments():
   parser = argparse.ArgumentParser(description="Upload video and perform operations on it.")
   parser.add_argument("config", help="Path to the config.yaml file")
   parser.add_argument("video", help="Path to the video file")
+  parser.add_argument("--parallel", type=int, default=8, help="Number of parts that are uploaded concurrently")
+  parser.add_argument("--presegment", action="store_true",
+                      help="Split the video into segments locally (requires ffmpeg), "
+                           "each segment is processed as soon as it is uploaded")
+  parser.add_argument("--segment-secs", type=float, default=SEGMENT_SECS, help="Duration of the segments in seconds")
   return parser.parse_args()
 
 
@@ -27,14 +46,26 @@ def read_config(config_path):
     return yaml.safe_load(file)
 
 
-def post_job(config):
+def post_job(config, upload_size=None, segments=None):
+  """
+  Creates a job. If the upload size is given, the job is created with a multipart upload.
+  If the number of segments is given, the job is created with a streaming ingest of the segments.
+
+  :return: job id and either the presigned upload url, the multipart upload or the segment urls
+  """
   print("Creating job…")
+  body = dict(config)
+  if upload_size is not None:
+    body["upload"] = {"size": upload_size}
+  if segments is not None:
+    body["ingest"] = {"segments": segments, "extension": "ts"}
   try:
-    response = requests.post(f"{rest_endpoint}/jobs", json=config)
+    response = requests.post(f"{rest_endpoint}/jobs", json=body)
     response.raise_for_status()
   except:
     raise Exception("Creating job failed.")
-  return response.json()["jobId"], response.json()["url"]
+  data = response.json()
+  return data["jobId"], data.get("segmentUrls", data.get("upload", data.get("url")))
 
 
 def upload_to_s3(upload_url, video_path):
@@ -49,13 +80,224 @@ def upload_to_s3(upload_url, video_path):
     raise Exception(f"Failed to upload file: {video_path}")
 
 
-def listen_for_result(job_id):
+def presegment(video_path, out_dir, segment_secs):
+  """
+  Splits the video at keyframes into MPEG-TS segments of ~segment_secs seconds, without re-encoding.
+  The segments are self-contained, so the server processes each of them as a chunk.
+
+  :return: paths of the segments, in order
+  """
+  print("Splitting video…")
+  command = [
+    "ffmpeg", "-v", "error",
+    "-i", video_path,
+    "-map", "0:v:0",
+    "-map", "0:a:0?",
+    "-c", "copy",
+    "-f", "segment",
+    "-segment_time", str(segment_secs),
+    "-segment_format", "mpegts",
+    "-reset_timestamps", "1",
+    os.path.join(out_dir, "%05d.ts")
+  ]
+  try:
+    subprocess.run(command, check=True)
+  except (OSError, subprocess.CalledProcessError):
+    raise Exception(f"Failed to split video: {video_path}")
+  return sorted(glob.glob(os.path.join(out_dir, "*.ts")))
+
+
+def upload_segments(segment_urls, segment_paths, parallel):
+  """
+  Uploads the segments concurrently, in order of their index, so the server processes the first segments first.
+  """
+  def upload_segment(url, path):
+    for attempt in range(PART_ATTEMPTS):
+      try:
+        with open(path, 'rb') as file:
+          response = requests.put(url, data=file)
+        response.raise_for_status()
+        return
+      except requests.RequestException:
+        if attempt == PART_ATTEMPTS - 1:
+          raise Exception(f"Failed to upload segment: {path}")
+
+  uploaded = 0
+  with ThreadPoolExecutor(max_workers=parallel) as executor:
+    for future in as_completed([executor.submit(upload_segment, url, path)
+                                for url, path in zip(segment_urls, segment_paths)]):
+      future.result()
+      uploaded += 1
+      print(f"\rUploading segments… {uploaded}/{len(segment_paths)}", end="", flush=True)
+  print()
+
+
+class MultipartUpload:
+  """
+  Uploads the parts of a video concurrently, using the presigned urls of the job.
+  Finished parts are recorded in a state file next to the video, so an interrupted upload can be resumed.
+  """
+
+  def __init__(self, video_path, parallel):
+    self.video_path = video_path
+    self.parallel = parallel
+    self.state_path = f"{video_path}.upload.json"
+    self.size = os.path.getsize(video_path)
+    self.lock = threading.Lock()
+    self.state = None
+
+  def load_state(self):
+    """
+    Loads the state of an interrupted upload of the same video.
+
+    :return: id of the job of the upload, None if there is nothing to resume
+    """
+    if not os.path.exists(self.state_path):
+      return None
+    with open(self.state_path, 'r') as f:
+      state = json.load(f)
+    if state["size"] != self.size or state["mtime"] != os.path.getmtime(self.video_path):
+      print("Video changed since the interrupted upload, start a new job.")
+      return None
+    self.state = state
+    return state["jobId"]
+
+  def start(self, job_id, upload):
+    self.state = {
+      "jobId": job_id,
+      "size": self.size,
+      "mtime": os.path.getmtime(self.video_path),
+      "upload": upload,
+      "parts": {}
+    }
+    self.save_state()
+
+  def save_state(self):
+    tmp_path = f"{self.state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+      json.dump(self.state, f)
+    os.replace(tmp_path, self.state_path)
+
+  def run(self):
+    upload = self.state["upload"]
+    part_size = upload["partSize"]
+    pending = [number for number in range(1, len(upload["partUrls"]) + 1) if str(number) not in self.state["parts"]]
+    uploaded = self.size - sum(max(0, min(part_size, self.size - (number - 1) * part_size)) for number in pending)
+    if self.state["parts"]:
+      print(f"Resuming upload, {len(self.state['parts'])} parts already uploaded.")
+
+    with open(self.video_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as video:
+      with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+        futures = {executor.submit(self.upload_part, video, number, part_size): number for number in pending}
+        for future in as_completed(futures):
+          number = futures[future]
+          etag, length = future.result()
+          with self.lock:
+            self.state["parts"][str(number)] = etag
+            self.save_state()
+          uploaded += length
+          print(f"\rUploading video… {uploaded / 1024 / 1024:.1f}/{self.size / 1024 / 1024:.1f} MB "
+                f"({uploaded / max(1, self.size):.0%})", end="", flush=True)
+    print()
+
+    self.complete()
+    os.remove(self.state_path)
+
+  def upload_part(self, video, number, part_size):
+    start = (number - 1) * part_size
+    data = video[start:start + part_size]
+    for attempt in range(PART_ATTEMPTS):
+      try:
+        response = requests.put(self.state["upload"]["partUrls"][number - 1], data=data)
+        response.raise_for_status()
+        return response.headers["ETag"], len(data)
+      except requests.RequestException:
+        if attempt == PART_ATTEMPTS - 1:
+          raise
+
+  def complete(self):
+    parts = "".join(f"<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>"
+                    for number, etag in sorted(self.state["parts"].items(), key=lambda item: int(item[0])))
+    response = requests.post(self.state["upload"]["completeUrl"],
+                             data=f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>")
+    response.raise_for_status()
+    # s3 may report errors of the completion with status 200
+    if b"<Error>" in response.content:
+      raise Exception(f"Failed to complete upload: {response.text}")
+
+
+class ProgressTracker:
+  """
+  Aggregates the (coalesced) progress events of a job and estimates throughput and ETA.
+  """
+
+  def __init__(self):
+    self.duration = None
+    self.chunk_count = None
+    self.chunks = {}
+    self.chunks_done = 0
+    self.process_start = None
+    self.reduce_start = None
+
+  def update(self, event) -> str:
+    stage = event['stage']
+    now = event['time']
+    if event.get('duration'):
+      self.duration = float(event['duration'])
+
+    if stage == 'preprocess':
+      self.chunk_count = event.get('chunkCount', self.chunk_count)
+      return f"Splitting video: {event.get('chunksEmitted', 0)} chunks emitted"
+
+    if stage == 'process':
+      self.process_start = self.process_start or now
+      for chunk, state in event.get('chunks', {}).items():
+        self.chunks.setdefault(chunk, {}).update({key: value for key, value in state.items() if value is not None})
+      # the chunk workers report the job-wide counter, the chunk states may be incomplete due to coalescing
+      self.chunks_done = max(self.chunks_done, event.get('chunksDone', 0),
+                             sum(1 for state in self.chunks.values() if state.get('done')))
+      processed_secs = sum(float(state.get('outTime') or 0) for state in self.chunks.values())
+      fps = [float(state['fps']) for state in self.chunks.values() if not state.get('done') and state.get('fps')]
+
+      line = f"Processing chunks: {self.chunks_done}/{self.chunk_count or '?'} done"
+      if fps:
+        line += f", {sum(fps):.0f} fps"
+      elapsed = now - self.process_start
+      if elapsed > 0 and processed_secs > 0:
+        speed = processed_secs / elapsed
+        line += f", {speed:.1f}x realtime"
+        if self.duration:
+          line += f", ETA {max(0.0, self.duration - processed_secs) / speed:.0f} s"
+      return line
+
+    if stage == 'reduce':
+      if event.get('done'):
+        return "Merging chunks: done"
+      self.reduce_start = self.reduce_start or now
+      uploaded_mb = event.get('bytesUploaded', 0) / 1024 / 1024
+      elapsed = now - self.reduce_start
+      line = f"Merging chunks: {uploaded_mb:.1f} MB uploaded"
+      if elapsed > 0:
+        line += f", {uploaded_mb / elapsed:.1f} MB/s"
+      return line
+
+    return f"{stage}…"
+
+
+def listen_for_result(job_id, chunk_count=None):
   print("Processing video…")
   try:
     headers = [("jobId", job_id)]
+    tracker = ProgressTracker()
+    tracker.chunk_count = chunk_count
     with connect(ws_endpoint, additional_headers=headers) as websocket:
-      data = json.loads(websocket.recv())
-      print(data['msg'])
+      while True:
+        data = json.loads(websocket.recv())
+        if data.get('type') == 'progress':
+          print(tracker.update(data))
+          continue
+        print(data['msg'])
+        break
   except:
     print("Failed to listen for process updates. Please try again later.")
 
@@ -64,8 +306,23 @@ def main():
   try:
     args = parse_arguments()
     config = read_config(args.config)
-    job_id, upload_url = post_job(config)
-    upload_to_s3(upload_url, args.video)
+    if args.presegment:
+      with tempfile.TemporaryDirectory() as segment_dir:
+        segment_paths = presegment(args.video, segment_dir, args.segment_secs)
+        job_id, segment_urls = post_job(config, segments=len(segment_paths))
+        upload_segments(segment_urls, segment_paths, args.parallel)
+      listen_for_result(job_id, len(segment_paths))
+      return
+    if os.path.getsize(args.video) > MULTIPART_THRESHOLD:
+      upload = MultipartUpload(args.video, args.parallel)
+      job_id = upload.load_state()
+      if job_id is None:
+        job_id, multipart = post_job(config, upload.size)
+        upload.start(job_id, multipart)
+      upload.run()
+    else:
+      job_id, upload_url = post_job(config)
+      upload_to_s3(upload_url, args.video)
     listen_for_result(job_id)
   except Exception as e:
     print(e)
@@ -0,0 +1,86 @@
+import json
+import re
+
+# Muxer and file extension per audio codec, used to stream audio into a pipe
+AUDIO_FORMATS = {
+  'aac': ('adts', 'aac'),
+  'mp3': ('mp3', 'mp3'),
+  'ac3': ('ac3', 'ac3'),
+  'eac3': ('eac3', 'eac3'),
+  'flac': ('flac', 'flac'),
+  'opus': ('ogg', 'opus'),
+  'vorbis': ('ogg', 'ogg'),
+}
+
+# Streamable fallback for all other codecs
+DEFAULT_AUDIO_FORMAT = ('matroska', 'mka')
+
+# ffmpeg encoder per audio codec
+AUDIO_ENCODERS = {
+  'aac': 'aac',
+  'mp3': 'libmp3lame',
+  'ac3': 'ac3',
+  'flac': 'flac',
+  'opus': 'libopus',
+  'vorbis': 'libvorbis',
+}
+
+# loudnorm works internally at 192 kHz, the output is resampled to this rate
+LOUDNORM_SAMPLE_RATE = 48000
+
+_LOUDNORM_STATS_RE = re.compile(r"\[Parsed_loudnorm[^\]]*\]\s*(\{[^}]*\})", re.S)
+
+
+def get_audio_format(acodec: str) -> tuple[str, str]:
+  """
+  Returns the muxer and file extension for the audio codec.
+  """
+  return AUDIO_FORMATS.get(acodec, DEFAULT_AUDIO_FORMAT)
+
+
+def get_audio_key(job_id: str, acodec: str) -> str:
+  return f"{job_id}/AUDIO.{get_audio_format(acodec)[1]}"
+
+
+def get_audio_track_key(job_id: str, acodec: str) -> str:
+  return f"{job_id}/AUDIO_TRACK.{get_audio_format(acodec)[1]}"
+
+
+def get_audio_output_args(acodec: str) -> list[str]:
+  """
+  Returns the ffmpeg output arguments that stream-copy the first audio stream to stdout.
+  """
+  muxer, _ = get_audio_format(acodec)
+  return ['-map', '0:a:0', '-vn', '-c:a', 'copy', '-f', muxer, 'pipe:1']
+
+
+def get_loudnorm_analysis_args(targets: dict[str, float]) -> list[str]:
+  """
+  Returns the ffmpeg output arguments for the first (measuring) loudnorm pass.
+  The measured values are printed to the log, see parse_loudnorm_stats.
+  """
+  return ['-map', '0:a:0', '-af', f"loudnorm={_format_targets(targets)}:print_format=json", '-f', 'null', '-']
+
+
+def get_loudnorm_filter(targets: dict[str, float], stats: dict[str, str]) -> str:
+  """
+  Returns the filter of the second loudnorm pass, which applies the measured values of the first pass.
+  """
+  measured = (f"measured_I={stats['input_i']}:measured_TP={stats['input_tp']}:"
+              f"measured_LRA={stats['input_lra']}:measured_thresh={stats['input_thresh']}:"
+              f"offset={stats['target_offset']}")
+  return f"loudnorm={_format_targets(targets)}:{measured}:linear=true,aresample={LOUDNORM_SAMPLE_RATE}"
+
+
+def parse_loudnorm_stats(log: str) -> dict[str, str] | None:
+  """
+  Extracts the json stats of the first loudnorm pass from the ffmpeg log.
+  """
+  matches = _LOUDNORM_STATS_RE.findall(log)
+  if not matches:
+    return None
+  return json.loads(matches[-1])
+
+
+def _format_targets(targets: dict[str, float]) -> str:
+  return f"I={targets['I']}:TP={targets['TP']}:LRA={targets['LRA']}"
@@ -0,0 +1,94 @@
+import logging
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _job_key(job_id: str) -> dict[str, str]:
+  return {
+    'PK': f"JOB#{job_id}",
+    'SK': "DATA"
+  }
+
+
+def mark_chunk_done(job_table, job_id: str, index: int, parts: int = 1) -> int | None:
+  """
+  Marks a chunk as processed with a single conditional update:
+  increments the `chunks.done` counter and adds the index to the `chunks.doneSet` number set.
+  The condition makes the update idempotent, so retried invocations do not count a chunk twice.
+  If the chunk was split into several parts (continuations), `index:parts` is added to `chunks.splitParts`.
+
+  :return: number of processed chunks of the job, None if the chunk was already marked
+  """
+  return _mark(job_table, job_id, 'done', index, split_parts=parts if parts > 1 else None)
+
+
+def mark_segment_received(job_table, job_id: str, index: int) -> int | None:
+  """
+  Marks an ingested segment as uploaded, like mark_chunk_done (`chunks.received` and `chunks.receivedSet`).
+
+  :return: number of uploaded segments of the job, None if the segment was already marked
+  """
+  return _mark(job_table, job_id, 'received', index)
+
+
+def _mark(job_table, job_id: str, counter: str, index: int, split_parts: int | None = None) -> int | None:
+  update_expression = f'ADD chunks.{counter} :one, chunks.{counter}Set :index'
+  values = {
+    ':one': 1,
+    ':index': {index},
+    ':i': index
+  }
+  if split_parts is not None:
+    update_expression += ', chunks.splitParts :split'
+    values[':split'] = {f"{index}:{split_parts}"}
+
+  try:
+    response = job_table.update_item(
+      Key=_job_key(job_id),
+      UpdateExpression=update_expression,
+      ConditionExpression=f'attribute_not_exists(chunks.{counter}Set) OR NOT contains(chunks.{counter}Set, :i)',
+      ExpressionAttributeValues=values,
+      ReturnValues="UPDATED_NEW"
+    )
+  except ClientError as e:
+    if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+      logger.info(f"Chunk {index} of job {job_id} is already marked as {counter}.")
+      return None
+    raise
+  return int(response['Attributes']['chunks'][counter])
+
+
+def get_chunk_status(job_table, job_id: str) -> tuple[int, int, set[int]]:
+  """
+  Reads the completion state of the chunks of a job.
+
+  :return: number of processed chunks, number of chunks and the indices of the processed chunks
+  """
+  response = job_table.get_item(
+    Key=_job_key(job_id),
+    ProjectionExpression='chunks.done, chunks.#length, chunks.doneSet',
+    ExpressionAttributeNames={'#length': 'length'},
+    ConsistentRead=True
+  )
+  chunks = response.get('Item', {}).get('chunks', {})
+  return (int(chunks.get('done', 0)),
+          int(chunks.get('length', 0)),
+          {int(i) for i in chunks.get('doneSet', set())})
+
+
+def get_split_parts(job_table, job_id: str) -> dict[int, int]:
+  """
+  Reads the number of parts of the processed chunks that were split (see mark_chunk_done).
+
+  :return: chunk index -> number of parts, chunks that were not split are omitted
+  """
+  response = job_table.get_item(
+    Key=_job_key(job_id),
+    ProjectionExpression='chunks.splitParts',
+    ConsistentRead=True
+  )
+  split_parts = response.get('Item', {}).get('chunks', {}).get('splitParts', set())
+  return {int(index): int(parts) for index, parts in (entry.split(':') for entry in split_parts)}
@@ -1,4 +1,5 @@
-from typing import Any
+import hashlib
+import json
 
 from utils import utils
 
@@ -7,9 +8,13 @@ class Config:
   format: None | str = None
   filters: dict[str: dict[str: any]] = {}
   extract_audio: bool = False
+  audio_codec: None | str = None
+  loudnorm: None | dict[str: float] = None
 
   def __init__(self, config: list[dict[str, any]]):
+    self.filters = {}
     self.valid_formats = ['mp4', 'mov', 'avi']
+    self.valid_audio_codecs = ['aac', 'mp3', 'opus', 'flac', 'ac3']
     self.filter_operations = ["crop", "resize", "sepia", "brightness", "grayscale"]
     self.used_filters = set()
 
@@ -29,6 +34,10 @@ class Config:
           self._check_format(op_opts)
         elif op_type == 'exaudio':
           self.extract_audio = True
+        elif op_type == 'acodec':
+          self._check_audio_codec(op_opts)
+        elif op_type == 'loudnorm':
+          self._check_loudnorm(op_opts)
         else:
           raise utils.ConfigError(f"Unsupported operation: '{op_type}'")
       except ValueError as e:
@@ -44,6 +53,9 @@ class Config:
       if len(opts_list) not in [2, 4]:
         raise utils.ConfigError(f"Invalid {op_type} options: {op_opts}")
       opts_dict = dict(zip(['width', 'height', 'x', 'y'][:len(opts_list)], map(int, opts_list)))
+      if op_type == 'resize':
+        # resize never used a position, x and y are still accepted (and ignored) for existing configs
+        opts_dict = {'width': opts_dict['width'], 'height': opts_dict['height']}
     elif op_type == 'brightness':
       opts_dict = {'value': float(op_opts)}
     else:
@@ -58,6 +70,37 @@ class Config:
 
     self.format = format_opt
 
+  def _check_audio_codec(self, op_opts):
+    codec = str(op_opts).strip()
+    if codec not in self.valid_audio_codecs:
+      raise utils.ConfigError(f"Configured audio codec {codec} is not a valid codec: {self.valid_audio_codecs}")
+
+    self.audio_codec = codec
+
+  def _check_loudnorm(self, op_opts):
+    # optional targets: integrated loudness (LUFS), true peak (dBTP) and loudness range (LU)
+    opts_list = str(op_opts).split(' ') if op_opts is not None else []
+    if len(opts_list) > 3:
+      raise utils.ConfigError(f"Invalid loudnorm options: {op_opts}")
+    targets = dict(zip(['I', 'TP', 'LRA'], map(float, opts_list)))
+
+    self.loudnorm = {'I': -16.0, 'TP': -1.5, 'LRA': 11.0, **targets}
+
+  @property
+  def processes_audio(self) -> bool:
+    """
+    Whether the audio must be re-encoded instead of stream-copied.
+    """
+    return self.audio_codec is not None or self.loudnorm is not None
+
+  def fingerprint(self) -> str:
+    """
+    Returns a stable hash of all settings that influence the ffmpeg command of a chunk.
+    Configs with equal fingerprints result in equal commands.
+    """
+    settings = json.dumps({'filters': self.filters, 'format': self.format}, sort_keys=True, default=str)
+    return hashlib.sha1(settings.encode('utf-8')).hexdigest()
+
 
 def get_job_config(job_table, job_id: str) -> Config:
   response = job_table.get_item(
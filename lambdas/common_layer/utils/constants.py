@@ -1,3 +1,75 @@
 # A bunch of constants to configure the video processing
 
 TARGET_CHUNK_SECS = 10
+
+# Chunks are grouped into work units until a unit holds at least this many bytes
+TARGET_UNIT_BYTES = 32 * 1024 * 1024  # 32 MB
+# Upper bound of chunks per work unit (unless the concurrency quota requires larger units)
+MAX_CHUNKS_PER_UNIT = 8
+# Fallback if the lambda concurrency quota is not configured
+DEFAULT_CONCURRENCY_QUOTA = 1000
+
+# Length of the section (from the start of the video) that is read to determine the GOP structure
+GOP_PROBE_SECS = 30
+
+# Number of bytes fetched from the start and the end of a source for partial-read probing
+PARTIAL_PROBE_BYTES = 4 * 1024 * 1024  # 4 MB
+
+# Transactions per second of the rekognition DetectLabels quota
+REKOGNITION_TPS = 5
+# Maximal number of concurrent DetectLabels requests
+MAX_LABEL_WORKERS = 16
+# Maximal number of attempts of a throttled DetectLabels request
+MAX_LABEL_ATTEMPTS = 8
+# Number of reference images whose labels are written to the job entry with a single update
+LABEL_BATCH_SIZE = 50
+
+# Reference image candidates are selected at scene changes above this threshold ...
+SCENE_CHANGE_THRESHOLD = 0.3
+# ... and at least every CANDIDATE_INTERVAL_SECS seconds
+CANDIDATE_INTERVAL_SECS = 1
+# Number of scored candidates that are kept as chunk metadata
+KEPT_CANDIDATES = 3
+# Resolution of the frames used for scoring
+SCORE_FRAME_WIDTH = 160
+SCORE_FRAME_HEIGHT = 90
+# Frames with a lower standard deviation of their luminance are considered blank
+BLANK_FRAME_STD = 0.02
+# Number of best scored reference images that are considered for the thumbnail
+THUMBNAIL_CANDIDATES = 5
+
+# Minimal duration of black and silent intervals that are reported as metadata
+BLACK_MIN_SECS = 0.5
+SILENCE_MIN_SECS = 0.5
+# Audio below this level is considered silence
+SILENCE_NOISE_DB = -50
+
+# Websocket connections of a job expire after this time (dynamodb TTL)
+CONNECTION_TTL_SECS = 24 * 60 * 60
+# Maximal number of concurrent post_to_connection requests
+MAX_NOTIFY_WORKERS = 32
+# Progress events of a job are pushed to its websocket clients at most every PROGRESS_INTERVAL_SECS
+PROGRESS_INTERVAL_SECS = 2
+# Minimal size of a multipart upload part (except the last one), given by s3
+MIN_PART_BYTES = 5 * 1024 * 1024  # 5 MB
+# Maximal (source) size of the chunks that are appended per incremental reduction step, bounded by /tmp
+REDUCTION_STEP_BYTES = 256 * 1024 * 1024  # 256 MB
+# Concurrent delete_objects requests and attempts per batch of the cleanup
+MAX_DELETE_WORKERS = 16
+MAX_DELETE_ATTEMPTS = 5
+# Part size of multipart uploads of the client, grows if the video needs more than MAX_UPLOAD_PARTS parts
+UPLOAD_PART_BYTES = 64 * 1024 * 1024  # 64 MB
+MAX_UPLOAD_PARTS = 10000
+# Validity of the presigned upload urls, a resumed upload must finish within this time
+UPLOAD_URL_EXPIRATION_SECS = 6 * 60 * 60
+# Streaming ingest: container formats of the uploaded segments and maximal number of segments
+INGEST_EXTENSIONS = ['ts', 'mp4']
+MAX_INGEST_SEGMENTS = 10000
+# The processing of all ingested segments must finish within this time after the last upload
+INGEST_TIMEOUT_SECS = 15 * 60
+# ffmpeg processes must finish this many seconds before the lambda times out (upload and cleanup)
+FFMPEG_DEADLINE_MARGIN_SECS = 10
+# Seconds a terminated ffmpeg process gets to finish its outputs before it is killed
+FFMPEG_KILL_GRACE_SECS = 3
+# A chunk that is stopped at the deadline is only split if at least this many seconds were processed
+MIN_SPLIT_SECS = 1
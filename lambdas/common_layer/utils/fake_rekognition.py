@@ -0,0 +1,37 @@
+import hashlib
+import threading
+
+from botocore.exceptions import ClientError
+
+FAKE_LABELS = ['Person', 'Face', 'Smile', 'Adult', 'Happy', 'Standing', 'Hair', 'Clothing', 'Head', 'Portrait']
+
+
+class FakeRekognitionClient:
+  """
+  Local stand-in for the rekognition client that answers DetectLabels without calling AWS.
+
+  The labels are derived deterministically from the image key. If `throttle_every` is set,
+  every n-th request fails with a ThrottlingException, like rekognition does when the TPS quota is exceeded.
+  """
+
+  def __init__(self, throttle_every: int = 0):
+    self.throttle_every = throttle_every
+    self.calls = 0
+    self._lock = threading.Lock()
+
+  def detect_labels(self, Image, MaxLabels=10, MinConfidence=0, **kwargs):
+    with self._lock:
+      self.calls += 1
+      throttled = self.throttle_every and self.calls % self.throttle_every == 0
+
+    if throttled:
+      raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'DetectLabels')
+
+    key = Image['S3Object']['Name']
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    label_count = digest[0] % (min(MaxLabels, len(FAKE_LABELS)) + 1)
+
+    return {
+      'Labels': [{'Name': name, 'Confidence': max(float(MinConfidence), 90.0 + digest[i + 1] % 10)}
+                 for i, name in enumerate(FAKE_LABELS[:label_count])]
+    }
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, BinaryIO, Callable
+
+from utils import constants
+from utils import progress
+from utils import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class FFmpegResult:
+  """
+  Outputs of a finished (or stopped) ffmpeg process.
+  """
+
+  def __init__(self, returncode: int, stdout: bytes, log: str, last_progress: dict[str, str]):
+    self.returncode = returncode
+    self.stdout = stdout
+    self.log = log
+    self.last_progress = last_progress
+
+  @property
+  def out_time(self) -> float:
+    """
+    Media time in seconds that was processed, according to the last progress block.
+    """
+    return progress.get_progress_seconds(self.last_progress)
+
+
+class FFmpegDeadlineError(utils.FFmpegError):
+  """
+  Raised if an ffmpeg process did not finish before its deadline.
+  The process was stopped gracefully, so its outputs contain the prefix that was processed up to `result.out_time`.
+  """
+
+  def __init__(self, message: str, result: FFmpegResult):
+    super().__init__(message)
+    self.result = result
+
+
+def deadline_from_context(context, margin_secs: float = constants.FFMPEG_DEADLINE_MARGIN_SECS) -> float | None:
+  """
+  Returns the deadline (time.monotonic) of ffmpeg processes within the lambda invocation,
+  margin_secs before the invocation times out. None without a lambda context.
+  """
+  if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+    return None
+  return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin_secs
+
+
+async def run(command: list[str], on_progress: Callable[[dict[str, str]], None] | None = None,
+              deadline: float | None = None, capture_stdout: bool = True, check: bool = True,
+              on_stdout: Callable[[BinaryIO], Any] | None = None) -> FFmpegResult:
+  """
+  Runs an ffmpeg command (without a shell).
+  The `-progress` output of ffmpeg is written to a separate pipe and passed to on_progress block by block.
+
+  If the deadline (time.monotonic) is reached, ffmpeg is terminated gracefully (it finishes its outputs)
+  and FFmpegDeadlineError is raised. If the calling task is cancelled, ffmpeg is terminated as well,
+  so several processes can be run concurrently (e.g. in an asyncio.TaskGroup) without leaking processes.
+
+  :param command: ffmpeg command, starting with the binary
+  :param capture_stdout: whether stdout is returned, otherwise it is discarded
+  :param check: whether a non-zero exit code raises utils.FFmpegError
+  :param on_stdout: streams stdout instead of capturing it, called in a worker thread with the readable pipe
+                    (e.g. s3_utils.multipart_upload). If it raises, ffmpeg is killed and the error is raised.
+  """
+  progress_read, progress_write = os.pipe()
+  stdout_read, stdout_write = os.pipe() if on_stdout else (None, None)
+  if on_stdout:
+    stdout_target = stdout_write
+  else:
+    stdout_target = asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL
+
+  command = [command[0], "-progress", f"pipe:{progress_write}", "-nostats", *command[1:]]
+  try:
+    process = await asyncio.create_subprocess_exec(
+      *command,
+      stdin=asyncio.subprocess.DEVNULL,
+      stdout=stdout_target,
+      stderr=asyncio.subprocess.PIPE,
+      pass_fds=(progress_write,))
+  except OSError as e:
+    os.close(progress_read)
+    if on_stdout:
+      os.close(stdout_read)
+    raise utils.FFmpegError("Failed to start ffmpeg process", e)
+  finally:
+    os.close(progress_write)
+    if on_stdout:
+      os.close(stdout_write)
+
+  if on_stdout:
+    read_stdout = _stream_stdout(process, stdout_read, on_stdout)
+  else:
+    read_stdout = process.stdout.read() if capture_stdout else _none()
+
+  parser = progress.ProgressParser(on_progress)
+  communication = asyncio.ensure_future(asyncio.gather(
+    _read_progress(progress_read, parser),
+    read_stdout,
+    process.stderr.read(),
+    process.wait()))
+
+  try:
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    _, stdout, stderr, returncode = await asyncio.wait_for(asyncio.shield(communication), timeout)
+  except asyncio.TimeoutError:
+    _, stdout, stderr, returncode = await _stop(process, communication)
+    result = FFmpegResult(returncode, stdout or b'', stderr.decode('utf-8', errors='replace'), parser.last)
+    logger.warning(f"ffmpeg exceeded its deadline and was stopped at {result.out_time:.2f} s")
+    raise FFmpegDeadlineError("ffmpeg exceeded its deadline", result)
+  except asyncio.CancelledError:
+    await _stop(process, communication)
+    raise
+  except Exception:
+    # e.g. the stdout consumer failed
+    if process.returncode is None:
+      process.kill()
+    await process.wait()
+    raise
+
+  result = FFmpegResult(returncode, stdout or b'', stderr.decode('utf-8', errors='replace'), parser.last)
+  if check and returncode != 0:
+    logger.error(result.log)
+    raise utils.FFmpegError(f"Failed to run ffmpeg process, exitcode {returncode}")
+  return result
+
+
+def run_sync(command: list[str], **kwargs) -> FFmpegResult:
+  """
+  Runs an ffmpeg command from synchronous code (see run), e.g. from the worker threads of a handler.
+  """
+  return asyncio.run(run(command, **kwargs))
+
+
+async def _stop(process: asyncio.subprocess.Process, communication: asyncio.Future):
+  """
+  Terminates the process (ffmpeg finishes its outputs on SIGTERM) and kills it if it does not exit in time.
+  """
+  if process.returncode is None:
+    process.terminate()
+  try:
+    return await asyncio.wait_for(asyncio.shield(communication), constants.FFMPEG_KILL_GRACE_SECS)
+  except asyncio.TimeoutError:
+    logger.warning(f"ffmpeg did not exit within {constants.FFMPEG_KILL_GRACE_SECS} s, kill it.")
+    process.kill()
+    return await communication
+
+
+async def _stream_stdout(process: asyncio.subprocess.Process, fd: int, on_stdout: Callable[[BinaryIO], Any]):
+  """
+  Passes the stdout pipe to on_stdout in a worker thread. If it fails, nobody reads stdout anymore
+  and ffmpeg would block on the full pipe, so it is killed.
+  """
+
+  def consume():
+    with os.fdopen(fd, 'rb') as stream:
+      on_stdout(stream)
+
+  try:
+    await asyncio.get_running_loop().run_in_executor(None, consume)
+  except BaseException:
+    if process.returncode is None:
+      process.kill()
+    raise
+
+
+async def _read_progress(fd: int, parser: progress.ProgressParser):
+  loop = asyncio.get_running_loop()
+  reader = asyncio.StreamReader()
+  transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, 'rb'))
+  try:
+    async for line in reader:
+      parser.feed(line)
+  finally:
+    transport.close()
+
+
+async def _none():
+  return None
@@ -0,0 +1,181 @@
+import abc
+import logging
+from typing import Any
+
+import ffmpeg
+
+from utils import config_utils
+from utils import constants
+from utils import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# placeholders of the compiled commands, substituted by CommandTemplate.render
+INPUT = "{input}"
+OUTPUT = "{output}"
+CANDIDATE_PREFIX = "{candidate_prefix}"
+
+
+class VideoFilter(abc.ABC):
+  """
+  A configured video filter, applied to a stream of the ffmpeg-python DAG.
+  The options are validated on construction.
+  """
+
+  @abc.abstractmethod
+  def apply(self, stream: ffmpeg.nodes.FilterableStream) -> ffmpeg.nodes.FilterableStream:
+    pass
+
+
+class Crop(VideoFilter):
+  def __init__(self, width: int, height: int, x: int | None = None, y: int | None = None):
+    self.width = _positive(width, 'crop width')
+    self.height = _positive(height, 'crop height')
+    # the crop is centered by default
+    self.x = '(in_w-out_w)/2' if x is None else _non_negative(x, 'crop x')
+    self.y = '(in_h-out_h)/2' if y is None else _non_negative(y, 'crop y')
+
+  def apply(self, stream):
+    return stream.filter('crop', self.width, self.height, self.x, self.y)
+
+
+class Resize(VideoFilter):
+  def __init__(self, width: int, height: int):
+    # -1 and -2 keep the aspect ratio (-2 rounds to an even size)
+    self.width = width if width in (-1, -2) else _positive(width, 'resize width')
+    self.height = height if height in (-1, -2) else _positive(height, 'resize height')
+
+  def apply(self, stream):
+    return stream.filter('scale', self.width, self.height)
+
+
+class Brightness(VideoFilter):
+  def __init__(self, value: float):
+    if not -1.0 <= value <= 1.0:
+      raise utils.ConfigError(f"Brightness {value} is not within [-1, 1]")
+    self.value = value
+
+  def apply(self, stream):
+    return stream.filter('eq', brightness=self.value)
+
+
+class Grayscale(VideoFilter):
+  def apply(self, stream):
+    return stream.filter('hue', s=0)
+
+
+class Sepia(VideoFilter):
+  MATRIX = (.393, .769, .189, 0, .349, .686, .168, 0, .272, .534, .131)
+
+  def apply(self, stream):
+    return stream.filter('colorchannelmixer', *self.MATRIX)
+
+
+FILTERS: dict[str, type[VideoFilter]] = {
+  'crop': Crop,
+  'resize': Resize,
+  'brightness': Brightness,
+  'grayscale': Grayscale,
+  'sepia': Sepia,
+}
+
+
+def create_video_filters(config: config_utils.Config) -> list[VideoFilter]:
+  """
+  Creates the video filters of the config, in the configured order.
+
+  :raises utils.ConfigError: if a filter is unknown or its options are invalid
+  """
+  video_filters = []
+  for name, opts in config.filters.items():
+    if name not in FILTERS:
+      raise utils.ConfigError(f"Invalid filter {name}")
+    try:
+      video_filters.append(FILTERS[name](**opts))
+    except TypeError as e:
+      raise utils.ConfigError(f"Invalid options of filter {name}: {opts}", e)
+  return video_filters
+
+
+class CommandTemplate:
+  """
+  A compiled ffmpeg command with placeholders for the paths of a single invocation.
+  Rendering only substitutes the placeholders, the graph is not compiled again.
+  """
+
+  def __init__(self, args: list[str]):
+    self.args = args
+    self._placeholder_args = [i for i, arg in enumerate(args)
+                              if any(p in arg for p in (INPUT, OUTPUT, CANDIDATE_PREFIX))]
+
+  def render(self, input_url: str, output_path: str, candidate_prefix: str, seek: float | None = None) -> list[str]:
+    """
+    :param candidate_prefix: path prefix of the candidate images, is also part of the filter graph
+                             and must not contain filter-graph special characters (e.g. ':', ',' or ';')
+    :param seek: start time within the input in seconds (input seeking, the output starts at 0)
+    """
+    args = list(self.args)
+    for i in self._placeholder_args:
+      args[i] = (args[i].replace(INPUT, input_url)
+                 .replace(OUTPUT, output_path)
+                 .replace(CANDIDATE_PREFIX, candidate_prefix))
+    if seek:
+      input_index = self.args.index(INPUT)
+      args[input_index - 1:input_index - 1] = ['-ss', f"{seek:.6f}"]
+    return args
+
+
+def compile_chunk_command(config: config_utils.Config, has_audio: bool, keep_audio: bool) -> CommandTemplate:
+  """
+  Compiles the ffmpeg command that processes a chunk and extracts reference image candidates
+  within the same decode pass (see process_chunk.build_command for the outputs).
+  The command only depends on the config and the audio flags, so warm containers reuse it.
+  """
+  source = ffmpeg.input(INPUT)
+
+  video = source.video.filter('blackdetect', d=constants.BLACK_MIN_SECS)
+  for video_filter in create_video_filters(config):
+    video = video_filter.apply(video)
+  processed = video.split()
+
+  select = (f"isnan(prev_selected_t)+gt(scene,{constants.SCENE_CHANGE_THRESHOLD})"
+            f"+gte(t-prev_selected_t,{constants.CANDIDATE_INTERVAL_SECS})")
+  candidates = (processed[1]
+                .filter('select', select)
+                .filter('metadata', 'print', file=f"{CANDIDATE_PREFIX}.txt")
+                .split())
+  scoring = candidates[1].filter('scale', constants.SCORE_FRAME_WIDTH, constants.SCORE_FRAME_HEIGHT)
+
+  if keep_audio:
+    chunk_output = ffmpeg.output(processed[0], source['a?'], OUTPUT, **{'c:a': 'copy'})
+  else:
+    chunk_output = ffmpeg.output(processed[0], OUTPUT, an=None)
+
+  outputs = [
+    chunk_output,
+    ffmpeg.output(candidates[0], f"{CANDIDATE_PREFIX}-%03d.jpg", vsync='vfr'),
+    ffmpeg.output(scoring, 'pipe:1', vsync='vfr', format='rawvideo', pix_fmt='rgb24'),
+  ]
+  if has_audio:
+    analysis = (source.audio
+                # only the summary of ebur128 is parsed, its frame log would be printed every 100 ms
+                .filter('ebur128', framelog='quiet')
+                .filter('silencedetect', noise=f"{constants.SILENCE_NOISE_DB}dB", d=constants.SILENCE_MIN_SECS))
+    outputs.append(ffmpeg.output(analysis, '-', format='null'))
+
+  args = ffmpeg.merge_outputs(*outputs).compile()
+  logger.info(f"Compiled chunk command: {args}")
+  return CommandTemplate(args)
+
+
+def _positive(value: Any, name: str) -> int:
+  if not isinstance(value, int) or value <= 0:
+    raise utils.ConfigError(f"Invalid {name} {value}, must be a positive integer")
+  return value
+
+
+def _non_negative(value: Any, name: str) -> int:
+  if not isinstance(value, int) or value < 0:
+    raise utils.ConfigError(f"Invalid {name} {value}, must be a non-negative integer")
+  return value
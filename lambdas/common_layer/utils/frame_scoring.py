@@ -0,0 +1,69 @@
+import numpy as np
+
+from utils import constants
+
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def decode_raw_frames(data: bytes) -> np.ndarray:
+  """
+  Converts rgb24 rawvideo output of ffmpeg at the scoring resolution into frames.
+
+  :return: frames as array of shape (n, SCORE_FRAME_HEIGHT, SCORE_FRAME_WIDTH, 3)
+  """
+  return np.frombuffer(data, dtype=np.uint8).reshape(-1, constants.SCORE_FRAME_HEIGHT, constants.SCORE_FRAME_WIDTH, 3)
+
+
+def parse_frame_metadata(path: str) -> list[dict[str, float]]:
+  """
+  Parses the output of ffmpeg's `metadata=print` filter.
+
+  :return: timestamp (`time`) and scene change score (`sceneScore`) per printed frame
+  """
+  frames = []
+  with open(path, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if line.startswith('frame:'):
+        fields = dict(field.split(':', 1) for field in line.split() if ':' in field)
+        pts_time = fields.get('pts_time', 'nan')
+        frames.append({'time': float(pts_time) if pts_time != 'NOPTS' else 0.0, 'sceneScore': 0.0})
+      elif line.startswith('lavfi.scene_score=') and frames:
+        frames[-1]['sceneScore'] = float(line.split('=', 1)[1])
+  return frames
+
+
+def score_frames(frames: np.ndarray) -> np.ndarray:
+  """
+  Scores the quality of frames as reference image, vectorised over all frames.
+
+  The score combines sharpness (variance of the laplacian), exposure (mean luminance and clipping)
+  and colourfulness (Hasler and Suesstrunk). Blank frames are scored with 0.
+
+  :param frames: uint8 rgb frames of shape (n, height, width, 3)
+  :return: scores in [0, 1] of shape (n,)
+  """
+  if len(frames) == 0:
+    return np.zeros(0, dtype=np.float32)
+
+  rgb = frames.astype(np.float32) / 255
+  gray = rgb @ _LUMA_WEIGHTS
+
+  laplacian = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+               - 4 * gray[:, 1:-1, 1:-1])
+  sharpness = laplacian.var(axis=(1, 2))
+  sharpness = sharpness / (sharpness + 0.002)
+
+  mean = gray.mean(axis=(1, 2))
+  clipped = ((gray < 0.02) | (gray > 0.98)).mean(axis=(1, 2))
+  exposure = (1 - 2 * np.abs(mean - 0.5)) * (1 - clipped)
+
+  rg = rgb[..., 0] - rgb[..., 1]
+  yb = 0.5 * (rgb[..., 0] + rgb[..., 1]) - rgb[..., 2]
+  colourfulness = (np.sqrt(rg.std(axis=(1, 2)) ** 2 + yb.std(axis=(1, 2)) ** 2)
+                   + 0.3 * np.sqrt(rg.mean(axis=(1, 2)) ** 2 + yb.mean(axis=(1, 2)) ** 2))
+  colourfulness = colourfulness / (colourfulness + 0.1)
+
+  scores = 0.5 * sharpness + 0.3 * exposure + 0.2 * colourfulness
+  scores[gray.std(axis=(1, 2)) < constants.BLANK_FRAME_STD] = 0
+  return scores
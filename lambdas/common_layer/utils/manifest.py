@@ -0,0 +1,163 @@
+import functools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import boto3
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MANIFEST_VERSION = 1
+
+s3_client = boto3.client('s3')
+
+
+def get_manifest_key(job_id: str) -> str:
+  return f"{job_id}/MANIFEST/chunks.json"
+
+
+def get_units_key(job_id: str) -> str:
+  return f"{job_id}/MANIFEST/units.json"
+
+
+def get_unit_result_key(job_id: str, start: int) -> str:
+  return f"{job_id}/MANIFEST/results-{start:06d}.json"
+
+
+def get_processed_key(job_id: str) -> str:
+  return f"{job_id}/MANIFEST/processed.json"
+
+
+class ChunkManifest:
+  """
+  Columnar description of the chunks of a job.
+
+  The chunks are stored as columns (names, sizes, offsets and durations) instead of a list of objects,
+  which keeps the manifest compact. Chunk dicts are only built for the requested range.
+  """
+
+  def __init__(self, data: dict[str, Any]):
+    if data.get('version') != MANIFEST_VERSION:
+      raise ValueError(f"Unsupported manifest version {data.get('version')}")
+    self.data = data
+    self.job_id = data['jobId']
+
+  def __len__(self):
+    return len(self.data['names'])
+
+  def chunk(self, index: int) -> dict[str, Any]:
+    return {
+      'key': f"{self.job_id}/CHUNKS/{self.data['names'][index]}",
+      'jobId': self.job_id,
+      'extension': self.data['extension'],
+      'size': self.data['sizes'][index],
+      'index': index,
+      'offset': self.data['offsets'][index],
+      'duration': self.data['durations'][index],
+    }
+
+  def chunks(self, start: int = 0, end: int | None = None) -> list[dict[str, Any]]:
+    end = len(self) if end is None else end
+    return [self.chunk(i) for i in range(start, end)]
+
+
+def write_manifest(bucket_name: str, job_id: str, extension: str, chunks: list[dict[str, Any]],
+                   units: list[dict[str, int]]) -> str:
+  """
+  Stores the chunk manifest and the work units of the job.
+  The work units are stored as separate json array, so a distributed map can read them as items.
+
+  :param chunks: ordered chunks with key, size, offset and duration
+  :param units: work units as ranges of chunk indices ({'start', 'end'})
+  :return: key of the manifest
+  """
+  data = {
+    'version': MANIFEST_VERSION,
+    'jobId': job_id,
+    'extension': extension,
+    'names': [c['key'].rsplit('/', 1)[1] for c in chunks],
+    'sizes': [c['size'] for c in chunks],
+    'offsets': [c['offset'] for c in chunks],
+    'durations': [c['duration'] for c in chunks],
+  }
+  manifest_key = get_manifest_key(job_id)
+  _put_json(bucket_name, manifest_key, data)
+  write_units(bucket_name, job_id, units)
+  logger.info(f"Stored manifest of {len(chunks)} chunks in {len(units)} units at {manifest_key}.")
+  return manifest_key
+
+
+def write_units(bucket_name: str, job_id: str, units: list[dict[str, int]]) -> str:
+  """
+  Stores the work units of the job, which locate the unit results (see load_processed_chunks).
+  """
+  key = get_units_key(job_id)
+  _put_json(bucket_name, key, units)
+  return key
+
+
+@functools.lru_cache(maxsize=8)
+def load_manifest(bucket_name: str, manifest_key: str) -> ChunkManifest:
+  """
+  Loads the chunk manifest, warm containers keep the recently used manifests.
+  """
+  return ChunkManifest(_get_json(bucket_name, manifest_key))
+
+
+def store_unit_result(bucket_name: str, job_id: str, start: int, processed_chunks: list[dict[str, Any]]) -> str:
+  """
+  Stores the processed chunks of a work unit, instead of returning them through the state payload.
+  """
+  key = get_unit_result_key(job_id, start)
+  _put_json(bucket_name, key, processed_chunks)
+  return key
+
+
+def load_unit_result(bucket_name: str, job_id: str, start: int) -> list[dict[str, Any]]:
+  """
+  Loads the processed chunks of a work unit that were stored by previous invocations (continuations).
+  """
+  try:
+    return _get_json(bucket_name, get_unit_result_key(job_id, start))
+  except s3_client.exceptions.NoSuchKey:
+    return []
+
+
+def load_units(bucket_name: str, job_id: str) -> list[dict[str, int]]:
+  return _get_json(bucket_name, get_units_key(job_id))
+
+
+def store_processed_chunks(bucket_name: str, job_id: str, processed_chunks: list[dict[str, Any]]) -> str:
+  """
+  Stores the processed chunks of all work units as a single list (see aggregate_units).
+  """
+  key = get_processed_key(job_id)
+  _put_json(bucket_name, key, processed_chunks)
+  return key
+
+
+def load_processed_chunks(bucket_name: str, job_id: str) -> list[dict[str, Any]]:
+  """
+  Loads the processed chunks of all work units of the job, in order.
+  If the results were already aggregated into a single list, only this list is read.
+  """
+  try:
+    return _get_json(bucket_name, get_processed_key(job_id))
+  except s3_client.exceptions.NoSuchKey:
+    pass
+
+  units = load_units(bucket_name, job_id)
+  with ThreadPoolExecutor(max_workers=min(32, max(1, len(units)))) as executor:
+    results = executor.map(lambda unit: _get_json(bucket_name, get_unit_result_key(job_id, unit['start'])), units)
+    return [chunk for unit_chunks in results for chunk in unit_chunks]
+
+
+def _put_json(bucket_name: str, key: str, data: Any):
+  s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(data, separators=(',', ':')).encode('utf-8'),
+                       ContentType='application/json')
+
+
+def _get_json(bucket_name: str, key: str) -> Any:
+  return json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read())
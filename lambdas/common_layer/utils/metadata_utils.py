@@ -0,0 +1,131 @@
+import math
+import re
+from typing import Any
+
+# Intervals of neighbouring chunks that are closer than this are merged
+_MERGE_GAP_SECS = 0.05
+
+_BLACK_RE = re.compile(r"black_start:\s*(\S+)\s+black_end:\s*(\S+)")
+_SILENCE_START_RE = re.compile(r"silence_start:\s*(\S+)")
+_SILENCE_END_RE = re.compile(r"silence_end:\s*(\S+)")
+_INTEGRATED_RE = re.compile(r"\bI:\s+(-?[\d.]+|-inf) LUFS")
+_LRA_RE = re.compile(r"\bLRA:\s+(-?[\d.]+) LU\b")
+
+
+def parse_analysis_log(log: str, duration: float) -> dict[str, Any]:
+  """
+  Parses the log of the blackdetect, silencedetect and ebur128 filters of a chunk.
+
+  :param log: stderr output of ffmpeg
+  :param duration: duration of the chunk, closes intervals that last until the end of the chunk
+  :return: black and silent intervals and the loudness (None if the chunk has no audio)
+  """
+  black = [[float(start), float(end)] for start, end in _BLACK_RE.findall(log)]
+
+  silence = []
+  for line in log.splitlines():
+    if match := _SILENCE_START_RE.search(line):
+      silence.append([max(0.0, float(match.group(1))), duration])
+    elif (match := _SILENCE_END_RE.search(line)) and silence:
+      silence[-1][1] = float(match.group(1))
+
+  # the summary of ebur128 is printed last
+  integrated = _INTEGRATED_RE.findall(log)
+  lra = _LRA_RE.findall(log)
+  loudness = None
+  if integrated:
+    loudness = {
+      'integrated': float(integrated[-1]),
+      'lra': float(lra[-1]) if lra else None
+    }
+
+  return {'black': black, 'silence': silence, 'loudness': loudness}
+
+
+def merge_chunk_metadata(chunks: list[dict[str, Any]]) -> dict[str, Any]:
+  """
+  Merges the metadata of consecutive chunks into the metadata of the whole video.
+
+  Intervals are shifted by the chunk offsets and joined across chunk boundaries.
+  The integrated loudness is the duration weighted energy mean of the chunks, which approximates
+  EBU R128 (the gating is only applied per chunk).
+
+  :param chunks: metadata of the chunks in order
+  """
+  offset = 0.0
+  black, silence = [], []
+  frames = keyframes = size = 0
+  max_keyframe_secs = 0.0
+  loudness_energy = loudness_duration = 0.0
+  max_lra = None
+  per_chunk = []
+
+  for chunk in chunks:
+    duration = chunk['duration'] or 0.0
+    _append_intervals(black, chunk['black'], offset)
+    _append_intervals(silence, chunk['silence'], offset)
+
+    frames += chunk['frames']
+    keyframes += chunk['keyframes']
+    size += chunk['size'] or 0
+    max_keyframe_secs = max(max_keyframe_secs, chunk['maxKeyframeSecs'] or 0.0)
+
+    loudness = chunk.get('loudness')
+    if loudness and loudness['integrated'] is not None and math.isfinite(loudness['integrated']):
+      loudness_energy += duration * 10 ** (loudness['integrated'] / 10)
+      loudness_duration += duration
+      if loudness['lra'] is not None:
+        max_lra = max(max_lra or 0.0, loudness['lra'])
+
+    per_chunk.append({
+      'start': round(offset, 3),
+      'duration': duration,
+      'bitrate': chunk['bitrate'],
+      'frames': chunk['frames'],
+      'keyframes': chunk['keyframes'],
+      'avgKeyframeSecs': chunk['avgKeyframeSecs'],
+    })
+    offset += duration
+
+  integrated = None
+  if loudness_duration > 0 and loudness_energy > 0:
+    integrated = round(10 * math.log10(loudness_energy / loudness_duration), 2)
+
+  return {
+    'duration': round(offset, 3),
+    'bitrate': int(size * 8 / offset) if offset else None,
+    'frames': frames,
+    'keyframes': keyframes,
+    'avgKeyframeSecs': round(offset / keyframes, 3) if keyframes else None,
+    'maxKeyframeSecs': max_keyframe_secs,
+    'loudness': {'integrated': integrated, 'maxChunkLra': max_lra},
+    'black': black,
+    'silence': silence,
+    'chunks': per_chunk,
+  }
+
+
+def summarize_metadata(metadata: dict[str, Any]) -> dict[str, Any]:
+  """
+  Summary of the video metadata for the job entry.
+  The intervals and the per chunk metadata grow with the video length, so only their aggregates are kept
+  (the full metadata is stored as METADATA.json).
+  """
+  summary = {key: value for key, value in metadata.items() if key not in ('black', 'silence', 'chunks')}
+  for key in ('black', 'silence'):
+    lengths = [end - start for start, end in metadata[key]]
+    summary[key] = {
+      'count': len(lengths),
+      'totalSecs': round(sum(lengths), 3),
+      'longestSecs': round(max(lengths), 3) if lengths else None,
+    }
+  return summary
+
+
+def _append_intervals(intervals: list[list[float]], chunk_intervals: list[list[float]], offset: float):
+  for start, end in chunk_intervals:
+    start, end = round(start + offset, 3), round(end + offset, 3)
+    if intervals and start - intervals[-1][1] <= _MERGE_GAP_SECS:
+      intervals[-1][1] = max(intervals[-1][1], end)
+    else:
+      intervals.append([start, end])
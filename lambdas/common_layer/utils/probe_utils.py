@@ -0,0 +1,278 @@
+import json
+import logging
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any
+
+import ffmpeg
+
+from utils import constants
+from utils import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def probe_video(video_url: str) -> dict[str, Any]:
+  """
+  Probes the video with a single ffprobe call.
+  Besides format and streams, the video packets of the first GOP_PROBE_SECS seconds
+  are read to determine the GOP structure.
+
+  :param video_url: url or path of the video
+  :return: parsed video information (see parse_probe)
+  """
+  try:
+    probe = ffmpeg.probe(video_url,
+                         v='error',
+                         show_entries='packet=stream_index,pts_time,flags',
+                         read_intervals=f"%+{constants.GOP_PROBE_SECS}")
+  except ffmpeg.Error as e:
+    logger.error(e.stderr)
+    raise utils.FFmpegError("Failed to probe video", e)
+
+  return parse_probe(probe)
+
+
+def probe_s3_video(s3_client, bucket_name: str, key: str, size: int, video_url: str) -> dict[str, Any]:
+  """
+  Probes an MP4/MOV source by only reading its first and last PARTIAL_PROBE_BYTES bytes.
+
+  Both ranges are fetched with ranged GETs and written to a sparse local file of the original size,
+  so ffprobe can seek to the moov box wherever it is located. Packet timestamps and keyframe flags
+  come from the moov sample tables, so the GOP structure is available without reading the media data.
+  Falls back to probing the full source at video_url if the moov box is not contained in the fetched ranges.
+
+  :param s3_client: boto3 s3 client
+  :param bucket_name: bucket of the source
+  :param key: key of the source
+  :param size: size of the source in bytes
+  :param video_url: presigned url of the source, used for the fallback
+  :return: parsed video information (see parse_probe)
+  """
+  range_size = constants.PARTIAL_PROBE_BYTES
+
+  if size <= 2 * range_size:
+    head = _get_range(s3_client, bucket_name, key, f"bytes=0-{size - 1}")
+    tail = b''
+  else:
+    with ThreadPoolExecutor(2) as executor:
+      head_future = executor.submit(_get_range, s3_client, bucket_name, key, f"bytes=0-{range_size - 1}")
+      tail_future = executor.submit(_get_range, s3_client, bucket_name, key, f"bytes=-{range_size}")
+      head, tail = head_future.result(), tail_future.result()
+
+  if not _contains_moov(head, tail, size):
+    logger.info(f"moov box of {key} is not within the fetched ranges, fall back to full probe.")
+    return probe_video(video_url)
+
+  with tempfile.NamedTemporaryFile(dir='/tmp', suffix='.mp4') as f:
+    f.write(head)
+    f.seek(size - len(tail))
+    f.write(tail)
+    f.truncate(size)
+    f.flush()
+    logger.info(f"Probe {key} from {(len(head) + len(tail)) / 1024 / 1024:.2f} MB of partial reads.")
+    return probe_video(f.name)
+
+
+def probe_chunk(path: str) -> dict[str, Any]:
+  """
+  Reads the statistics of a processed chunk from its container index, without decoding it.
+
+  :param path: path of the chunk
+  :return: duration, bitrate, size, number of frames and the keyframe spacing
+  """
+  try:
+    probe = ffmpeg.probe(path, v='error', select_streams='v:0', show_entries='packet=pts_time,flags')
+  except ffmpeg.Error as e:
+    logger.error(e.stderr)
+    raise utils.FFmpegError("Failed to probe chunk", e)
+
+  fmt = probe.get('format', {})
+  packets = probe.get('packets', [])
+  keyframe_times = [float(p['pts_time']) for p in packets
+                    if 'K' in p.get('flags', '') and p.get('pts_time') not in (None, 'N/A')]
+  gop = _get_gop_structure(sorted(keyframe_times))
+
+  return {
+    'duration': _to_float(fmt.get('duration')),
+    'bitrate': _to_int(fmt.get('bit_rate')),
+    'size': _to_int(fmt.get('size')),
+    'frames': len(packets),
+    'keyframes': gop['keyframes'],
+    'avgKeyframeSecs': gop['avgSecs'],
+    'maxKeyframeSecs': gop['maxSecs'],
+  }
+
+
+def has_audio_stream(url: str) -> bool:
+  """
+  Checks whether the source contains an audio stream, by only reading its stream headers.
+  Used for ingested segments, which are processed before the whole video could be probed.
+  """
+  try:
+    probe = ffmpeg.probe(url, v='error', select_streams='a', show_entries='stream=index')
+  except ffmpeg.Error as e:
+    logger.error(e.stderr)
+    raise utils.FFmpegError("Failed to probe audio streams", e)
+  return len(probe.get('streams', [])) > 0
+
+
+def parse_probe(probe: dict[str, Any]) -> dict[str, Any]:
+  """
+  Converts the JSON output of ffprobe into the video information of a job.
+  """
+  streams = probe.get('streams', [])
+  fmt = probe.get('format', {})
+
+  video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+  if video is None:
+    raise utils.InputSourceError("Input contains no video stream")
+
+  audio_streams = [{
+    'index': s['index'],
+    'codec': s.get('codec_name'),
+    'channels': s.get('channels'),
+    'sampleRate': _to_int(s.get('sample_rate')),
+    'bitrate': _to_int(s.get('bit_rate')),
+    'language': s.get('tags', {}).get('language'),
+  } for s in streams if s.get('codec_type') == 'audio']
+
+  keyframe_times = [float(p['pts_time']) for p in probe.get('packets', [])
+                    if p.get('stream_index') == video['index'] and 'K' in p.get('flags', '')
+                    and p.get('pts_time') not in (None, 'N/A')]
+
+  return {
+    'width': int(video['width']),
+    'height': int(video['height']),
+    'vcodec': video.get('codec_name'),
+    'pixFmt': video.get('pix_fmt'),
+    'fps': _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate')),
+    'rotation': _get_rotation(video),
+    'duration': _to_float(fmt.get('duration', video.get('duration'))),
+    'bitrate': _to_int(fmt.get('bit_rate')),
+    'size': _to_int(fmt.get('size')),
+    'container': fmt.get('format_name'),
+    'gop': _get_gop_structure(sorted(keyframe_times)),
+    'audioStreams': audio_streams,
+  }
+
+
+def store_probe(job_table, job_id: str, video_info: dict[str, Any]):
+  """
+  Caches the video information in the job item, so later stages do not need to probe again.
+  """
+  job_table.update_item(
+    Key={
+      'PK': f"JOB#{job_id}",
+      'SK': "DATA"
+    },
+    UpdateExpression='SET probe = :val',
+    ExpressionAttributeValues={
+      # dynamodb does not support floats
+      ':val': json.loads(json.dumps(video_info), parse_float=Decimal)
+    }
+  )
+
+
+def get_job_probe(job_table, job_id: str) -> dict[str, Any]:
+  """
+  Returns the cached video information of the job.
+  """
+  response = job_table.get_item(
+    Key={
+      'PK': f"JOB#{job_id}",
+      'SK': "DATA"
+    },
+    ProjectionExpression='probe'
+  )
+
+  probe = response.get('Item', {}).get('probe', None)
+
+  if probe is None:
+    raise ValueError(f"Probe information of {job_id} not found!")
+
+  return probe
+
+
+def _get_range(s3_client, bucket_name: str, key: str, byte_range: str) -> bytes:
+  return s3_client.get_object(Bucket=bucket_name, Key=key, Range=byte_range)['Body'].read()
+
+
+def _contains_moov(head: bytes, tail: bytes, size: int) -> bool:
+  """
+  Walks the top-level MP4 boxes and checks whether the moov box lies completely within head or tail.
+  """
+  tail_start = size - len(tail)
+
+  def read(offset, length):
+    if offset + length <= len(head):
+      return head[offset:offset + length]
+    if offset >= tail_start and offset + length <= size:
+      return tail[offset - tail_start:offset - tail_start + length]
+    return None
+
+  offset = 0
+  while offset + 8 <= size:
+    header = read(offset, 8)
+    if header is None:
+      return False
+
+    box_size, box_type = struct.unpack('>I4s', header)
+    header_size = 8
+    if box_size == 1:
+      large_size = read(offset + 8, 8)
+      if large_size is None:
+        return False
+      box_size = struct.unpack('>Q', large_size)[0]
+      header_size = 16
+    elif box_size == 0:
+      box_size = size - offset
+
+    if offset == 0 and box_type != b'ftyp':
+      # not an MP4/MOV container
+      return False
+    if box_size < header_size:
+      return False
+
+    if box_type == b'moov':
+      return read(offset, box_size) is not None
+
+    offset += box_size
+
+  return False
+
+
+def _get_gop_structure(keyframe_times: list[float]) -> dict[str, Any]:
+  intervals = [b - a for a, b in zip(keyframe_times, keyframe_times[1:])]
+  if not intervals:
+    return {'keyframes': len(keyframe_times), 'avgSecs': None, 'maxSecs': None}
+  return {
+    'keyframes': len(keyframe_times),
+    'avgSecs': round(sum(intervals) / len(intervals), 3),
+    'maxSecs': round(max(intervals), 3),
+  }
+
+
+def _get_rotation(video: dict[str, Any]) -> int:
+  for side_data in video.get('side_data_list', []):
+    if 'rotation' in side_data:
+      return int(side_data['rotation'])
+  return int(video.get('tags', {}).get('rotate', 0))
+
+
+def _parse_rate(rate: str | None) -> float | None:
+  if not rate or rate == '0/0':
+    return None
+  num, _, den = rate.partition('/')
+  return round(float(num) / float(den or 1), 3)
+
+
+def _to_int(value) -> int | None:
+  return int(value) if value not in (None, 'N/A') else None
+
+
+def _to_float(value) -> float | None:
+  return float(value) if value not in (None, 'N/A') else None
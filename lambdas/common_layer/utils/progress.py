@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable
+
+import boto3
+from botocore.exceptions import ClientError
+
+from utils import constants
+from utils import ws_utils
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_websocket_client = None
+
+
+def _get_websocket_client():
+  global _websocket_client
+  if _websocket_client is None:
+    _websocket_client = boto3.client('apigatewaymanagementapi', endpoint_url=os.environ["WS_URL"])
+  return _websocket_client
+
+
+class ProgressReporter:
+  """
+  Pushes progress events of a processing stage to the websocket clients of the job.
+
+  Updates are coalesced: only the latest state is sent, at most every `interval` seconds.
+  As the stages of a job run in many lambdas at once, the interval is also enforced per job
+  with a conditional update of the job entry. The final state of a stage (`done` of its last lambda)
+  is always sent.
+  Without a websocket api (WS_URL not set), reporting is disabled.
+  """
+
+  def __init__(self, job_table, job_id: str, stage: str, interval: float = constants.PROGRESS_INTERVAL_SECS):
+    self.job_table = job_table
+    self.job_id = job_id
+    self.stage = stage
+    self.interval = interval
+    self.enabled = "WS_URL" in os.environ
+    self._bucket = TokenBucket(1 / interval, capacity=1)
+    self._bucket.try_acquire()  # the first event is sent after one interval
+    self._state: dict[str, Any] = {}
+    self._lock = threading.Lock()
+
+  def update(self, **fields):
+    """
+    Updates the state of the stage and sends it, if the rate limit allows it.
+    """
+    state = self._merge(fields)
+    if self.enabled and self._bucket.try_acquire() and self._claim_slot():
+      self._send(state)
+
+  def done(self, last: bool = True, **fields):
+    """
+    Sends the final state of the reporter.
+
+    :param last: whether this is the last lambda of the stage, only then the stage is marked as done
+                 and the state is sent regardless of the rate limit. Otherwise (e.g. a work unit of many)
+                 the state is coalesced like an update, so many concurrent lambdas do not flood the clients.
+    """
+    state = self._merge({**fields, 'done': True} if last else fields)
+    if self.enabled and (last or (self._bucket.try_acquire() and self._claim_slot())):
+      self._send(state)
+
+  def _merge(self, fields: dict[str, Any]) -> dict[str, Any]:
+    with self._lock:
+      for key, value in fields.items():
+        if isinstance(value, dict):
+          self._state.setdefault(key, {}).update(value)
+        else:
+          self._state[key] = value
+      return {key: dict(value) if isinstance(value, dict) else value for key, value in self._state.items()}
+
+  def _claim_slot(self) -> bool:
+    """
+    Claims the next send slot of the job, fails if another lambda sent an event within the interval.
+    """
+    now = time.time()
+    try:
+      self.job_table.update_item(
+        Key={
+          'PK': f"JOB#{self.job_id}",
+          'SK': "DATA"
+        },
+        UpdateExpression='SET progressAt = :now',
+        ConditionExpression='attribute_not_exists(progressAt) OR progressAt <= :before',
+        ExpressionAttributeValues={
+          ':now': int(now * 1000),
+          ':before': int((now - self.interval) * 1000)
+        }
+      )
+      return True
+    except ClientError as e:
+      if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+        return False
+      raise
+
+  def _send(self, state: dict[str, Any]):
+    try:
+      ws_utils.broadcast(_get_websocket_client(), self.job_table, self.job_id,
+                         {'type': 'progress', 'stage': self.stage, 'time': time.time(), **state})
+    except Exception as e:
+      # progress is best effort and must never fail the processing
+      logger.warning(f"Failed to send progress of job {self.job_id}: {e}")
+
+
+class ProgressParser:
+  """
+  Parses the output of ffmpeg's `-progress` option line by line and calls the callback with every block
+  of key=value pairs (e.g. fps, out_time_us, speed and progress).
+  """
+
+  def __init__(self, callback: Callable[[dict[str, str]], None] | None = None):
+    self.callback = callback
+    self.last: dict[str, str] = {}
+    self._block: dict[str, str] = {}
+
+  def feed(self, line: bytes):
+    key, _, value = line.decode('utf-8', errors='replace').strip().partition('=')
+    if not key:
+      return
+    self._block[key] = value
+    if key == 'progress':
+      self.last = self._block
+      self._block = {}
+      if self.callback:
+        self.callback(self.last)
+
+
+def get_progress_seconds(block: dict[str, str]) -> float:
+  """
+  Returns the processed media time of a `-progress` block in seconds.
+  """
+  try:
+    return int(block.get('out_time_us', 0)) / 1_000_000
+  except ValueError:
+    # N/A before the first frame
+    return 0.0
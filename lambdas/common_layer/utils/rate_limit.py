@@ -0,0 +1,66 @@
+import threading
+import time
+
+
+class TokenBucket:
+  """
+  Thread-safe token bucket that limits requests to a number of transactions per second.
+
+  The rate adapts to throttling: `throttle` halves the current rate, while `recover`
+  slowly increases it again up to the configured maximum.
+  """
+
+  def __init__(self, rate: float, capacity: float | None = None, min_rate: float = 0.5):
+    self.max_rate = rate
+    self.rate = rate
+    self.min_rate = min(min_rate, rate)
+    self.capacity = capacity if capacity is not None else rate
+    self._tokens = self.capacity
+    self._last_refill = time.monotonic()
+    self._lock = threading.Lock()
+
+  def acquire(self):
+    """
+    Blocks until a token is available and consumes it.
+    """
+    while True:
+      with self._lock:
+        self._refill()
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return
+        wait_secs = (1 - self._tokens) / self.rate
+      time.sleep(wait_secs)
+
+  def try_acquire(self) -> bool:
+    """
+    Consumes a token if one is available, without blocking.
+    """
+    with self._lock:
+      self._refill()
+      if self._tokens >= 1:
+        self._tokens -= 1
+        return True
+      return False
+
+  def throttle(self):
+    """
+    Decreases the rate multiplicatively after a throttled request.
+    """
+    with self._lock:
+      self._refill()
+      self.rate = max(self.min_rate, self.rate / 2)
+      self._tokens = min(self._tokens, 0)
+
+  def recover(self):
+    """
+    Increases the rate additively after a successful request.
+    """
+    with self._lock:
+      self._refill()
+      self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+  def _refill(self):
+    now = time.monotonic()
+    self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+    self._last_refill = now
@@ -2,6 +2,7 @@ import logging
 import boto3
 from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
 import concurrent.futures
 
 logger = logging.getLogger(__name__)
@@ -27,7 +28,11 @@ def _upload_part(s3_client, bucket_name, objectkey, part_number, upload_id, part
   return {'PartNumber': part_number, 'ETag': part['ETag']}
 
 
-def multipart_upload(input_stream, bucket_name, objectkey, part_size=DEFAULT_PART_SIZE):
+def multipart_upload(input_stream, bucket_name, objectkey, part_size=DEFAULT_PART_SIZE, on_progress=None):
+  """
+  Uploads the input stream in parts of part_size, the parts are uploaded in parallel.
+  on_progress is called with the number of uploaded bytes whenever a part is uploaded.
+  """
   s3_url = f"s3://{bucket_name}/{objectkey}"
   logger.info(f"Start multipart uploading to {s3_url}")
 
@@ -40,6 +45,15 @@ def multipart_upload(input_stream, bucket_name, objectkey, part_size=DEFAULT_PAR
 
   futures = []
   datasize = 0
+  uploaded = 0
+  uploaded_lock = threading.Lock()
+
+  def part_uploaded(size):
+    nonlocal uploaded
+    with uploaded_lock:
+      uploaded += size
+      if on_progress:
+        on_progress(uploaded)
 
   with ThreadPoolExecutor(os.cpu_count() * 5) as executor:
     while True:
@@ -54,6 +68,7 @@ def multipart_upload(input_stream, bucket_name, objectkey, part_size=DEFAULT_PAR
 
       # Upload a part
       future = executor.submit(_upload_part, s3_client, bucket_name, objectkey, part_number, mpu['UploadId'], data)
+      future.add_done_callback(lambda f, size=len(data): part_uploaded(size) if f.exception() is None else None)
       futures.append(future)
 
       part_number += 1
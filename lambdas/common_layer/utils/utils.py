@@ -1,3 +1,6 @@
+import os
+
+
 def get_jobid_from_key(key: str):
   return key.split("/")[0]
 
@@ -6,6 +9,32 @@ def get_extension_from_key(key: str):
   return key.rsplit(".")[1]
 
 
+def get_processed_chunk_key(job_id: str, chunk_key: str, format_: str, part: int = 0):
+  # continuations of a chunk that was split before the lambda timeout are stored as further parts
+  name = os.path.basename(chunk_key).rsplit('.')[0]
+  suffix = f"-part{part}" if part else ""
+  return f"{job_id}/PROCESSED/{name}{suffix}.{format_}"
+
+
+def get_ingest_segment_key(job_id: str, index: int, extension: str):
+  # the suffix distinguishes segments from other uploads in the s3 event filters,
+  # processed chunks drop it (see get_processed_chunk_key), so they never trigger the segment processing
+  return f"{job_id}/INGEST/{index:05d}.ingest.{extension}"
+
+
+def is_ingest_segment_key(key: str):
+  parts = key.split("/")
+  return len(parts) == 3 and parts[1] == "INGEST" and parts[2].rsplit(".", 1)[0].endswith(".ingest")
+
+
+def parse_ingest_segment_key(key: str):
+  """
+  :return: job id, index and extension of an ingested segment
+  """
+  name = os.path.basename(key)
+  return get_jobid_from_key(key), int(name.split('.')[0]), name.rsplit('.', 1)[1]
+
+
 class InternalError(Exception):
   pass
 
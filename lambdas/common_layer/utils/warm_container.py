@@ -0,0 +1,116 @@
+import functools
+import logging
+import os
+import shutil
+import time
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Working directories that survive between invocations of a warm container
+TMP_DIRS = ['/tmp/in', '/tmp/out', '/tmp/refimgs']
+
+# Binaries that are loaded into the page cache on container start
+PRELOAD_BINARIES = ['ffmpeg', 'ffprobe']
+
+_READ_BLOCK_SIZE = 8 * 1024 * 1024  # 8 MB
+
+# Module state lives as long as the container does
+_container_init_time = time.time()
+_invocation_count = 0
+_prewarmed = False
+_compiled_cache: dict[str, Any] = {}
+_invocation_hooks: list[Callable[[dict[str, Any]], None]] = []
+
+
+def register_invocation_hook(hook: Callable[[dict[str, Any]], None]):
+  """
+  Registers a hook that is called with the stats of every instrumented invocation.
+
+  The stats contain `cold` (first invocation of the container), `invocation` (number of the
+  invocation within the container), `prewarm_ms`, `duration_ms` and `container_age_ms`.
+  """
+  _invocation_hooks.append(hook)
+
+
+def prewarm():
+  """
+  Prepares the container once: loads the ffmpeg binaries into the page cache and creates the /tmp layout.
+  Subsequent calls in a warm container are no-ops.
+  """
+  global _prewarmed
+  if _prewarmed:
+    return
+
+  for binary in PRELOAD_BINARIES:
+    path = shutil.which(binary)
+    if path is None:
+      logger.warning(f"Binary {binary} not found, skip preloading.")
+      continue
+    with open(path, 'rb') as f:
+      while f.read(_READ_BLOCK_SIZE):
+        pass
+
+  for directory in TMP_DIRS:
+    os.makedirs(directory, exist_ok=True)
+
+  _prewarmed = True
+
+
+def reset_tmp_dirs():
+  """
+  Removes all files of the /tmp layout but keeps the directories for the next invocation.
+  """
+  for directory in TMP_DIRS:
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+      if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path, ignore_errors=True)
+      else:
+        os.remove(entry.path)
+
+
+def get_compiled(fingerprint: str, compile_fn: Callable[[], Any]) -> Any:
+  """
+  Returns the compiled value (e.g. a filter-graph string) for the fingerprint.
+  The value is compiled only on the first request of the container.
+  """
+  if fingerprint not in _compiled_cache:
+    _compiled_cache[fingerprint] = compile_fn()
+  return _compiled_cache[fingerprint]
+
+
+def instrumented(handler):
+  """
+  Decorator for lambda handlers that prewarms the container and measures cold and warm invocations.
+  """
+
+  @functools.wraps(handler)
+  def wrapper(event, context):
+    global _invocation_count
+    _invocation_count += 1
+    cold = _invocation_count == 1
+
+    start = time.time()
+    prewarm()
+    prewarm_ms = (time.time() - start) * 1000
+
+    try:
+      return handler(event, context)
+    finally:
+      stats = {
+        'cold': cold,
+        'invocation': _invocation_count,
+        'prewarm_ms': round(prewarm_ms, 2),
+        'duration_ms': round((time.time() - start) * 1000, 2),
+        'container_age_ms': round((start - _container_init_time) * 1000, 2),
+      }
+      logger.info(f"Invocation stats: {stats}")
+      for hook in _invocation_hooks:
+        try:
+          hook(stats)
+        except Exception as e:
+          logger.error(f"Invocation hook failed: {e}")
+
+  return wrapper
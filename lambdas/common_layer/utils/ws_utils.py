@@ -0,0 +1,95 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from boto3.dynamodb.conditions import Key
+
+from utils import constants
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CONNECTION_INDEX_NAME = "ConnectionIndex"
+
+
+def get_connection_key(job_id: str, connection_id: str) -> dict[str, str]:
+  return {
+    'PK': f"JOB#{job_id}",
+    'SK': f"CONN#{connection_id}"
+  }
+
+
+def store_connection(job_table, job_id: str, connection_id: str):
+  """
+  Stores a websocket connection as separate item of the job, which expires after CONNECTION_TTL_SECS.
+  """
+  job_table.put_item(
+    Item={
+      **get_connection_key(job_id, connection_id),
+      'connectionId': connection_id,
+      'ttl': int(time.time()) + constants.CONNECTION_TTL_SECS
+    }
+  )
+
+
+def remove_connection(job_table, connection_id: str):
+  """
+  Removes a websocket connection. The job of the connection is looked up by the (sparse) connection index,
+  as the disconnect event does not contain the job id.
+  """
+  response = job_table.query(
+    IndexName=CONNECTION_INDEX_NAME,
+    KeyConditionExpression=Key('connectionId').eq(connection_id)
+  )
+  for item in response['Items']:
+    job_table.delete_item(Key={'PK': item['PK'], 'SK': item['SK']})
+
+
+def get_connections(job_table, job_id: str) -> list[str]:
+  """
+  Returns the ids of all websocket connections of the job.
+  """
+  query_args = {
+    'KeyConditionExpression': Key('PK').eq(f"JOB#{job_id}") & Key('SK').begins_with("CONN#"),
+    'ProjectionExpression': 'connectionId'
+  }
+  connections = []
+  while True:
+    response = job_table.query(**query_args)
+    connections += [item['connectionId'] for item in response['Items']]
+    if 'LastEvaluatedKey' not in response:
+      return connections
+    query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def broadcast(websocket_client, job_table, job_id: str, data: dict[str, Any]) -> int:
+  """
+  Sends the data to all websocket connections of the job concurrently.
+  Connections that are gone are removed.
+
+  :return: number of connections the data was delivered to
+  """
+  connections = get_connections(job_table, job_id)
+  if not connections:
+    return 0
+
+  payload = json.dumps(data)
+
+  def send(connection_id: str) -> bool:
+    try:
+      websocket_client.post_to_connection(Data=payload, ConnectionId=connection_id)
+      return True
+    except websocket_client.exceptions.GoneException:
+      logger.info(f"Connection {connection_id} is gone, remove it.")
+      job_table.delete_item(Key=get_connection_key(job_id, connection_id))
+    except Exception as e:
+      logger.warning(f"Failed to notify connection {connection_id}: {e}")
+    return False
+
+  with ThreadPoolExecutor(max_workers=min(len(connections), constants.MAX_NOTIFY_WORKERS)) as executor:
+    delivered = sum(executor.map(send, connections))
+
+  logger.info(f"Notified {delivered}/{len(connections)} connections of job {job_id}.")
+  return delivered
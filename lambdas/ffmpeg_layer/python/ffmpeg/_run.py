@@ -2,10 +2,8 @@ from __future__ import unicode_literals
 from .dag import get_outgoing_edges, topo_sort
 from ._utils import basestring, convert_kwargs_to_cmd_line_args
 from builtins import str
-from functools import reduce
 import collections
 import copy
-import operator
 import subprocess
 
 from ._ffmpeg import input, output
@@ -150,22 +148,32 @@ def _get_output_args(node, stream_name_map):
 def get_args(stream_spec, overwrite_output=False):
     """Build command-line arguments to be passed to ffmpeg."""
     nodes = get_stream_spec_nodes(stream_spec)
-    args = []
     # TODO: group nodes together, e.g. `-i somefile -r somerate`.
     sorted_nodes, outgoing_edge_maps = topo_sort(nodes)
-    input_nodes = [node for node in sorted_nodes if isinstance(node, InputNode)]
-    output_nodes = [node for node in sorted_nodes if isinstance(node, OutputNode)]
-    global_nodes = [node for node in sorted_nodes if isinstance(node, GlobalNode)]
-    filter_nodes = [node for node in sorted_nodes if isinstance(node, FilterNode)]
+    input_nodes = []
+    output_nodes = []
+    global_nodes = []
+    filter_nodes = []
+    for node in sorted_nodes:
+        if isinstance(node, InputNode):
+            input_nodes.append(node)
+        elif isinstance(node, OutputNode):
+            output_nodes.append(node)
+        elif isinstance(node, GlobalNode):
+            global_nodes.append(node)
+        elif isinstance(node, FilterNode):
+            filter_nodes.append(node)
     stream_name_map = {(node, None): str(i) for i, node in enumerate(input_nodes)}
     filter_arg = _get_filter_arg(filter_nodes, outgoing_edge_maps, stream_name_map)
-    args += reduce(operator.add, [_get_input_args(node) for node in input_nodes])
+    args = []
+    for node in input_nodes:
+        args.extend(_get_input_args(node))
     if filter_arg:
         args += ['-filter_complex', filter_arg]
-    args += reduce(
-        operator.add, [_get_output_args(node, stream_name_map) for node in output_nodes]
-    )
-    args += reduce(operator.add, [_get_global_args(node) for node in global_nodes], [])
+    for node in output_nodes:
+        args.extend(_get_output_args(node, stream_name_map))
+    for node in global_nodes:
+        args.extend(_get_global_args(node))
     if overwrite_output:
         args += ['-y']
     return args
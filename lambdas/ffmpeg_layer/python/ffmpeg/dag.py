@@ -149,13 +149,15 @@ class KwargReprNode(DagNode):
         self.name = name
         self.args = args
         self.kwargs = kwargs
+        # upstream nodes are immutable and cache their hashes, so hashing a node only costs its own edges
         self.__hash = self.__get_hash()
+        self.__incoming_edges = None
 
     def __hash__(self):
         return self.__hash
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return self is other or hash(self) == hash(other)
 
     @property
     def short_hash(self):
@@ -176,7 +178,9 @@ class KwargReprNode(DagNode):
 
     @property
     def incoming_edges(self):
-        return get_incoming_edges(self, self.incoming_edge_map)
+        if self.__incoming_edges is None:
+            self.__incoming_edges = get_incoming_edges(self, self.incoming_edge_map)
+        return self.__incoming_edges
 
     @property
     def incoming_edge_map(self):
@@ -188,44 +192,42 @@ class KwargReprNode(DagNode):
 
 
 def topo_sort(downstream_nodes):
-    marked_nodes = []
+    """Sorts the nodes upstream of ``downstream_nodes`` topologically (upstream first).
+
+    The depth-first search uses an explicit stack instead of recursion, so deep chains do not hit the
+    recursion limit, and tracks visited nodes in sets, so the sort is linear in the number of edges.
+    The order of the nodes and edges is the same as the order of a recursive depth-first search.
+
+    Returns:
+        The sorted nodes and the outgoing edge maps of the nodes, which map each ``upstream_label`` to
+        a list of ``(downstream_node, downstream_label, downstream_selector)``.
+    """
+    marked_nodes = set()
+    visited_nodes = set()
     sorted_nodes = []
     outgoing_edge_maps = {}
 
-    def visit(
-        upstream_node,
-        upstream_label,
-        downstream_node,
-        downstream_label,
-        downstream_selector=None,
-    ):
-        if upstream_node in marked_nodes:
-            raise RuntimeError('Graph is not a DAG')
-
-        if downstream_node is not None:
-            outgoing_edge_map = outgoing_edge_maps.get(upstream_node, {})
-            outgoing_edge_infos = outgoing_edge_map.get(upstream_label, [])
-            outgoing_edge_infos += [
-                (downstream_node, downstream_label, downstream_selector)
-            ]
-            outgoing_edge_map[upstream_label] = outgoing_edge_infos
-            outgoing_edge_maps[upstream_node] = outgoing_edge_map
-
-        if upstream_node not in sorted_nodes:
-            marked_nodes.append(upstream_node)
-            for edge in upstream_node.incoming_edges:
-                visit(
-                    edge.upstream_node,
-                    edge.upstream_label,
-                    edge.downstream_node,
-                    edge.downstream_label,
-                    edge.upstream_selector,
-                )
-            marked_nodes.remove(upstream_node)
-            sorted_nodes.append(upstream_node)
-
-    unmarked_nodes = [(node, None) for node in downstream_nodes]
-    while unmarked_nodes:
-        upstream_node, upstream_label = unmarked_nodes.pop()
-        visit(upstream_node, upstream_label, None, None)
+    for node in reversed(downstream_nodes):
+        if node in visited_nodes:
+            continue
+        marked_nodes.add(node)
+        stack = [(node, iter(node.incoming_edges))]
+        while stack:
+            downstream_node, edges = stack[-1]
+            for edge in edges:
+                upstream_node = edge.upstream_node
+                if upstream_node in marked_nodes:
+                    raise RuntimeError('Graph is not a DAG')
+                outgoing_edge_maps.setdefault(upstream_node, {}).setdefault(
+                    edge.upstream_label, []
+                ).append((downstream_node, edge.downstream_label, edge.upstream_selector))
+                if upstream_node not in visited_nodes:
+                    marked_nodes.add(upstream_node)
+                    stack.append((upstream_node, iter(upstream_node.incoming_edges)))
+                    break
+            else:
+                stack.pop()
+                marked_nodes.remove(downstream_node)
+                visited_nodes.add(downstream_node)
+                sorted_nodes.append(downstream_node)
     return sorted_nodes, outgoing_edge_maps
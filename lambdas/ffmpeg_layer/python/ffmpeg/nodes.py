@@ -35,9 +35,12 @@ class Stream(object):
         self.node = upstream_node
         self.label = upstream_label
         self.selector = upstream_selector
+        self.__hash = None
 
     def __hash__(self):
-        return get_hash_int([hash(self.node), hash(self.label)])
+        if self.__hash is None:
+            self.__hash = get_hash_int([hash(self.node), hash(self.label)])
+        return self.__hash
 
     def __eq__(self, other):
         return hash(self) == hash(other)
@@ -1,11 +1,11 @@
 import logging
-import subprocess
 from typing import Dict, Any
 import os
 import boto3
 
 from utils import utils
 from utils import config_utils
+from utils import probe_utils
 
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
 OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
@@ -33,15 +33,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
   config = config_utils.get_job_config(job_table, job_id)
 
-  event["extractAudio"] = False
-  if config.extract_audio:
-    acodec = get_audio_codec(video_url)
-    event["acodec"] = acodec
-    event["extractAudio"] = True
-
-  video_info = get_video_details(video_url)
-  event.update(video_info)
+  video_info = probe_utils.probe_s3_video(s3_client, OBJ_BUCKET_NAME, video_key, event['size'], video_url)
+  # later stages read the stream information from the job item (see probe_utils.get_job_probe)
+  probe_utils.store_probe(job_table, job_id, video_info)
 
+  check_audio_stream(video_info, config)
   check_crop_dimensions(video_info, config)
 
   return event
@@ -66,47 +62,10 @@ def check_crop_dimensions(video_info: dict[str: Any], config: config_utils.Confi
     raise utils.InputSourceError('Crop dimensions and offsets are larger than video dimensions')
 
 
-def get_audio_codec(video_url: str) -> str:
-  command = [
-    'ffprobe', '-v', 'error', '-select_streams', 'a:0',
-    '-show_entries', 'stream=codec_name', '-of', 'default=noprint_wrappers=1:nokey=1', video_url
-  ]
-
-  try:
-    completed_process = subprocess.run(command, capture_output=True, text=True, check=True)
-  except subprocess.CalledProcessError as e:
-    logger.error(e.output)
-    raise utils.FFmpegError("Failed to extract audio codec", e)
-
-  codec = completed_process.stdout.strip()
-  return codec
-
-
-def get_video_details(video_url: str) -> dict:
-  command = [
-    'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-    '-show_entries', 'stream=width,height,codec_name', '-of', 'default=noprint_wrappers=1', video_url
-  ]
-
-  try:
-    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip().split('\n')
-
-    details = {}
-
-    for line in output:
-      key, value = line.split('=')
-      if key in ('width', 'height'):
-        details[key] = int(value)
-      elif key == 'codec_name':
-        details['vcodec'] = value
-      else:
-        details[key] = value
-
-    return details
-  except subprocess.CalledProcessError as e:
-    logger.error(e.output)
-    raise utils.FFmpegError("Failed to extract video information", e)
-
+def check_audio_stream(video_info: dict[str: Any], config: config_utils.Config):
+  # the audio is demuxed by preprocess and processed once for the whole video
+  if config.extract_audio and not video_info.get('audioStreams'):
+    raise utils.InputSourceError('Video contains no audio stream to extract')
 
 
 def extract_event_data(event: Dict[str, Any]) -> tuple[str, str, str]:
@@ -1,5 +1,6 @@
 import json
 import logging
+import math
 import os
 import uuid
 import boto3
@@ -8,6 +9,8 @@ from datetime import datetime
 from typing import Dict, Any
 from utils.job_status import JobStatus
 from utils import config_utils
+from utils import constants
+from utils import filter_graph
 from utils import utils
 
 logger = logging.getLogger(__name__)
@@ -21,6 +24,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 Handles post job REST API calls.
 - Creates a job entry in the DynamoDB table.
 - Generates a presigned URL for the job.
+  If the request contains the size of the video (`upload.size`), presigned URLs
+  for a multipart upload are generated instead, so the client can upload parts in parallel.
+  If the request contains pre-chunked segments (`ingest.segments` and `ingest.extension`), presigned URLs
+  for each segment are generated. Each segment is processed as soon as it is uploaded (streaming ingest).
 """
   logger.info(f"Invoked with event: {event}")
 
@@ -28,12 +35,12 @@ Handles post job REST API calls.
   db_client = boto3.client('dynamodb')
   job_id = str(uuid.uuid1())
 
-  presigned_url = generate_presigned_url(s3_client, job_id)
-
   try:
     body = json.loads(event.get("body", "{}"))
     operations = body.get("operations", [])
-  except json.JSONDecodeError as e:
+    upload_size = int(body["upload"]["size"]) if "upload" in body else None
+    ingest = parse_ingest(body["ingest"]) if "ingest" in body else None
+  except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
     logger.error(f"Error parsing request body: {e}")
     return {
       'statusCode': 400,
@@ -41,20 +48,32 @@ Handles post job REST API calls.
     }
 
   try:
-    config_utils.Config(operations)
+    config = config_utils.Config(operations)
+    # the filter options are validated once per job, the chunk workers only compile the validated filters
+    filter_graph.create_video_filters(config)
+    # ingested segments keep their audio, there is no separate audio track to process or extract
+    if ingest and (config.processes_audio or config.extract_audio):
+      raise utils.ConfigError("Audio operations are not supported for ingested segments")
   except utils.ConfigError as e:
     return {
       'statusCode': 400,
       'body': json.dumps({'error': f'{e}'})
     }
 
-  store_job_info(db_client, job_id, operations)
+  if ingest is not None:
+    response = {'segmentUrls': generate_segment_urls(s3_client, job_id, ingest)}
+  elif upload_size is None:
+    response = {'url': generate_presigned_url(s3_client, job_id)}
+  else:
+    response = {'upload': generate_multipart_upload(s3_client, job_id, upload_size)}
+
+  store_job_info(db_client, job_id, operations, ingest)
 
   logger.info(f"Successfully created job {job_id}")
 
   return {
     'statusCode': 200,
-    'body': json.dumps({'url': presigned_url, 'jobId': job_id})
+    'body': json.dumps({**response, 'jobId': job_id})
   }
 
 
@@ -73,7 +92,66 @@ def generate_presigned_url(s3_client, job_id: str) -> str:
     raise
 
 
-def store_job_info(db_client, job_id: str, operations: list) -> None:
+def generate_multipart_upload(s3_client, job_id: str, size: int) -> dict[str, Any]:
+  """
+  Creates a multipart upload of the video and presigns the upload of each part and the completion.
+  The part size grows with the video, as a multipart upload holds at most MAX_UPLOAD_PARTS parts.
+  """
+  bucket = os.environ["OBJECT_BUCKET_NAME"]
+  key = f"{job_id}/original.mp4"
+  part_size = max(constants.UPLOAD_PART_BYTES, math.ceil(size / constants.MAX_UPLOAD_PARTS))
+  part_count = max(1, math.ceil(size / part_size))
+  expiration = constants.UPLOAD_URL_EXPIRATION_SECS
+
+  try:
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+    part_urls = [s3_client.generate_presigned_url(
+      ClientMethod='upload_part',
+      Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+      ExpiresIn=expiration
+    ) for part_number in range(1, part_count + 1)]
+    complete_url = s3_client.generate_presigned_url(
+      ClientMethod='complete_multipart_upload',
+      Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id},
+      ExpiresIn=expiration
+    )
+  except ClientError as e:
+    logger.exception(f"Error creating multipart upload: {e}")
+    raise
+
+  return {
+    'uploadId': upload_id,
+    'partSize': part_size,
+    'partUrls': part_urls,
+    'completeUrl': complete_url
+  }
+
+
+def parse_ingest(ingest: dict[str, Any]) -> dict[str, Any]:
+  segments = int(ingest["segments"])
+  extension = str(ingest["extension"])
+  if not 0 < segments <= constants.MAX_INGEST_SEGMENTS or extension not in constants.INGEST_EXTENSIONS:
+    raise ValueError(f"Invalid ingest options: {ingest}")
+  return {'segments': segments, 'extension': extension}
+
+
+def generate_segment_urls(s3_client, job_id: str, ingest: dict[str, Any]) -> list[str]:
+  """Generates a presigned URL for the upload of each segment."""
+  try:
+    return [s3_client.generate_presigned_url(
+      ClientMethod='put_object',
+      Params={
+        'Bucket': os.environ["OBJECT_BUCKET_NAME"],
+        'Key': utils.get_ingest_segment_key(job_id, index, ingest['extension']),
+      },
+      ExpiresIn=constants.UPLOAD_URL_EXPIRATION_SECS
+    ) for index in range(ingest['segments'])]
+  except ClientError as e:
+    logger.exception(f"Error generating presigned URL: {e}")
+    raise
+
+
+def store_job_info(db_client, job_id: str, operations: list, ingest: dict[str, Any] | None = None) -> None:
   """Stores job information in DynamoDB."""
   logger.info(f"Store new job {job_id} in table {JOB_TABLE_NAME}")
   utc_time_str = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -90,12 +168,28 @@ def store_job_info(db_client, job_id: str, operations: list) -> None:
         'SK': {'S': "DATA"},
         'status': {'S': JobStatus.CREATED.value},
         'transformations': {'L': dynamo_operations},
-        'ws_connections': {'L': []},
         'labels': {'S': ''},
         'created_at': {'S': utc_time_str},
+        **(get_ingest_attributes(ingest) if ingest else {}),
       }
     )
   except ClientError as e:
     logger.exception(f"Error storing item in DynamoDB: {e}")
     # TODO: add s3 cleanup
     raise
+
+
+def get_ingest_attributes(ingest: dict[str, Any]) -> dict[str, Any]:
+  """
+  Job attributes of the streaming ingest. The chunks are known up front, as each segment is processed as one chunk.
+  """
+  segments = ingest['segments']
+  return {
+    'ingest': {'M': {'segments': {'N': str(segments)}, 'extension': {'S': ingest['extension']}}},
+    'chunks': {'M': {
+      'length': {'N': str(segments)},
+      'done': {'N': '0'},
+      'received': {'N': '0'},
+      'items': {'L': [{'M': {'labels': {'L': []}}}] * segments}
+    }},
+  }
@@ -0,0 +1,100 @@
+import json
+import boto3
+import os
+import logging
+
+from utils import chunk_tracking
+from utils import utils
+
+JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+lambda_client = boto3.client('lambda')
+sfn_client = boto3.client('stepfunctions')
+job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
+
+
+def handler(event, context):
+  """
+  Processes an ingested segment as soon as its upload is completed (streaming ingest).
+
+  The segment is processed as a single chunk by an asynchronous invocation of process_chunk,
+  so processing overlaps with the upload of the remaining segments.
+  The upload of the last segment starts the video-processing state-machine,
+  which waits for the processed segments and continues with the post-processing.
+  """
+
+  logger.info(f"Invoked with event: {event}")
+
+  for record in event["Records"]:
+    object = record["s3"]["object"]
+    if not utils.is_ingest_segment_key(object["key"]):
+      # e.g. processed chunks, which must not be processed again
+      logger.info(f"Ignore {object['key']}, it is not an ingested segment")
+      continue
+
+    job_id, index, ext = utils.parse_ingest_segment_key(object["key"])
+
+    chunk = {
+      'key': object['key'],
+      'jobId': job_id,
+      'extension': ext,
+      'size': object['size'],
+      'index': index,
+      'offset': None,
+      'duration': None
+    }
+
+    logger.info(f"Invoke chunk processing of segment {index} of job {job_id}")
+    lambda_client.invoke(
+      FunctionName=os.environ["PROCESS_CHUNK_FUNCTION_NAME"],
+      InvocationType='Event',
+      Payload=json.dumps({
+        'jobId': job_id,
+        'hasAudio': None,  # probed by the chunk worker
+        'keepAudio': True,
+        'chunks': [chunk],
+        'selfContinue': True  # there is no orchestration that schedules continuations of split segments
+      })
+    )
+
+    received = chunk_tracking.mark_segment_received(job_table, job_id, index)
+    segments = get_segment_count(job_id)
+    if received is not None and received == segments:
+      start_processing(job_id, ext, segments)
+
+  logger.info(f"Success")
+
+
+def start_processing(job_id: str, ext: str, segments: int):
+  exec_input = {
+    "jobId": job_id,
+    "streamed": True,
+    "extension": ext,
+    "chunkCount": segments
+  }
+
+  logger.info(f"All segments received, invoke video processing with input: \n{exec_input}")
+
+  sfn_client.start_execution(
+    stateMachineArn=os.environ["STATE_MACHINE_ARN"],
+    input=json.dumps(exec_input)
+  )
+
+
+def get_segment_count(job_id: str) -> int:
+  response = job_table.get_item(
+    Key={
+      'PK': f"JOB#{job_id}",
+      'SK': "DATA"
+    },
+    ProjectionExpression='ingest'
+  )
+
+  item = response.get('Item')
+  if item is None or 'ingest' not in item:
+    raise utils.InternalError(f"Job {job_id} has no ingest information")
+
+  return int(item['ingest']['segments'])
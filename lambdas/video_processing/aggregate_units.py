@@ -0,0 +1,63 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+import os
+
+import boto3
+
+from utils import manifest
+from utils import utils
+
+JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+s3_client = boto3.client('s3')
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+  """
+  Aggregates the results of the distributed chunk map.
+
+  The distributed map writes the outputs of its child executions with a ResultWriter instead of returning them.
+  This step checks that every work unit succeeded and joins the processed chunks of all units into a single
+  list next to the manifest, which is read by the post-processing steps (see manifest.load_processed_chunks).
+  """
+
+  logger.info(f"Invoked with event: {event}")
+
+  job_id = event['jobId']
+  writer_details = event['mapResults']['ResultWriterDetails']
+
+  result_manifest = get_json(writer_details['Bucket'], writer_details['Key'])
+  result_files = result_manifest['ResultFiles']
+  if result_files.get('FAILED'):
+    raise utils.InternalError(f"Work units of job {job_id} failed, see {result_files['FAILED']}")
+
+  with ThreadPoolExecutor(max_workers=16) as executor:
+    executions = [execution
+                  for results in executor.map(lambda f: get_json(writer_details['Bucket'], f['Key']),
+                                              result_files.get('SUCCEEDED', []))
+                  for execution in results]
+  result_keys = {json.loads(execution['Output'])['resultKey'] for execution in executions}
+
+  units = manifest.load_units(OBJ_BUCKET_NAME, job_id)
+  missing = [unit for unit in units if manifest.get_unit_result_key(job_id, unit['start']) not in result_keys]
+  if missing:
+    raise utils.InternalError(f"Missing results of {len(missing)} work units of job {job_id}")
+
+  processed_chunks = manifest.load_processed_chunks(OBJ_BUCKET_NAME, job_id)
+  processed_key = manifest.store_processed_chunks(OBJ_BUCKET_NAME, job_id, processed_chunks)
+  logger.info(f"Aggregated {len(processed_chunks)} processed chunks of {len(units)} units to {processed_key}.")
+
+  return {
+    'jobId': job_id,
+    'processedKey': processed_key
+  }
+
+
+def get_json(bucket_name: str, key: str) -> Any:
+  return json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read())
@@ -1,16 +1,24 @@
 import boto3
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
+from utils import config_utils
+from utils import constants
+from utils import utils
+
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
 OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# delete_objects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
 s3_client = boto3.client('s3')
-s3_bucket = boto3.resource('s3').Bucket(OBJ_BUCKET_NAME)
 job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
 
 
@@ -21,7 +29,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
   error, job_id = extract_data(event, context)
 
-  delete_chunks(job_id)
+  delete_chunks(job_id, get_audio_prefixes(job_id, error is None))
 
   return {
     'jobId': job_id,
@@ -29,17 +37,64 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
   }
 
 
-def delete_chunks(job_id):
-  objects = s3_bucket.objects.filter(Prefix=f"{job_id}/")
+def get_audio_prefixes(job_id: str, succeeded: bool) -> list[str]:
+  """
+  Returns the prefixes of the intermediate audio objects, the audio demuxed by preprocess (AUDIO.*)
+  and the processed audio track (AUDIO_TRACK.*). If the audio of a successful job is exported,
+  the audio track that was muxed into the result is part of the result and kept.
+  """
+  config = config_utils.get_job_config(job_table, job_id)
+  if succeeded and config.extract_audio:
+    # without audio processing, the demuxed audio is muxed as is (see process_audio)
+    return [f"{job_id}/AUDIO."] if config.processes_audio else [f"{job_id}/AUDIO_TRACK."]
+  return [f"{job_id}/AUDIO.", f"{job_id}/AUDIO_TRACK."]
+
+
+def delete_chunks(job_id, audio_prefixes: list[str] = ()):
+  """
+  Deletes all intermediate objects of the job
+  (chunks, ingested segments, processed chunks, reference images, the manifest and the given audio objects).
+  The exact prefixes are listed page by page, each page (up to 1000 keys) is deleted in a single batch.
+  """
+  prefixes = [f"{job_id}/CHUNKS/", f"{job_id}/INGEST/", f"{job_id}/PROCESSED/", f"{job_id}/REFIMGS/",
+              f"{job_id}/MANIFEST/", *audio_prefixes]
+  paginator = s3_client.get_paginator('list_objects_v2')
+
+  with ThreadPoolExecutor(max_workers=constants.MAX_DELETE_WORKERS) as executor:
+    futures = []
+    for prefix in prefixes:
+      for page in paginator.paginate(Bucket=OBJ_BUCKET_NAME, Prefix=prefix,
+                                     PaginationConfig={'PageSize': DELETE_BATCH_SIZE}):
+        keys = [o['Key'] for o in page.get('Contents', [])]
+        if keys:
+          futures.append(executor.submit(delete_batch, keys))
+
+    deleted = sum(future.result() for future in futures)
+
+  logger.info(f"Deleted {deleted} objects of job {job_id}.")
+
+
+def delete_batch(keys: list[str]) -> int:
+  """
+  Deletes a batch of at most 1000 keys. Keys that failed (e.g. due to throttling) are retried with backoff.
+
+  :return: number of deleted keys
+  """
+  remaining = keys
+  for attempt in range(constants.MAX_DELETE_ATTEMPTS):
+    response = s3_client.delete_objects(
+      Bucket=OBJ_BUCKET_NAME,
+      Delete={'Objects': [{'Key': key} for key in remaining], 'Quiet': True}
+    )
+    errors = response.get('Errors', [])
+    if not errors:
+      return len(keys)
 
-  objects_to_delete = [{'Key': o.key} for o in objects if
-                       o.key.lower().startswith(f"{job_id}/chunks".lower())
-                       or o.key.lower().startswith(f"{job_id}/processed".lower())
-                       or o.key.lower().startswith(f"{job_id}/refimgs".lower())
-                       ]
+    remaining = [error['Key'] for error in errors]
+    logger.info(f"Failed to delete {len(remaining)} objects ({errors[0].get('Code')}), retry...")
+    time.sleep(min(10.0, 0.2 * 2 ** attempt))
 
-  if len(objects_to_delete):
-    s3_client.delete_objects(Bucket=OBJ_BUCKET_NAME, Delete={'Objects': objects_to_delete})
+  raise utils.InternalError(f"Failed to delete {len(remaining)} objects, e.g. {remaining[0]}")
 
 
 def extract_data(event, context):
@@ -1,25 +1,263 @@
+import json
 import logging
-from typing import Dict, Any
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Callable, Dict, Any
 import os
 
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from utils import constants
+from utils import manifest
+from utils import utils
+from utils.fake_rekognition import FakeRekognitionClient
+from utils.rate_limit import TokenBucket
+
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
+REKOGNITION_TPS = float(os.environ.get("REKOGNITION_TPS", constants.REKOGNITION_TPS))
+
+THROTTLING_ERRORS = ('ThrottlingException', 'ProvisionedThroughputExceededException', 'LimitExceededException')
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
+
+
+def create_rekognition_client():
+  # LABEL_PROVIDER=fake allows running the label detection locally without rekognition
+  if os.environ.get("LABEL_PROVIDER") == "fake":
+    return FakeRekognitionClient()
+  # retries are handled by detect_labels, so throttling adapts the rate of the token bucket
+  return boto3.client('rekognition', config=Config(retries={'max_attempts': 1, 'mode': 'standard'}))
+
+
+rekognition_client = create_rekognition_client()
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
   """
-  Extracts the content-labels of a video chunk using image recognition.
-  One image (the keyframe) of the chunk is being evaluated using amazon recognition.
-  The labels are then being stored in dynamo-db.
+  Extracts the content-labels of the video chunks using image recognition.
+  The reference image of each chunk (of the best scored part, if the chunk was split) is evaluated
+  using amazon rekognition. Requests are sent concurrently, but rate limited to the rekognition TPS quota.
+
+  The labels are written to the chunk items of the job entry batch by batch,
+  finally a label -> time range index of the whole video is stored in the job entry.
+
+  :return: the THUMBNAIL_CANDIDATES chunks with the best scored reference images
+           (chunk index, reference image, its score and labels)
   """
 
   logger.info(f"Invoked with event: {event}")
 
-  # TODO: implement job
+  job_id = event['jobId']
+  processed_chunks = manifest.load_processed_chunks(OBJ_BUCKET_NAME, job_id)
+  best_parts = select_best_parts(processed_chunks)
+  indices = [processed_chunks[i]['index'] for i in best_parts]
+  refimg_keys = [processed_chunks[i]['refimg_key'] for i in best_parts]
+
+  def store_batch(start: int, batch_labels: list[dict[str, Any]]):
+    store_chunk_labels(job_id, indices[start:start + len(batch_labels)], batch_labels)
+
+  labels = detect_all_labels(rekognition_client, refimg_keys, TokenBucket(REKOGNITION_TPS), store_batch)
+
+  label_index = build_label_index(get_chunk_times(job_id, processed_chunks), dict(zip(indices, labels)))
+  store_label_index(job_id, label_index)
 
   logger.info(f"Success")
 
-  # TODO: output should be input, being the url to the s3 resource
-  return {}
+  candidates = sorted(range(len(best_parts)),
+                      key=lambda i: processed_chunks[best_parts[i]].get('refimg_score', 0),
+                      reverse=True)[:constants.THUMBNAIL_CANDIDATES]
+  return [{
+    'index': indices[i],
+    'refimg_key': refimg_keys[i],
+    'refimg_score': processed_chunks[best_parts[i]].get('refimg_score', 0),
+    'Labels': labels[i]['Labels']
+  } for i in sorted(candidates)]
+
+
+def select_best_parts(processed_chunks: list[dict[str, Any]]) -> list[int]:
+  """
+  Returns the position (within processed_chunks) of a single processed chunk per chunk index, ordered by index.
+  Chunks that were split have a processed chunk per part, the part with the best scored reference image is selected.
+  """
+  best = {}
+  for i, chunk in enumerate(processed_chunks):
+    current = best.get(chunk['index'])
+    if current is None or chunk.get('refimg_score', 0) > processed_chunks[current].get('refimg_score', 0):
+      best[chunk['index']] = i
+  return [best[index] for index in sorted(best)]
+
+
+def get_chunk_times(job_id: str, processed_chunks: list[dict[str, Any]]) -> dict[int, tuple[float, float]]:
+  """
+  Returns the time range ([start, end] in seconds) of each chunk index.
+  The ranges are taken from the offsets and durations of the chunk manifest. Ingested segments have no manifest
+  (their offsets are not known up front), their ranges are accumulated from the durations of the processed chunks.
+  """
+  try:
+    chunk_manifest = manifest.load_manifest(OBJ_BUCKET_NAME, manifest.get_manifest_key(job_id))
+  except manifest.s3_client.exceptions.NoSuchKey:
+    chunk_manifest = None
+
+  if chunk_manifest is not None:
+    offsets, durations = chunk_manifest.data['offsets'], chunk_manifest.data['durations']
+    return {i: (round(offset, 3), round(offset + duration, 3))
+            for i, (offset, duration) in enumerate(zip(offsets, durations))}
+
+  times = {}
+  start = 0.0
+  for chunk in processed_chunks:
+    end = start + ((chunk.get('metadata') or {}).get('duration') or 0.0)
+    # the parts of a split chunk extend the range of the chunk
+    chunk_start = times[chunk['index']][0] if chunk['index'] in times else round(start, 3)
+    times[chunk['index']] = (chunk_start, round(end, 3))
+    start = end
+  return times
+
+
+def detect_all_labels(client, keys: list[str], bucket: TokenBucket,
+                      on_batch: Callable[[int, list[dict[str, Any]]], None] | None = None) -> list[dict[str, Any]]:
+  """
+  Detects the labels of all images concurrently.
+  The responses are collected in batches of LABEL_BATCH_SIZE images (in the order of the keys),
+  each complete batch is passed to on_batch, while the requests of the following batches continue.
+
+  :param client: rekognition client
+  :param keys: keys of the images in the object bucket
+  :param bucket: token bucket that limits the request rate
+  :param on_batch: called with the position of the first image and the responses of each batch
+  :return: DetectLabels responses ({'Labels': [...]}) in the order of the keys
+  """
+  if not keys:
+    return []
+
+  max_workers = min(len(keys), constants.MAX_LABEL_WORKERS)
+  logger.info(f"Detect labels of {len(keys)} images with {max_workers} workers at {bucket.rate} TPS...")
+
+  results = []
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = [executor.submit(detect_labels, client, key, bucket) for key in keys]
+    try:
+      for start in range(0, len(keys), constants.LABEL_BATCH_SIZE):
+        batch = [future.result() for future in futures[start:start + constants.LABEL_BATCH_SIZE]]
+        if on_batch:
+          on_batch(start, batch)
+        results.extend(batch)
+        logger.info(f"Labels of {len(results)}/{len(keys)} images detected.")
+    except BaseException:
+      executor.shutdown(cancel_futures=True)
+      raise
+
+  return results
+
+
+def detect_labels(client, key: str, bucket: TokenBucket) -> dict[str, Any]:
+  """
+  Detects the labels of a single image and retries with exponential backoff if rekognition throttles.
+  """
+  for attempt in range(constants.MAX_LABEL_ATTEMPTS):
+    bucket.acquire()
+    try:
+      response = client.detect_labels(
+        Image={
+          'S3Object': {
+            'Bucket': OBJ_BUCKET_NAME,
+            'Name': key
+          }
+        },
+        MaxLabels=10,
+        MinConfidence=90,
+        Features=['GENERAL_LABELS'],
+        Settings={
+          'GeneralLabels': {
+            'LabelCategoryInclusionFilters': ['Person Description']
+          }
+        }
+      )
+    except ClientError as e:
+      if e.response['Error']['Code'] not in THROTTLING_ERRORS:
+        raise
+      bucket.throttle()
+      backoff = min(10.0, 0.2 * 2 ** attempt) * random.uniform(0.5, 1.0)
+      logger.info(f"DetectLabels of {key} throttled, retry in {backoff:.2f} s (rate {bucket.rate:.2f} TPS).")
+      time.sleep(backoff)
+      continue
+
+    bucket.recover()
+    return {'Labels': response['Labels']}
+
+  raise utils.InternalError(f"DetectLabels of {key} was throttled {constants.MAX_LABEL_ATTEMPTS} times")
+
+
+def build_label_index(chunk_times: dict[int, tuple[float, float]],
+                      chunk_labels: dict[int, dict[str, Any]]) -> dict[str, list]:
+  """
+  Builds a compact index that maps each label to the time ranges ([start, end] in seconds) of the chunks
+  it was detected in. Ranges of consecutive chunks are joined.
+
+  :param chunk_times: time range of each chunk index
+  :param chunk_labels: DetectLabels response of each chunk index
+  """
+  index = {}
+  for chunk_index in sorted(chunk_labels):
+    start, end = chunk_times[chunk_index]
+    for name in {label['Name'] for label in chunk_labels[chunk_index]['Labels']}:
+      ranges = index.setdefault(name, [])
+      if ranges and ranges[-1][1] == start:
+        ranges[-1][1] = end
+      else:
+        ranges.append([start, end])
+
+  return index
+
+
+def store_chunk_labels(job_id: str, indices: list[int], labels: list[dict[str, Any]]):
+  """
+  Writes the labels of a batch of chunks with a single update of the job entry.
+  """
+  update_expression = []
+  values = {}
+  for index, chunk_labels in zip(indices, labels):
+    update_expression.append(f"chunks.#items[{index}].#labels = :l{index}")
+    values[f":l{index}"] = [{'name': label['Name'], 'confidence': Decimal(str(round(label['Confidence'], 2)))}
+                            for label in chunk_labels['Labels']]
+
+  job_table.update_item(
+    Key={
+      'PK': f"JOB#{job_id}",
+      'SK': "DATA"
+    },
+    UpdateExpression='SET ' + ', '.join(update_expression),
+    ExpressionAttributeNames={
+      '#items': 'items',
+      '#labels': 'labels'
+    },
+    ExpressionAttributeValues=values
+  )
+
+
+def store_label_index(job_id: str, label_index: dict[str, list]):
+  """
+  Writes the label index and the names of all detected labels to the job entry.
+  """
+  job_table.update_item(
+    Key={
+      'PK': f"JOB#{job_id}",
+      'SK': "DATA"
+    },
+    UpdateExpression='SET labelIndex = :index, #labels = :labels',
+    ExpressionAttributeNames={
+      '#labels': 'labels'
+    },
+    ExpressionAttributeValues={
+      ':index': json.loads(json.dumps(label_index), parse_float=Decimal),
+      ':labels': ",".join(sorted(label_index.keys())),
+    }
+  )
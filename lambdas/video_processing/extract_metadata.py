@@ -1,22 +1,62 @@
+import json
 import logging
+from decimal import Decimal
 from typing import Dict, Any
 import os
 
+import boto3
+
+from utils import manifest
+from utils import metadata_utils
+
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+s3_client = boto3.client('s3')
+job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
   """
-  Extracts the meta-data from the original video.
+  Extracts the meta-data of the video.
+  The chunk workers already gather the metadata of their chunks within the processing pass,
+  so this step only merges them (fan-in) without decoding the original video again.
+  The full metadata is stored as METADATA.json, a summary of bounded size in the job entry.
   """
 
   logger.info(f"Invoked with event: {event}")
 
-  # TODO: implement job
+  job_id = event['jobId']
+  chunk_metadata = [c['metadata'] for c in manifest.load_processed_chunks(OBJ_BUCKET_NAME, job_id)]
+
+  metadata = metadata_utils.merge_chunk_metadata(chunk_metadata)
+
+  metadata_key = f"{job_id}/METADATA.json"
+  logger.info(f"Upload metadata to {metadata_key}...")
+  s3_client.put_object(Bucket=OBJ_BUCKET_NAME, Key=metadata_key, Body=json.dumps(metadata).encode('utf-8'))
+
+  store_metadata(job_id, metadata_utils.summarize_metadata(metadata))
 
   logger.info(f"Success")
 
-  return {}
+  return {
+    'jobId': job_id,
+    'key': metadata_key
+  }
+
+
+def store_metadata(job_id, metadata):
+  job_table.update_item(
+    Key={
+      'PK': f"JOB#{job_id}",
+      'SK': "DATA"
+    },
+    UpdateExpression='SET metadata = :val',
+    ExpressionAttributeValues={
+      # dynamodb does not support floats
+      ':val': json.loads(json.dumps(metadata), parse_float=Decimal)
+    }
+  )
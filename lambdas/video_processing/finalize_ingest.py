@@ -0,0 +1,58 @@
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any
+import os
+
+import boto3
+
+from utils import chunk_tracking
+from utils import constants
+from utils import manifest
+from utils import utils
+
+JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+  """
+  Waits for the processing of the ingested segments (streaming ingest).
+
+  The segments are processed by chunk workers while they are uploaded (see trigger_segment_processing),
+  the state machine invokes this step repeatedly (polling) until all of them are done (see chunk_tracking).
+  Then each segment is registered as work unit of a single chunk and the processed chunks are joined
+  into a single list, which is read by the post-processing steps (see manifest.load_processed_chunks).
+
+  :return: the polling state, `complete` is set once all segments are processed
+  """
+
+  logger.info(f"Invoked with event: {event}")
+
+  job_id = event['jobId']
+  done, length, _ = chunk_tracking.get_chunk_status(job_table, job_id)
+
+  if done < length:
+    waiting_secs = (datetime.now(timezone.utc) - datetime.fromisoformat(event['startTime'])).total_seconds()
+    if waiting_secs > constants.INGEST_TIMEOUT_SECS:
+      raise utils.InternalError(f"Only {done}/{length} segments of job {job_id} were processed "
+                                f"within {constants.INGEST_TIMEOUT_SECS} s")
+    logger.info(f"Processed {done}/{length} segments, wait for more segments.")
+    return {**event, 'complete': False}
+
+  manifest.write_units(OBJ_BUCKET_NAME, job_id, [{'start': i, 'end': i + 1} for i in range(length)])
+  processed_chunks = manifest.load_processed_chunks(OBJ_BUCKET_NAME, job_id)
+  processed_key = manifest.store_processed_chunks(OBJ_BUCKET_NAME, job_id, processed_chunks)
+  logger.info(f"Aggregated {len(processed_chunks)} processed segments to {processed_key}.")
+
+  # the segments keep their audio, so there is no separate audio track
+  return {
+    'jobId': job_id,
+    'complete': True,
+    'processedKey': processed_key,
+    'audioTrack': None
+  }
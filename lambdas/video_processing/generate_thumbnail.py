@@ -20,24 +20,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
   logger.info(f"Invoked with event: {event}")
 
-  label_results = event['labeledChunks']
-  processed_chunks = event['processedChunks']
+  # only the best scored reference images were evaluated, see extract_labels
+  candidates = event['labeledChunks']
   job_id = event['jobId']
 
-  max_len = float('-inf')
-  max_ind = 0
-
   logger.info("Search for best thumbnail ...")
-  # Iterate through the data
-  for ind, item in enumerate(label_results):
-    # Check if the length of labels array is greater than max_len
-    if len(item['Labels']) > max_len:
-      max_len = len(item['Labels'])
-      max_ind = ind
+  # The chunk with most related labels wins, the local quality score of the reference image breaks ties
+  best = max(candidates, key=lambda candidate: (len(candidate['Labels']), candidate['refimg_score']))
 
-  logger.info(f"Found chunk {max_ind} with {max_len} related labels!")
+  logger.info(f"Found chunk {best['index']} with {len(best['Labels'])} related labels!")
 
-  refimg = processed_chunks[max_ind]['refimg_key']
+  refimg = best['refimg_key']
   img_extension = os.path.basename(refimg).rsplit(".")[1]
   thumbnail = f"{job_id}/THUMBNAIL.{img_extension}"
 
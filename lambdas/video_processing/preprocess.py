@@ -1,16 +1,25 @@
 import boto3
 import logging
+import math
 import multiprocessing
 import os
-import subprocess
 import time
 from concurrent.futures import ThreadPoolExecutor
+from utils import audio_utils
+from utils import config_utils
+from utils import manifest
+from utils import probe_utils
 from utils import constants
-from utils import utils
+from utils import ffmpeg_runner
+from utils import progress
+from utils import s3_utils
 from utils.job_status import JobStatus
 
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
 OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
+CONCURRENCY_QUOTA = int(os.environ.get("CHUNK_CONCURRENCY_QUOTA", constants.DEFAULT_CONCURRENCY_QUOTA))
+
+SEGMENT_LIST_PATH = "/tmp/segments.csv"
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -25,12 +34,20 @@ def handler(event, context):
   Handles the preprocessing of videos.
 
   Performs trimming and chunk splitting of the video.
+  Within the same demux pass, the audio is streamed to s3 and, if loudness normalisation
+  is configured, measured for the first loudnorm pass.
   """
   logger.info(f"Invoked with event: {event}")
 
   job_id, orig_video_key, extension = extract_data(event, context)
 
   update_status_in_db(job_id)
+  config = config_utils.get_job_config(job_table, job_id)
+  # the source was probed by job_probe, its stream information is cached in the job item
+  video_info = probe_utils.get_job_probe(job_table, job_id)
+  has_audio = len(video_info['audioStreams']) > 0
+  acodec = video_info['audioStreams'][0]['codec'] if has_audio else None
+  duration = float(video_info['duration']) if video_info.get('duration') is not None else None
 
   # delete local storage
   os.system("rm -rf /tmp/*")
@@ -51,38 +68,128 @@ def handler(event, context):
   command = [
     'ffmpeg',
     '-i', video_url,
+    '-map', '0:v:0',
+    '-map', '0:a:0?',
     '-c', 'copy',
     '-f', 'segment',
     '-segment_time', str(constants.TARGET_CHUNK_SECS),
     '-reset_timestamps', '1',
+    '-segment_list', SEGMENT_LIST_PATH, '-segment_list_type', 'csv',  # start and end time of each chunk
     chunk_output_format
   ]
-  ffmpeg_process = subprocess.Popen(command)
 
-  logger.info(f"Start watch and upload...")
+  audio_key = None
+  if has_audio:
+    # further outputs of the same demux pass
+    audio_key = audio_utils.get_audio_key(job_id, acodec)
+    command += audio_utils.get_audio_output_args(acodec)
+    logger.info(f"Extract audio to {audio_key}")
+    if config.loudnorm:
+      command += audio_utils.get_loudnorm_analysis_args(config.loudnorm)
+
+  with ThreadPoolExecutor(max_workers=1) as ffmpeg_executor:
+    # the audio is streamed through stdout, if its upload fails ffmpeg is killed by the runner
+    ffmpeg_future = ffmpeg_executor.submit(ffmpeg_runner.run_sync, command, capture_stdout=False,
+                                           on_stdout=(lambda s: _upload_audio(s, audio_key)) if audio_key else None)
+
+    logger.info(f"Start watch and upload...")
 
-  chunks = watch_and_upload("/tmp/chunks", ffmpeg_process, chunk_file_format, job_id)
+    reporter = progress.ProgressReporter(job_table, job_id, 'preprocess')
+    chunks = watch_and_upload("/tmp/chunks", ffmpeg_future, chunk_file_format, job_id,
+                              lambda emitted: reporter.update(chunksEmitted=emitted, duration=duration))
 
-  logger.info("All chunks uploaded.")
+    logger.info("All chunks uploaded.")
 
-  ffmpeg_process.wait()
+    log = ffmpeg_future.result().log
+  logger.info(log)
 
-  if ffmpeg_process.returncode is not 0:
-    raise utils.FFmpegError(f"FFMPEG returned with exitcode {ffmpeg_process.returncode}")
+  audio = None
+  if audio_key:
+    audio = {
+      'key': audio_key,
+      'acodec': acodec,
+      'loudnormStats': audio_utils.parse_loudnorm_stats(log) if config.loudnorm else None
+    }
 
-  chunks = [{"key": obj_key, "jobId": job_id, "extension": extension, "size": size} for obj_key, size in chunks]
+  segment_times = read_segment_list(SEGMENT_LIST_PATH)
+  chunks = [{"key": obj_key, "size": size, "offset": segment_times[i][0], "duration": segment_times[i][1]}
+            for i, (obj_key, size) in enumerate(chunks)]
 
   save_chunks_to_db(len(chunks), job_id)
+  reporter.done(chunksEmitted=len(chunks), chunkCount=len(chunks), duration=duration)
+
+  work_units = group_chunks(chunks, CONCURRENCY_QUOTA)
+  logger.info(f"Grouped {len(chunks)} chunks into {len(work_units)} work units.")
+
+  # the chunks are passed by reference, so the state payload does not grow with the number of chunks
+  manifest_key = manifest.write_manifest(OBJ_BUCKET_NAME, job_id, extension, chunks, work_units)
 
   # delete local storage
   os.system("rm -rf /tmp/*")
 
   return {
     'jobId': job_id,
-    'chunks': chunks
+    'chunkCount': len(chunks),
+    'hasAudio': has_audio,
+    'manifestKey': manifest_key,
+    'unitsKey': manifest.get_units_key(job_id),
+    'workUnits': work_units,
+    'audio': audio
   }
 
 
+def group_chunks(chunks, concurrency_quota):
+  """
+  Groups consecutive chunks into work units that are processed by a single process_chunk invocation.
+
+  A unit is closed as soon as it holds TARGET_UNIT_BYTES or MAX_CHUNKS_PER_UNIT chunks.
+  However, each unit holds at least as many chunks as required to stay within the concurrency quota,
+  so all units can be processed at once.
+
+  :param chunks: ordered list of chunks
+  :param concurrency_quota: maximal number of concurrent process_chunk invocations
+  :return: ordered list of work units, as ranges of chunk indices ({'start', 'end'})
+  """
+  min_unit_len = max(1, math.ceil(len(chunks) / max(1, concurrency_quota)))
+
+  units = []
+  start = 0
+  current_size = 0
+  for i, chunk in enumerate(chunks):
+    current_size += chunk['size']
+    unit_len = i + 1 - start
+
+    unit_full = current_size >= constants.TARGET_UNIT_BYTES or unit_len >= constants.MAX_CHUNKS_PER_UNIT
+    if unit_len >= min_unit_len and unit_full:
+      units.append({'start': start, 'end': i + 1})
+      start = i + 1
+      current_size = 0
+
+  if start < len(chunks):
+    units.append({'start': start, 'end': len(chunks)})
+
+  return units
+
+
+def read_segment_list(path) -> list[tuple[float, float]]:
+  """
+  Reads the csv segment list of the segment muxer (name,start,end per line).
+
+  :return: start time and duration of each chunk
+  """
+  times = []
+  with open(path, 'r') as f:
+    for line in f:
+      _, start, end = line.strip().rsplit(',', 2)
+      times.append((round(float(start), 6), round(float(end) - float(start), 6)))
+  return times
+
+
+def _upload_audio(stream, audio_key):
+  s3_utils.multipart_upload(stream, OBJ_BUCKET_NAME, audio_key)
+  logger.info("Audio uploaded.")
+
+
 def upload_to_s3(file_path, object_name):
   try:
     logger.info(f"Start upload {file_path}...")
@@ -96,13 +203,14 @@ def upload_to_s3(file_path, object_name):
     raise e
 
 
-def watch_and_upload(directory, ffmpeg_process, file_pattern, job_id):
+def watch_and_upload(directory, ffmpeg_future, file_pattern, job_id, on_chunk=None):
   """
   Watches for new chunks in directory and uploads them as soon as possible
 
   :param directory: chunks output directory
-  :param ffmpeg_process: async process of ffmpeg
+  :param ffmpeg_future: future of the ffmpeg process (see ffmpeg_runner.run_sync), done once ffmpeg exited
   :param file_pattern: chunk file pattern
+  :param on_chunk: called with the number of emitted chunks whenever a chunk is complete
   :return: array of chunks (key, size)
   """
   i = 0
@@ -111,7 +219,7 @@ def watch_and_upload(directory, ffmpeg_process, file_pattern, job_id):
 
   with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count() * 5) as executor:
     while True:
-      process_done = ffmpeg_process.poll() is not None
+      process_done = ffmpeg_future.done()
       current_file = os.path.join(directory, file_pattern % i)
       next_file = os.path.join(directory, file_pattern % (i + 1))
 
@@ -121,6 +229,8 @@ def watch_and_upload(directory, ffmpeg_process, file_pattern, job_id):
           future = executor.submit(upload_to_s3, current_file, f"{job_id}/CHUNKS/{os.path.basename(current_file)}")
           futures.append(future)
           i += 1
+          if on_chunk:
+            on_chunk(i)
         else:
           # file is not yet complete
           logger.info(f"Sleep inner because of {current_file}")
@@ -132,13 +242,10 @@ def watch_and_upload(directory, ffmpeg_process, file_pattern, job_id):
         logger.info(f"Sleep outer because of {current_file}")
         time.sleep(0.25)
 
-    # Wait for all uploads to complete
+    # Wait for all uploads to complete. A failed upload fails the job,
+    # as a missing chunk would misalign the chunks with their times in the segment list
     for future in futures:
-      try:
-        result = future.result()
-        chunks.append(result)
-      except Exception as e:
-        logger.error(f"Error in uploading file {futures[future]}: {e}")
+      chunks.append(future.result())
 
   return chunks
 
@@ -169,7 +276,8 @@ def save_chunks_to_db(chunks_len, job_id):
     },
     UpdateExpression='SET chunks = :val',
     ExpressionAttributeValues={
-      ':val': {'length': chunks_len, 'items': [{'labels': []}] * chunks_len}
+      # done (and the doneSet of processed indices) is counted by the chunk workers, see chunk_tracking
+      ':val': {'length': chunks_len, 'done': 0, 'items': [{'labels': []}] * chunks_len}
     },
     ReturnValues="UPDATED_NEW"
   )
@@ -0,0 +1,75 @@
+import logging
+from typing import Dict, Any
+import os
+import boto3
+
+from utils import audio_utils
+from utils import config_utils
+from utils import ffmpeg_runner
+from utils import s3_utils
+from utils import utils
+
+JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+s3_client = boto3.client('s3')
+job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+  """
+  Processes the audio of the video once, while the video chunks are processed.
+  Changes the codec and applies the second loudnorm pass (with the stats measured by preprocess) if configured.
+  The resulting audio track is muxed into the video by reduce_chunks.
+  """
+
+  logger.info(f"Invoked with event: {event}")
+
+  job_id = event['jobId']
+  audio = event.get('audio')
+
+  if audio is None:
+    logger.info("Video has no audio.")
+    return {'audioTrack': None}
+
+  config = config_utils.get_job_config(job_table, job_id)
+
+  if not config.processes_audio:
+    logger.info("No audio processing configured, the extracted audio is muxed as is.")
+    return {'audioTrack': {'key': audio['key'], 'acodec': audio['acodec']}}
+
+  acodec = config.audio_codec or audio['acodec']
+  encoder = audio_utils.AUDIO_ENCODERS.get(acodec)
+  if encoder is None:
+    # the source codec can not be encoded, fall back to aac
+    acodec, encoder = 'aac', audio_utils.AUDIO_ENCODERS['aac']
+
+  audio_url = s3_client.generate_presigned_url('get_object',
+                                               Params={
+                                                 'Bucket': OBJ_BUCKET_NAME,
+                                                 'Key': audio['key'],
+                                               },
+                                               ExpiresIn=3600)
+  result_key = audio_utils.get_audio_track_key(job_id, acodec)
+
+  command = ['ffmpeg', '-v', 'error', '-i', audio_url, '-vn']
+  if config.loudnorm:
+    stats = audio.get('loudnormStats')
+    if stats is None:
+      raise utils.FFmpegError("Missing loudnorm stats of the first pass")
+    command += ['-af', audio_utils.get_loudnorm_filter(config.loudnorm, stats)]
+  command += ['-c:a', encoder, '-f', audio_utils.get_audio_format(acodec)[0], 'pipe:1']
+
+  def upload_track(stream):
+    s3_utils.multipart_upload(stream, OBJ_BUCKET_NAME, result_key)
+
+  logger.info(f"Start audio processing with command: \n{command}")
+  # raises utils.FFmpegError if ffmpeg fails, ffmpeg is killed if the upload fails
+  ffmpeg_runner.run_sync(command, on_stdout=upload_track)
+
+  logger.info(f"Success")
+
+  return {'audioTrack': {'key': result_key, 'acodec': acodec}}
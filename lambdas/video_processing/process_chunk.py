@@ -1,14 +1,24 @@
+import json
 import logging
-import subprocess
-import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 import boto3
 import os
-import ffmpeg
 
+from utils import chunk_tracking
+from utils import constants
 from utils import utils
 from utils import config_utils
+from utils import ffmpeg_runner
+from utils import filter_graph
+from utils import frame_scoring
+from utils import manifest
+from utils import metadata_utils
+from utils import probe_utils
+from utils import progress
+from utils import warm_container
 
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
 OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
@@ -17,22 +27,107 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 dynamodb = boto3.resource('dynamodb')
 job_table = dynamodb.Table(JOB_TABLE_NAME)
 
 
+@warm_container.instrumented
 def handler(event, context):
   """
-  Processes a video chunk.
+  Processes a work unit of consecutive video chunks.
+
+  The chunks of the unit are read from the chunk manifest and processed concurrently
+  (up to the number of available vCPUs). The results are stored in the order of the input chunks
+  next to the manifest, only a reference is returned.
+
+  Ingested segments are passed directly as `chunks` (see trigger_segment_processing). As the whole video
+  is not known yet, they keep their audio (`keepAudio`) and are probed for an audio stream if `hasAudio` is unknown.
+
+  Chunks that do not finish before the lambda times out are split: the processed prefix is kept and the rest
+  is returned as `continuation`, an event of this handler with the remaining chunks (`chunks`, `unitStart`).
+  The orchestration invokes the handler again with the continuation, which adds its results to the unit result.
   """
 
-  os.system("rm /tmp/*")
+  warm_container.reset_tmp_dirs()
 
-  job_id, object_key, size, extension = extract_data(event, context)
+  job_id, has_audio, keep_audio, chunks = extract_data(event, context)
+  deadline = ffmpeg_runner.deadline_from_context(context)
+  start = event.get('unitStart', chunks[0]['index'])
 
-  basename = os.path.basename(object_key)
-  local_out_path = f"/tmp/out-{basename}"
-  logger.info(f"Processing {object_key}")
+  config = config_utils.get_job_config(job_table, job_id)
+  logger.info(f"Loading config {config}")
+
+  reporter = progress.ProgressReporter(job_table, job_id, 'process')
+
+  max_workers = min(len(chunks), os.cpu_count() or 1)
+  logger.info(f"Processing {len(chunks)} chunks with {max_workers} workers...")
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    results = list(executor.map(lambda chunk: handle_chunk(chunk, has_audio, keep_audio, config, reporter, deadline),
+                                chunks))
+  processed_chunks = [processed for processed, _ in results if processed is not None]
+  remaining_chunks = [remaining for _, remaining in results if remaining is not None]
+
+  if remaining_chunks and not processed_chunks:
+    raise utils.InternalError(f"No chunk of the unit {start} of job {job_id} could be processed before the deadline")
+
+  # only the unit that completes the last chunk of the job finishes the stage, the others are coalesced
+  chunks_done, chunk_count, _ = chunk_tracking.get_chunk_status(job_table, job_id)
+  reporter.done(last=not remaining_chunks and chunks_done >= chunk_count,
+                chunks={get_part_name(c): {'outTime': (c['metadata'] or {}).get('duration'), 'done': True}
+                        for c in processed_chunks})
+
+  if 'unitStart' in event:
+    # continuation of the unit, the previous invocations already stored the results of the processed parts
+    processed_chunks = manifest.load_unit_result(OBJ_BUCKET_NAME, job_id, start) + processed_chunks
+    processed_chunks.sort(key=lambda c: (c['index'], c.get('part', 0)))
+
+  result_key = manifest.store_unit_result(OBJ_BUCKET_NAME, job_id, start, processed_chunks)
+
+  warm_container.reset_tmp_dirs()
+
+  response = {
+    'jobId': job_id,
+    'resultKey': result_key
+  }
+  if remaining_chunks:
+    logger.info(f"Continue {len(remaining_chunks)} chunks in the next invocation.")
+    response['continuation'] = {
+      'jobId': job_id,
+      'hasAudio': has_audio,
+      'keepAudio': keep_audio,
+      'unitStart': start,
+      'chunks': remaining_chunks
+    }
+    if event.get('selfContinue'):
+      continue_async(context, {**response['continuation'], 'selfContinue': True})
+  return response
+
+
+def handle_chunk(chunk, has_audio: bool | None, keep_audio: bool, config: config_utils.Config,
+                 reporter: progress.ProgressReporter, deadline: float | None = None):
+  """
+  Processes a single chunk of a work unit and uploads the result and its reference image.
+  The technical metadata of the chunk is gathered within the same ffmpeg pass,
+  the progress of ffmpeg is reported to the websocket clients.
+
+  If ffmpeg does not finish before the deadline, it is stopped gracefully (see ffmpeg_runner). Its outputs
+  then contain the prefix up to the stop time, which is kept as a part of the chunk. The remaining part
+  of the chunk is processed by a continuation, which seeks to the stop time (`seek`).
+  Parts after the first one are stored with a part suffix (see utils.get_processed_chunk_key).
+
+  :return: the processed (part of the) chunk and the remaining part of the chunk, each may be None
+  """
+  job_id, object_key = chunk['jobId'], chunk['key']
+  part, seek = chunk.get('part', 0), chunk.get('seek', 0.0)
+
+  if deadline is not None and time.monotonic() >= deadline:
+    logger.info(f"Deadline reached before {object_key} was started, continue it in the next invocation.")
+    return None, chunk
+
+  part_name = get_part_name(chunk)
+  local_out_path = f"/tmp/out/{part_name}.{chunk['extension']}"
+  logger.info(f"Processing {object_key} (part {part}, from {seek:.2f} s)")
 
   chunk_url = s3_client.generate_presigned_url('get_object',
                                                Params={
@@ -41,125 +136,150 @@ def handler(event, context):
                                                },
                                                ExpiresIn=3600)
 
-  config = config_utils.get_job_config(job_table, job_id)
-  logger.info(f"Loading config {config}")
-  ffmpeg_command, outpath, format = build_command(chunk_url, local_out_path, config)
+  candidate_prefix = f"/tmp/refimgs/{part_name}"
+
+  if has_audio is None:
+    has_audio = probe_utils.has_audio_stream(chunk_url)
+
+  ffmpeg_command, outpath, format = build_command(chunk_url, local_out_path, candidate_prefix, has_audio, config,
+                                                  keep_audio, seek)
   logger.info(f"Executing command: \n{ffmpeg_command}")
 
   logger.info(f"Start chunk processing...")
-  process_chunk(ffmpeg_command)
+  def report(block: dict[str, str]):
+    reporter.update(chunks={part_name: {'outTime': progress.get_progress_seconds(block),
+                                        'fps': block.get('fps'),
+                                        'speed': block.get('speed')}})
 
-  key_base_name = os.path.basename(object_key)
-  key_base_name_no_format = key_base_name.rsplit('.')[0]
-  result_key = f"{job_id}/PROCESSED/{key_base_name_no_format}.{format}"
+  remaining = None
+  try:
+    result = ffmpeg_runner.run_sync(ffmpeg_command, on_progress=report, deadline=deadline)
+  except ffmpeg_runner.FFmpegDeadlineError as e:
+    result = e.result
+    if result.out_time < constants.MIN_SPLIT_SECS:
+      logger.info(f"Only {result.out_time:.2f} s of {object_key} were processed, continue the whole part.")
+      return None, chunk
+    remaining = {**chunk, 'part': part + 1, 'seek': round(seek + result.out_time, 6)}
+    logger.info(f"Split {object_key} at {remaining['seek']:.2f} s, continue the rest in the next invocation.")
+  raw_candidates, analysis_log = result.stdout, result.log
+  logger.debug(analysis_log)
+
+  result_key = utils.get_processed_chunk_key(job_id, object_key, format, part)
 
   # create reference image for chunk
-  refimg_key = f"{job_id}/REFIMGS/{key_base_name_no_format}.jpg"
-  refimg_thread = threading.Thread(target=process_ref_image, args=(outpath, refimg_key))
-  refimg_thread.start()
-
-  logger.info(f"\nReplace {OBJ_BUCKET_NAME}/{object_key} by result...")
-  s3_client.upload_file(outpath, OBJ_BUCKET_NAME, result_key)
-  logger.info("Done.")
+  refimg_key = f"{job_id}/REFIMGS/{part_name}.jpg"
+  with ThreadPoolExecutor(max_workers=1) as refimg_executor:
+    refimg_future = refimg_executor.submit(process_ref_image, candidate_prefix, raw_candidates, refimg_key,
+                                           remaining is not None)
 
-  refimg_thread.join()
-  logger.info("RefImage terminated.")
+    logger.info(f"\nReplace {OBJ_BUCKET_NAME}/{object_key} by result...")
+    s3_client.upload_file(outpath, OBJ_BUCKET_NAME, result_key)
+    logger.info("Done.")
 
-  os.system("rm /tmp/*")
+    metadata = probe_utils.probe_chunk(outpath)
+    metadata.update(metadata_utils.parse_analysis_log(analysis_log, metadata['duration'] or 0.0))
 
-  event['key'] = result_key
-  event['refimg_key'] = refimg_key
-  return event
+    candidates = refimg_future.result()
+    logger.info("RefImage terminated.")
 
+  if remaining is None:
+    chunks_done = chunk_tracking.mark_chunk_done(job_table, job_id, chunk['index'], part + 1)
+    if chunks_done is not None:
+      reporter.update(chunksDone=chunks_done)
 
-def process_ref_image(local_video_path, result_key):
-  logger.info("Start ref image generation...")
-  ref_image_outpath = '/tmp/refimg.jpg'
-  command = ['ffmpeg', '-i', local_video_path, '-vframes', '1', ref_image_outpath]
+  processed = {
+    **chunk,
+    'key': result_key,
+    'part': part,
+    'refimg_key': refimg_key,
+    'refimg_score': candidates[0]['score'],
+    'refimg_candidates': candidates,
+    'metadata': metadata
+  }
+  return processed, remaining
 
-  try:
-    subprocess.run(command, check=True)
-  except subprocess.CalledProcessError as e:
-    raise utils.FFmpegError("Failed to create reference image", e)
 
-  logger.info(f"Upload refimage to {result_key}...")
-  s3_client.upload_file(ref_image_outpath, OBJ_BUCKET_NAME, result_key)
-  logger.info(f"Regimage uploaded.")
+def get_part_name(chunk) -> str:
+  name = os.path.basename(chunk['key']).rsplit('.')[0]
+  return f"{name}-part{chunk['part']}" if chunk.get('part') else name
 
 
-def process_chunk(ffmpeg_command):
-  try:
-    subprocess.run(ffmpeg_command, check=True)
-  except subprocess.CalledProcessError as e:
-    raise utils.FFmpegError("Failed to run ffmpeg process", e)
-
+def continue_async(context, continuation: dict[str, Any]):
+  """
+  Invokes this function asynchronously with the continuation, for invocations without orchestration
+  (e.g. the ingested segments, see trigger_segment_processing).
+  """
+  lambda_client.invoke(
+    FunctionName=context.function_name,
+    InvocationType='Event',
+    Payload=json.dumps(continuation)
+  )
 
-def build_command(chunk_url: str, outpath: str, config: config_utils.Config) -> tuple[list[str], str, str]:
-  # TODO: filters must be within a single -vf flag!
-  cmd = ["ffmpeg", "-i", chunk_url]
-  out_no_format, format_ = outpath.rsplit(".", 1)
 
-  vf_args = create_vf_args(config)
-  cmd.append("-vf")
-  cmd.append(",".join(vf_args))
+def process_ref_image(candidate_prefix: str, raw_candidates: bytes, result_key: str,
+                      stopped: bool = False) -> list[dict[str, float]]:
+  """
+  Scores the reference image candidates of the chunk and uploads the best one as reference image.
 
-  if config.format:
-    format_ = config.format
-  outpath = f"{out_no_format}.{format_}"
-  cmd.append(outpath)
+  :param candidate_prefix: path prefix of the candidate images and their metadata written by ffmpeg
+  :param raw_candidates: candidates as downscaled rgb24 rawvideo
+  :param result_key: key of the reference image
+  :param stopped: whether ffmpeg was stopped at the deadline, the outputs may then differ by the last candidates
+  :return: the KEPT_CANDIDATES best candidates (time, score and scene score), best first
+  """
+  logger.info("Start ref image generation...")
+  if stopped:
+    frame_size = constants.SCORE_FRAME_WIDTH * constants.SCORE_FRAME_HEIGHT * 3
+    raw_candidates = raw_candidates[:len(raw_candidates) - len(raw_candidates) % frame_size]
+  frames = frame_scoring.decode_raw_frames(raw_candidates)
+  metadata = frame_scoring.parse_frame_metadata(f"{candidate_prefix}.txt")
 
-  return cmd, outpath, format_
+  if stopped:
+    count = min(len(frames), len(metadata))
+    frames, metadata = frames[:count], metadata[:count]
 
+  if len(frames) == 0 or len(frames) != len(metadata):
+    raise utils.FFmpegError(f"Got {len(frames)} candidate frames with {len(metadata)} metadata entries")
 
-def create_vf_args(config: config_utils.Config) -> list[str]:
-  """
-  Creates a list of all arguments that are part of the -vf option.
-  It searches for filter operations in the provided config
+  scores = frame_scoring.score_frames(frames)
+  ranking = scores.argsort()[::-1]
+  best = int(ranking[0])
+  logger.info(f"Best of {len(frames)} reference frames at {metadata[best]['time']} s with score {scores[best]:.3f}")
 
-  :param config: User defined configs
-  :return: all configs that were not used (as they are no filters) and a list of arguments to the -vf option
-  """
+  logger.info(f"Upload refimage to {result_key}...")
+  s3_client.upload_file(f"{candidate_prefix}-{best + 1:03d}.jpg", OBJ_BUCKET_NAME, result_key)
+  logger.info(f"Regimage uploaded.")
 
-  filter_args = []
-  for filter, opts in config.filters.items():
-    if filter == 'crop':
-      filter_args.append(create_crop_arg(opts))
-    elif filter == 'resize':
-      filter_args.append(create_resize_arg(opts))
-    elif filter == 'brightness':
-      filter_args.append(f"eq=brightness={opts['value']}")
-    elif filter == 'grayscale':
-      filter_args.append(f"hue=s=0")
-    elif filter == 'sepia':
-      filter_args.append(f"colorchannelmixer=.393:.769:.189:0:.349:.686:.168:0:.272:.534:.131")
-
-  return filter_args
-
-
-def create_filter_arg(opts):
-  if opts == 'grayscale':
-    return 'hue=s=0'
-  elif opts == 'sepia':
-    return 'colorchannelmixer=.393:.769:.189:0:.349:.686:.168:0:.272:.534:.131'
-  elif 'brightness' in opts:
-    brightness_value = float(opts.split('=')[1])
-    return f'eq=brightness={brightness_value}'
-  else:
-    raise utils.ConfigError(f"Invalid filter {opts}")
+  return [{**metadata[i], 'score': round(float(scores[i]), 4)} for i in ranking[:constants.KEPT_CANDIDATES]]
 
 
-def create_crop_arg(opts):
-  width = opts['width']
-  height = opts['height']
-  x = opts.get('x', '(in_w-out_w)/2')
-  y = opts.get('x', '(in_w-out_w)/2')
-  return f'crop={width}:{height}:{x}:{y}'
+def build_command(chunk_url: str, outpath: str, candidate_prefix: str, has_audio: bool,
+                  config: config_utils.Config, keep_audio: bool = False,
+                  seek: float = 0.0) -> tuple[list[str], str, str]:
+  """
+  Builds the ffmpeg command that processes the chunk and extracts reference image candidates
+  within the same decode pass.
+
+  Outputs:
+  - the processed chunk at outpath (with the configured format), without audio as the audio
+    is processed once for the whole video and muxed in by reduce_chunks.
+    With keep_audio, the audio of the chunk is stream-copied instead (ingested segments).
+  - candidate frames as {candidate_prefix}-%03d.jpg and their metadata as {candidate_prefix}.txt
+  - the candidate frames at scoring resolution as rgb24 rawvideo on stdout
+  - black, silence and loudness analysis in the log
+
+  With seek, the chunk is processed from this time on (continuation of a split chunk).
+  """
+  out_no_format, format_ = outpath.rsplit(".", 1)
+  if config.format:
+    format_ = config.format
+  outpath = f"{out_no_format}.{format_}"
 
+  # the command only depends on the config, so warm containers compile it once and only substitute the paths
+  template = warm_container.get_compiled(f"command-{config.fingerprint()}-{has_audio}-{keep_audio}",
+                                         lambda: filter_graph.compile_chunk_command(config, has_audio, keep_audio))
 
-def create_resize_arg(opts):
-  width = opts['width']
-  height = opts['height']
-  return f'scale={width}:{height}'
+  return template.render(chunk_url, outpath, candidate_prefix, seek), outpath, format_
 
 
 def get_job_config(job_id: str) -> dict[Any: Any]:
@@ -179,4 +299,9 @@ def get_job_config(job_id: str) -> dict[Any: Any]:
 
 
 def extract_data(event, context):
-  return event['jobId'], event['key'], event['size'], event['extension']
+  if 'chunks' in event:
+    chunks = event['chunks']
+  else:
+    unit = event['unit']
+    chunks = manifest.load_manifest(OBJ_BUCKET_NAME, event['manifestKey']).chunks(unit['start'], unit['end'])
+  return event['jobId'], event.get('hasAudio', False), event.get('keepAudio', False), chunks
@@ -1,12 +1,14 @@
 import glob
 import logging
-import subprocess
 import tempfile
 from typing import Dict, Any
 import os
 from utils.job_status import JobStatus
 
 import boto3
+from utils import ffmpeg_runner
+from utils import manifest
+from utils import progress
 from utils import s3_utils
 from utils import utils
 
@@ -16,6 +18,16 @@ OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# ffmpeg muxer per container extension, if it differs from the extension
+CONTAINER_MUXERS = {
+  'ts': 'mpegts',
+  'mkv': 'matroska',
+  'm4v': 'mp4',
+}
+
+# mov like containers need fragments to be written into a pipe
+FRAGMENTED_MUXERS = {'mp4', 'mov'}
+
 s3_client = boto3.client('s3')
 job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
 
@@ -23,6 +35,8 @@ job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
   """
   Reduces all processed chunks to a single video.
+  If the chunks were already concatenated by the incremental reduction (`videoKey`), the video is only remuxed.
+  If the video has audio, the (once) processed audio track is muxed into the result.
   """
 
   os.system('rm /tmp/*')
@@ -33,28 +47,44 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
   jobid = utils.get_jobid_from_key(keys[0])
   ext = utils.get_extension_from_key(keys[0])
   result_file = f"{jobid}/RESULT.{ext}"
-  chunk_files = download_chunks(keys)
+  audio_track = event.get('audioTrack')
+  audio_url = generate_presigned_urls([audio_track['key']])[0] if audio_track else None
+  video_key = event.get('videoKey')
 
-  tmpfiles = glob.glob("/tmp/*")
-  logger.info(f"Found tmp file: {tmpfiles}")
+  with tempfile.NamedTemporaryFile('w') as f:
+    if video_key:
+      logger.info(f"Remux incrementally reduced video {video_key}")
+      video_input = ["-i", generate_presigned_urls([video_key])[0]]
+    else:
+      chunk_files = download_chunks(keys)
 
-  logger.info(f"Concat videos: {chunk_files}")
+      tmpfiles = glob.glob("/tmp/*")
+      logger.info(f"Found tmp file: {tmpfiles}")
 
-  with tempfile.NamedTemporaryFile('w') as f:
-    create_seglist_in(chunk_files, file=f)
-    logger.info(f"Seglist file written in {f.name}.")
+      logger.info(f"Concat videos: {chunk_files}")
+
+      create_seglist_in(chunk_files, file=f)
+      logger.info(f"Seglist file written in {f.name}.")
 
-    with open(f.name, 'r') as tmpf:
-      l = tmpf.read()
-      logger.info(f"Stored seglist is: {l}")
+      with open(f.name, 'r') as tmpf:
+        l = tmpf.read()
+        logger.info(f"Stored seglist is: {l}")
 
-    process = exec_command(f.name, ext, v="info")
-    s3_utils.multipart_upload(process.stdout, OBJ_BUCKET_NAME, result_file)
+      # concat file list, safe 0 is required for http sources
+      video_input = ["-f", "concat", "-safe", "0", "-i", f.name]
 
-    return_code = process.wait()
-    logger.info(f"FFMPEG returned with code {return_code}")
-    if return_code != 0:
-      raise "FFMPEG exited not successful!"
+    reporter = progress.ProgressReporter(job_table, jobid, 'reduce')
+
+    def upload_result(stream):
+      s3_utils.multipart_upload(stream, OBJ_BUCKET_NAME, result_file,
+                                on_progress=lambda uploaded: reporter.update(bytesUploaded=uploaded))
+
+    command = build_command(video_input, ext, audio_url)
+    logger.info(f"Executing command: \n{command}")
+    # raises utils.FFmpegError if ffmpeg fails, ffmpeg is killed if the upload fails
+    ffmpeg_runner.run_sync(command, on_stdout=upload_result)
+    logger.info(f"FFMPEG finished.")
+    reporter.done()
 
   update_status(jobid)
 
@@ -66,6 +96,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     "key": result_file,
     "jobId": jobid,
     "ext": ext,
+    "audioKey": audio_track['key'] if audio_track else None,
   }
 
 
@@ -85,22 +116,27 @@ def download_chunks(keys: list[str]) -> list[str]:
   return dests
 
 
-def exec_command(seglist_file: str, ext: str, v="info") -> subprocess.Popen:
-  command = ["ffmpeg"]
-  command.append("-y")
-  command.append(f"-v {v}")
-  command.append("-protocol_whitelist concat,file,http,https,tcp,tls,crypto")  # allows http sources
-  command.append("-f concat")
-  command.append("-safe 0")  # required for http sources
-  command.append(f'-i {seglist_file}')  # concat file list
-  command.append("-c copy")
-  command.append(f"-f {ext}")
-  command.append("-movflags frag_keyframe+empty_moov")  # todo: only required for mov like containers
+def build_command(video_input: list[str], ext: str, audio_url: str | None, v="info") -> list[str]:
+  command = ["ffmpeg", "-y", "-v", v]
+  command += ["-protocol_whitelist", "concat,file,http,https,tcp,tls,crypto"]  # allows http sources
+  command += video_input
+  if audio_url is not None:
+    command += ["-i", audio_url]  # processed audio track
+    command += ["-map", "0:v", "-map", "1:a"]
+  command += ["-c", "copy"]
+  muxer = get_muxer(ext)
+  command += ["-f", muxer]
+  if muxer in FRAGMENTED_MUXERS:
+    command += ["-movflags", "frag_keyframe+empty_moov"]
   command.append("pipe:1")
+  return command
 
-  command = " ".join(command)
 
-  return subprocess.Popen(f"{command}", stdout=subprocess.PIPE, shell=True)
+def get_muxer(ext: str) -> str:
+  """
+  Returns the ffmpeg muxer for the container extension.
+  """
+  return CONTAINER_MUXERS.get(ext.lower(), ext.lower())
 
 
 def generate_presigned_urls(keys: list[str], expiration=3600) -> list[str]:
@@ -132,4 +168,4 @@ def update_status(job_id):
 
 
 def extract_data(event, context) -> list[str]:
-  return [e['key'] for e in event['processedChunks']]
+  return [e['key'] for e in manifest.load_processed_chunks(OBJ_BUCKET_NAME, event['jobId'])]
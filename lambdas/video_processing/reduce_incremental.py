@@ -0,0 +1,147 @@
+import logging
+import os
+import tempfile
+from typing import Dict, Any
+
+import boto3
+
+from utils import chunk_tracking
+from utils import config_utils
+from utils import constants
+from utils import ffmpeg_runner
+from utils import manifest
+from utils import probe_utils
+from utils import s3_utils
+from utils import utils
+
+JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
+OBJ_BUCKET_NAME = os.environ["OBJECT_BUCKET_NAME"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+s3_client = boto3.client('s3')
+job_table = boto3.resource('dynamodb').Table(JOB_TABLE_NAME)
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+  """
+  Reduces the processed chunks incrementally, while the chunk map is still running.
+
+  The state machine invokes this step repeatedly (polling). Each step appends the chunks that are processed
+  in order (0..k, see chunk_tracking) as a MPEG-TS part of a multipart upload of the video, so only the tail
+  is left when the last chunk is done. As MPEG-TS segments can be concatenated bytewise, the timestamps
+  of each part are offset by the duration of all previous chunks.
+
+  :return: the reduction state, which is passed to the next step. Once all chunks are appended,
+           `complete` is set and `key` refers to the video (without audio).
+  """
+
+  logger.info(f"Invoked with event: {event}")
+
+  job_id = event['jobId']
+  chunks = manifest.load_manifest(OBJ_BUCKET_NAME, event['manifestKey']).chunks()
+  state = event.get('reduction') or start_reduction(job_id)
+
+  config = config_utils.get_job_config(job_table, job_id)
+  _, _, done_indices = chunk_tracking.get_chunk_status(job_table, job_id)
+  split_parts = chunk_tracking.get_split_parts(job_table, job_id)
+
+  step = select_step(job_id, chunks, state['next'], done_indices, split_parts, config)
+  keys = [key for chunk_keys in step for key in chunk_keys]
+  end = state['next'] + len(step)
+  last = end == len(chunks)
+
+  if keys:
+    step_bytes = sum(size for _, size in keys)
+    if step_bytes < constants.MIN_PART_BYTES and not last:
+      logger.info(f"Chunks {state['next']}..{end - 1} are too small for a part, wait for more chunks.")
+      return state
+    append_part(state, [key for key, _ in keys], ffmpeg_runner.deadline_from_context(context))
+    state['next'] = end
+
+  if last:
+    complete_reduction(state)
+
+  logger.info(f"Reduced {state['next']}/{len(chunks)} chunks.")
+  return state
+
+
+def start_reduction(job_id: str) -> dict[str, Any]:
+  key = f"{job_id}/PROCESSED/VIDEO.ts"
+  mpu = s3_client.create_multipart_upload(Bucket=OBJ_BUCKET_NAME, Key=key)
+  logger.info(f"Started multipart upload of {key}.")
+  return {
+    'key': key,
+    'uploadId': mpu['UploadId'],
+    'parts': [],
+    'next': 0,
+    'offset': 0.0,
+    'complete': False,
+  }
+
+
+def select_step(job_id: str, chunks: list[dict[str, Any]], start: int, done_indices: set[int],
+                split_parts: dict[int, int], config: config_utils.Config) -> list[list[tuple[str, int]]]:
+  """
+  Selects the processed chunks that are appended by this step: the chunks from start on that are done in order,
+  up to REDUCTION_STEP_BYTES. Chunks that were split (see process_chunk) are appended with all their parts.
+
+  :return: keys and sizes of the processed parts, per chunk
+  """
+  selected = []
+  step_bytes = 0
+  for chunk in chunks[start:]:
+    if chunk['index'] not in done_indices:
+      break
+    chunk_keys = []
+    for part in range(split_parts.get(chunk['index'], 1)):
+      key = utils.get_processed_chunk_key(job_id, chunk['key'], config.format or chunk['extension'], part)
+      chunk_keys.append((key, s3_client.head_object(Bucket=OBJ_BUCKET_NAME, Key=key)['ContentLength']))
+    size = sum(part_size for _, part_size in chunk_keys)
+    if selected and step_bytes + size > constants.REDUCTION_STEP_BYTES:
+      break
+    selected.append(chunk_keys)
+    step_bytes += size
+  return selected
+
+
+def append_part(state: dict[str, Any], keys: list[str], deadline: float | None = None):
+  """
+  Remuxes the processed chunks to a single MPEG-TS part and uploads it.
+  """
+  os.system('rm -rf /tmp/*')
+  paths = [f"/tmp/CHUNK-{i:04}.{os.path.splitext(key)[1].lstrip('.')}" for i, key in enumerate(keys)]
+  s3_utils.download_all(OBJ_BUCKET_NAME, keys, paths)
+
+  duration = sum(probe_utils.probe_chunk(path)['duration'] or 0.0 for path in paths)
+  part_path = "/tmp/PART.ts"
+
+  with tempfile.NamedTemporaryFile('w') as f:
+    f.write("ffconcat version 1.0\n" + "\n".join([f"file {p}" for p in paths]))
+    f.flush()
+    command = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", f.name,
+               "-c", "copy", "-output_ts_offset", str(state['offset']), "-f", "mpegts", part_path]
+    ffmpeg_runner.run_sync(command, deadline=deadline, capture_stdout=False)
+
+  part_number = len(state['parts']) + 1
+  with open(part_path, 'rb') as part:
+    response = s3_client.upload_part(Body=part, Bucket=OBJ_BUCKET_NAME, Key=state['key'],
+                                     UploadId=state['uploadId'], PartNumber=part_number)
+  logger.info(f"Uploaded part {part_number} ({len(keys)} chunks, {duration:.2f} s).")
+
+  state['parts'].append({'PartNumber': part_number, 'ETag': response['ETag']})
+  state['offset'] = round(state['offset'] + duration, 6)
+
+  os.system('rm -rf /tmp/*')
+
+
+def complete_reduction(state: dict[str, Any]):
+  s3_client.complete_multipart_upload(
+    Bucket=OBJ_BUCKET_NAME,
+    Key=state['key'],
+    UploadId=state['uploadId'],
+    MultipartUpload={'Parts': state['parts']}
+  )
+  state['complete'] = True
+  logger.info(f"Completed multipart upload of {state['key']}.")
@@ -5,6 +5,7 @@ from utils.job_status import JobStatus
 import boto3
 import json
 from utils import utils
+from utils import ws_utils
 
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
 WS_URL = os.environ["WS_URL"]
@@ -56,26 +57,18 @@ def update_status(job_id, error):
 
 
 def notify_clients(job_id, video_key, audio_key, error):
-  item_res = job_table.get_item(
-    Key={
-      'PK': f"JOB#{job_id}",
-      'SK': "DATA"
-    }
-  )
-  item = item_res.get('Item', None)
-  connections = item.get('ws_connections', [])
   if error is None:
-    msg = get_success_msg(video_key, f"{job_id}/THUMBNAIL.jpg", audio_key, item['transformations'])
+    item_res = job_table.get_item(
+      Key={
+        'PK': f"JOB#{job_id}",
+        'SK': "DATA"
+      },
+      ProjectionExpression='transformations'
+    )
+    msg = get_success_msg(video_key, f"{job_id}/THUMBNAIL.jpg", audio_key, item_res['Item']['transformations'])
   else:
     msg = get_error_msg(error)
-  for connection_id in connections:
-    try:
-      websocket_client.post_to_connection(
-        Data=json.dumps({'msg': msg}),
-        ConnectionId=connection_id
-      )
-    except Exception:
-      pass
+  ws_utils.broadcast(websocket_client, job_table, job_id, {'type': 'result', 'msg': msg})
 
 
 def get_success_msg(video_key, thumbnail_key, audio_key, transformations):
@@ -122,8 +115,10 @@ def extract_data(event, context):
     video_key = None
     audio_key = None
   except:
-    job_id = event[2][0]['jobId']
+    # output of the processing parallel: [post-processing [reduction, ...]]
+    job_id = event[0][0]['jobId']
     error = None
-    video_key = event[2][0]['key']
-    audio_key = event[1]['key']
+    video_key = event[0][0]['key']
+    # the reduction muxes the processed audio track and passes its key
+    audio_key = event[0][0].get('audioKey')
   return error, job_id, video_key, audio_key
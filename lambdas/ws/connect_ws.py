@@ -3,6 +3,8 @@ from typing import Dict, Any
 import os
 import boto3
 
+from utils import ws_utils
+
 JOB_TABLE_NAME = os.environ["JOB_TABLE_NAME"]
 
 logger = logging.getLogger(__name__)
@@ -17,25 +19,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
   """
 
   connection_id, job_id = extract_data(event, context)
-  store_connection(connection_id, job_id)
+  ws_utils.store_connection(job_table, job_id, connection_id)
 
   return {}
 
 
-def store_connection(connection_id, job_id):
-  job_table.update_item(
-    Key={
-      'PK': f"JOB#{job_id}",
-      'SK': "DATA"
-    },
-    UpdateExpression="SET ws_connections = list_append(ws_connections, :i)",
-    ExpressionAttributeValues={
-      ':i': [connection_id],
-    },
-    ReturnValues="UPDATED_NEW"
-  )
-
-
 def extract_data(event, context):
   connection_id = event["requestContext"]["connectionId"]
   job_id = event["headers"]["jobId"]
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the ffmpeg-python graph compilation (ffmpeg.get_args) of the ffmpeg layer.
+
+Compiles graphs of 10 to 10,000 nodes of three shapes:
+- chain:   a single input with a chain of filters
+- overlay: many inputs overlaid onto a base input (deep multi-input graph)
+- concat:  many inputs joined by a single concat filter (wide graph)
+
+Usage: python scripts/bench_ffmpeg_compile.py [--sizes 10 100 1000 10000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'ffmpeg_layer', 'python'))
+
+import ffmpeg  # noqa: E402
+
+
+def chain_graph(size: int):
+  stream = ffmpeg.input('in.mp4').video
+  for i in range(size - 2):
+    stream = stream.filter('eq', brightness=(i % 10) / 100)
+  return ffmpeg.output(stream, 'out.mp4')
+
+
+def overlay_graph(size: int):
+  inputs = max(1, (size - 1) // 2)
+  stream = ffmpeg.input('base.mp4').video
+  for i in range(inputs - 1):
+    stream = stream.overlay(ffmpeg.input(f'in-{i}.mp4').video, x=i % 100, y=i % 50)
+  return ffmpeg.output(stream, 'out.mp4')
+
+
+def concat_graph(size: int):
+  inputs = max(1, size - 2)
+  return ffmpeg.output(ffmpeg.concat(*[ffmpeg.input(f'in-{i}.mp4').video for i in range(inputs)]), 'out.mp4')
+
+
+GRAPHS = {
+  'chain': chain_graph,
+  'overlay': overlay_graph,
+  'concat': concat_graph,
+}
+
+
+def measure(graph, repeat: int) -> tuple[float, int]:
+  best = float('inf')
+  args = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    args = graph.get_args()
+    best = min(best, time.perf_counter() - start)
+  return best, len(args)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the compilation of ffmpeg-python graphs.")
+  parser.add_argument("--sizes", type=int, nargs='+', default=[10, 100, 1000, 10000], help="Number of nodes")
+  parser.add_argument("--repeat", type=int, default=3, help="Compilations per graph, the best one is reported")
+  args = parser.parse_args()
+
+  print(f"{'graph':<8} {'nodes':>6} {'build ms':>10} {'compile ms':>11} {'args':>7}")
+  for name, create in GRAPHS.items():
+    for size in args.sizes:
+      start = time.perf_counter()
+      graph = create(size)
+      build_secs = time.perf_counter() - start
+      compile_secs, arg_count = measure(graph, args.repeat)
+      print(f"{name:<8} {size:>6} {build_secs * 1000:>10.2f} {compile_secs * 1000:>11.2f} {arg_count:>7}")
+
+
+if __name__ == '__main__':
+  main()
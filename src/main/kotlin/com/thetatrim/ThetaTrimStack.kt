@@ -2,6 +2,8 @@ package com.thetatrim
 
 import com.amazonaws.services.servicequotas.AWSServiceQuotasClient
 import com.amazonaws.services.servicequotas.model.GetServiceQuotaRequest
+import software.amazon.awscdk.ArnComponents
+import software.amazon.awscdk.ArnFormat
 import software.amazon.awscdk.CfnOutput
 import software.amazon.awscdk.Duration
 import software.amazon.awscdk.Stack
@@ -14,6 +16,8 @@ import software.amazon.awscdk.services.apigatewayv2.WebSocketRouteOptions
 import software.amazon.awscdk.services.apigatewayv2.WebSocketStage
 import software.amazon.awscdk.services.dynamodb.Attribute
 import software.amazon.awscdk.services.dynamodb.AttributeType
+import software.amazon.awscdk.services.dynamodb.GlobalSecondaryIndexProps
+import software.amazon.awscdk.services.dynamodb.ProjectionType
 import software.amazon.awscdk.services.dynamodb.Table
 import software.amazon.awscdk.services.iam.*
 import software.amazon.awscdk.services.lambda.Code
@@ -24,11 +28,11 @@ import software.amazon.awscdk.services.lambda.python.alpha.PythonLayerVersion
 import software.amazon.awscdk.services.logs.LogGroup
 import software.amazon.awscdk.services.s3.Bucket
 import software.amazon.awscdk.services.s3.EventType
+import software.amazon.awscdk.services.s3.LifecycleRule
 import software.amazon.awscdk.services.s3.NotificationKeyFilter
 import software.amazon.awscdk.services.s3.notifications.LambdaDestination
 import software.amazon.awscdk.services.stepfunctions.*
 import software.amazon.awscdk.services.stepfunctions.Map
-import software.amazon.awscdk.services.stepfunctions.tasks.CallAwsService
 import software.amazon.awscdk.services.stepfunctions.tasks.LambdaInvoke
 import software.constructs.Construct
 import java.util.*
@@ -61,6 +65,11 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
      */
     private lateinit var triggerVideoProcessingLambda: Function
 
+    /**
+     * Lambda function for processing ingested segments while the video is uploaded.
+     */
+    private lateinit var triggerSegmentProcessingLambda: Function
+
     /**
      * Lambda function for creating jobs and presigned urls.
      */
@@ -87,15 +96,35 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
     private lateinit var extractMetadataLambda: Function
 
     /**
-     * Lambda function for extracting the audio from the original video.
+     * Lambda function for detecting the labels of the chunks' reference images.
+     */
+    private lateinit var extractLabelsLambda: Function
+
+    /**
+     * Lambda function for processing the audio extracted by the preprocessing.
      */
-    private lateinit var extractAudioLambda: Function
+    private lateinit var processAudioLambda: Function
 
     /**
      * Lambda function to check the jobs status and whether all chunks are processed.
      */
     private lateinit var reduceChunksLambda: Function
 
+    /**
+     * Lambda function to aggregate the results of the distributed chunk map.
+     */
+    private lateinit var aggregateUnitsLambda: Function
+
+    /**
+     * Lambda function to reduce the processed chunks incrementally.
+     */
+    private lateinit var reduceIncrementalLambda: Function
+
+    /**
+     * Lambda function to wait for the processed segments of a streaming ingest.
+     */
+    private lateinit var finalizeIngestLambda: Function
+
     /**
      * Lambda function to generate a thumbnail.
      */
@@ -142,6 +171,26 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
     private lateinit var utilsLambdaLayer: LayerVersion
     private lateinit var ffmpegLambdaLayer: LayerVersion
 
+    /**
+     * Maximal concurrency of chunk processing, depending on the account's lambda concurrency quota.
+     */
+    private var lambdaConcurrencyQuota: Double = 0.0
+
+    /**
+     * Whether the chunks are reduced incrementally while the chunk map is running
+     * (enable with `cdk deploy -c incrementalReduction=true`).
+     */
+    private val incrementalReduction: Boolean =
+        this.node.tryGetContext("incrementalReduction")?.toString()?.toBoolean() ?: false
+
+    /**
+     * Whether the work units are processed by a distributed map, which reads the units from the chunk manifest
+     * and is not bound to the state history limits of an inline map
+     * (enable with `cdk deploy -c distributedChunkMap=true`).
+     */
+    private val distributedChunkMap: Boolean =
+        this.node.tryGetContext("distributedChunkMap")?.toString()?.toBoolean() ?: false
+
 
     init {
         setupResources()
@@ -162,17 +211,38 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
             .sortKey(
                 Attribute.builder().name("SK").type(AttributeType.STRING).build()
             )
+            .timeToLiveAttribute("ttl")
             .build()
 
+        // sparse index of the websocket connection items (PK=JOB#id, SK=CONN#cid), as disconnects only know the connection id
+        jobsTable.addGlobalSecondaryIndex(
+            GlobalSecondaryIndexProps.builder()
+                .indexName("ConnectionIndex")
+                .partitionKey(Attribute.builder().name("connectionId").type(AttributeType.STRING).build())
+                .projectionType(ProjectionType.KEYS_ONLY)
+                .build()
+        )
+
         jobsBucket = Bucket.Builder.create(this, "JobObjectBucket")
             .bucketName("${PREFIX}job-object-bucket-${this.account}") // account suffix to avoid name conflicts
             .versioned(true)
+            // multipart uploads of failed jobs (e.g. the incremental reduction) and results of the distributed map
+            .lifecycleRules(
+                listOf(
+                    LifecycleRule.builder().abortIncompleteMultipartUploadAfter(Duration.days(1)).build(),
+                    LifecycleRule.builder().prefix("$MAP_RESULTS_PREFIX/").expiration(Duration.days(1)).build()
+                )
+            )
             .build()
 
         environmentMap.put("OBJECT_BUCKET_NAME", jobsBucket.bucketName)
 
         environmentMap.put("JOB_TABLE_NAME", jobsTable.tableName)
 
+        // depending on the account we may use a different maximal concurrency for the map
+        lambdaConcurrencyQuota = findAccountLambdaConcurrencyQuota()
+        environmentMap.put("CHUNK_CONCURRENCY_QUOTA", lambdaConcurrencyQuota.toInt().toString())
+
         utilsLambdaLayer = PythonLayerVersion.Builder
             .create(this, "UtilsLayer")
             .entry("lambdas/common_layer")
@@ -248,17 +318,38 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
             .timeout(Duration.seconds(60))
             .build()
 
-        extractAudioLambda = lambdaBuilderFactory("lambdas/video_processing/extract_audio")
-            .timeout(Duration.minutes(2))
+        // the reference image of every chunk is labeled at the rekognition TPS quota
+        extractLabelsLambda = lambdaBuilderFactory("lambdas/video_processing/extract_labels")
+            .timeout(Duration.minutes(15))
+            .build()
+
+        processAudioLambda = lambdaBuilderFactory("lambdas/video_processing/process_audio")
+            .timeout(Duration.minutes(5))
+            .memorySize(1024)
             .build()
 
         reduceChunksLambda = lambdaBuilderFactory("lambdas/video_processing/reduce_chunks")
-            .timeout(Duration.seconds(60))
+            .timeout(Duration.minutes(2))
             .memorySize(2048)
 //            .memorySize(1024)
 //            .ephemeralStorageSize(Size.gibibytes(1))
             .build()
 
+        aggregateUnitsLambda = lambdaBuilderFactory("lambdas/video_processing/aggregate_units")
+            .timeout(Duration.minutes(2))
+            .memorySize(1024)
+            .build()
+
+        reduceIncrementalLambda = lambdaBuilderFactory("lambdas/video_processing/reduce_incremental")
+            .timeout(Duration.minutes(5))
+            .memorySize(2048)
+            .build()
+
+        finalizeIngestLambda = lambdaBuilderFactory("lambdas/video_processing/finalize_ingest")
+            .timeout(Duration.minutes(2))
+            .memorySize(1024)
+            .build()
+
         generateThumbnailLambda = lambdaBuilderFactory("lambdas/video_processing/generate_thumbnail")
             .timeout(Duration.seconds(60))
 //            .memorySize(1024)
@@ -286,6 +377,11 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
             .timeout(Duration.seconds(60))
             .build()
 
+        triggerSegmentProcessingLambda = lambdaBuilderFactory("lambdas/triggers/trigger_segment_processing")
+            .timeout(Duration.seconds(60))
+            .build()
+        triggerSegmentProcessingLambda.addEnvironment("PROCESS_CHUNK_FUNCTION_NAME", processChunkLambda.functionName)
+
 
         restApi = RestApi.Builder.create(this, "RestAPI")
             .restApiName("${PREFIX}rest-api")
@@ -320,40 +416,14 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
             .outputPath("$.Payload")
             .build()
 
-        // depending on the account we may use a different maximal concurrency for the map
-        val lambdaConcurrencyQuota = findAccountLambdaConcurrencyQuota()
         println("Using map max concurrency of $lambdaConcurrencyQuota")
-        // Create an IAM Policy Statement
-        val labelDetectTask = CallAwsService.Builder.create(this, "DetectLabelsTask")
-            .action("detectLabels")
-            .service("Rekognition")
-            .parameters(
-                mutableMapOf(
-                    "Image" to mutableMapOf(
-                        "S3Object" to mutableMapOf(
-                            "Bucket" to jobsBucket.bucketName,
-                            "Name" to JsonPath.stringAt("$.refimg_key")
-                        )
-                    ),
-                    "MaxLabels" to 10,
-                    "MinConfidence" to 90,
-                    "Features" to mutableListOf("GENERAL_LABELS"),
-                    "Settings" to mutableMapOf(
-                        "GeneralLabels" to mutableMapOf(
-                            "LabelCategoryInclusionFilters" to listOf("Person Description")
-                        )
-                    )
-                )
-            )
-            .iamResources(listOf(jobsBucket.arnForObjects("*")))
-            .build()
 
-        val mapRefImgsTask = Map.Builder.create(this, "MapRefimgsTask")
-            .itemsPath("$.processedChunks")
+        // labels are detected concurrently, rate limited to the rekognition quota
+        val extractLabelsTask = LambdaInvoke.Builder.create(this, "ExtractLabelsTask")
+            .lambdaFunction(extractLabelsLambda)
+            .payloadResponseOnly(true)
             .resultPath("$.labeledChunks")
-            .maxConcurrency(1)
             .build()
-            .itemProcessor(labelDetectTask)
             .next(thumbnailGenerationTask)
 
 
@@ -361,52 +431,167 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
             .lambdaFunction(reduceChunksLambda)
             .outputPath("$.Payload")
             .build()
+        // merges the metadata that was gathered by the chunk workers
+        val extractMetadataTask = LambdaInvoke.Builder.create(this, "ExtractMetadataTask")
+            .lambdaFunction(extractMetadataLambda)
+            .outputPath("$.Payload")
+            .build()
+
         val postProcessingParallel = Parallel.Builder.create(this, "PostProcessingParallel")
             .build()
             .branch(reduceChunksTask)
-            .branch(mapRefImgsTask)
+            .branch(extractLabelsTask)
+            .branch(extractMetadataTask)
 
 
         val processChunkTask = LambdaInvoke.Builder.create(this, "ProcessChunkTask")
             .lambdaFunction(processChunkLambda)
             .outputPath("$.Payload")
             .build()
+        // chunks that are split before the lambda timeout are continued with the returned continuation
+        processChunkTask.next(
+            Choice.Builder.create(this, "ContinuationChoice")
+                .build()
+                .`when`(
+                    Condition.isPresent("$.continuation"),
+                    Pass.Builder.create(this, "ContinueUnit")
+                        .outputPath("$.continuation")
+                        .build()
+                        .next(processChunkTask)
+                )
+                .otherwise(Pass.Builder.create(this, "UnitProcessed").build())
+        )
+
+
+        // work units only reference a range of the chunk manifest, the processed chunks are stored next to it
+        val unitSelector = mutableMapOf<String, Any>(
+            "jobId" to JsonPath.stringAt("$.jobId"),
+            "hasAudio" to JsonPath.stringAt("$.hasAudio"),
+            "manifestKey" to JsonPath.stringAt("$.manifestKey"),
+            "unit" to JsonPath.stringAt("$$.Map.Item.Value")
+        )
+
+        val chunkMap: IChainable = if (distributedChunkMap) {
+            // child executions read their units from the manifest and write their outputs to s3
+            val aggregateUnitsTask = LambdaInvoke.Builder.create(this, "AggregateUnitsTask")
+                .lambdaFunction(aggregateUnitsLambda)
+                .resultPath(JsonPath.DISCARD)
+                .build()
+
+            DistributedMap.Builder.create(this, "ChunkMap")
+                .itemReader(
+                    S3JsonItemReader.Builder.create()
+                        .bucket(jobsBucket)
+                        .key(JsonPath.stringAt("$.unitsKey"))
+                        .build()
+                )
+                .itemSelector(unitSelector)
+                .resultWriter(
+                    ResultWriter.Builder.create()
+                        .bucket(jobsBucket)
+                        .prefix(MAP_RESULTS_PREFIX)
+                        .build()
+                )
+                .resultPath("$.mapResults")
+                .maxConcurrency(lambdaConcurrencyQuota)
+                .build()
+                .itemProcessor(processChunkTask)
+                .next(aggregateUnitsTask)
+        } else {
+            Map.Builder.create(this, "ChunkMap")
+                .itemsPath("$.workUnits")
+                .itemSelector(unitSelector)
+                .resultPath(JsonPath.DISCARD)
+                .maxConcurrency(lambdaConcurrencyQuota)
+                .build()
+                .itemProcessor(processChunkTask)
+        }
+
+        // the audio is processed once for the whole video, while the chunks are processed
+        val processAudioTask = LambdaInvoke.Builder.create(this, "ProcessAudioTask")
+            .lambdaFunction(processAudioLambda)
+            .outputPath("$.Payload")
+            .build()
 
+        val mergedResults = mutableMapOf<String, Any>(
+            "jobId" to JsonPath.stringAt("$[0].jobId"),
+            "manifestKey" to JsonPath.stringAt("$[0].manifestKey"),
+            "audioTrack" to JsonPath.stringAt("$[1].audioTrack")
+        )
 
-        val chunkMap = Map.Builder.create(this, "ChunkMap")
-            .itemsPath("$.chunks")
-            .resultPath("$.processedChunks")
-            .maxConcurrency(lambdaConcurrencyQuota)
+        val chunkAndAudioParallel = Parallel.Builder.create(this, "ChunkAndAudioParallel")
+            .build()
+            .branch(chunkMap)
+            .branch(processAudioTask)
+
+        if (incrementalReduction) {
+            // polls the chunk completion and appends the processed prefix of chunks to the video
+            val reduceIncrementalTask = LambdaInvoke.Builder.create(this, "ReduceIncrementalTask")
+                .lambdaFunction(reduceIncrementalLambda)
+                .payloadResponseOnly(true)
+                .resultPath("$.reduction")
+                .build()
+            val waitForChunks = Wait.Builder.create(this, "WaitForProcessedChunks")
+                .time(WaitTime.duration(Duration.seconds(5)))
+                .build()
+                .next(reduceIncrementalTask)
+            val reductionChoice = Choice.Builder.create(this, "ReductionCompleteChoice")
+                .build()
+                .`when`(
+                    Condition.booleanEquals("$.reduction.complete", true),
+                    Pass.Builder.create(this, "ReductionComplete").build()
+                )
+                .otherwise(waitForChunks)
+            reduceIncrementalTask.next(reductionChoice)
+
+            chunkAndAudioParallel.branch(reduceIncrementalTask)
+            mergedResults["videoKey"] = JsonPath.stringAt("$[2].reduction.key")
+        }
+
+        val mergeProcessingResults = Pass.Builder.create(this, "MergeProcessingResults")
+            .parameters(mergedResults)
             .build()
-            .itemProcessor(processChunkTask)
             .next(postProcessingParallel)
+        chunkAndAudioParallel.next(mergeProcessingResults)
+
         val preprocessingTask = LambdaInvoke.Builder.create(this, "PreprocessingTask")
             .lambdaFunction(preprocessLambda)
             .outputPath("$.Payload")
             .build()
-            .next(chunkMap)
+            .next(chunkAndAudioParallel)
 
-        val extractMetadataTask = LambdaInvoke.Builder.create(this, "ExtractMetadataTask")
-            .lambdaFunction(extractMetadataLambda)
-            .outputPath("$.Payload")
+        // ingested segments are already processed while they are uploaded, so only their completion is polled
+        val finalizeIngestTask = LambdaInvoke.Builder.create(this, "FinalizeIngestTask")
+            .lambdaFunction(finalizeIngestLambda)
+            .payload(
+                TaskInput.fromObject(
+                    mapOf(
+                        "jobId" to JsonPath.stringAt("$.jobId"),
+                        "startTime" to JsonPath.stringAt("$$.Execution.StartTime")
+                    )
+                )
+            )
+            .payloadResponseOnly(true)
             .build()
-
-        val extractAudioTask = LambdaInvoke.Builder.create(this, "ExtractAudioTask")
-            .lambdaFunction(extractAudioLambda)
-            .outputPath("$.Payload")
+        val waitForSegments = Wait.Builder.create(this, "WaitForProcessedSegments")
+            .time(WaitTime.duration(Duration.seconds(5)))
             .build()
+            .next(finalizeIngestTask)
+        finalizeIngestTask.next(
+            Choice.Builder.create(this, "IngestCompleteChoice")
+                .build()
+                .`when`(Condition.booleanEquals("$.complete", true), postProcessingParallel)
+                .otherwise(waitForSegments)
+        )
 
-        val extractAudioChoice = Choice.Builder.create(this, "ExtractAudioChoice")
+        val ingestModeChoice = Choice.Builder.create(this, "IngestModeChoice")
             .build()
-            .`when`(Condition.booleanEquals("$.extractAudio", true), extractAudioTask)
-            .afterwards(AfterwardsOptions.builder().includeOtherwise(true).build())
-            .next(Pass.Builder.create(this, "OtherwiseNothing").build())
+            .`when`(isStreamed(), finalizeIngestTask)
+            .otherwise(preprocessingTask)
 
         val processingParallel = Parallel.Builder.create(this, "ProcessingParallel")
             .build()
-            .branch(extractMetadataTask)
-            .branch(extractAudioChoice)
-            .branch(preprocessingTask)
+            .branch(ingestModeChoice)
             .addCatch(terminateTask, CatchProps.builder().resultPath("$.error").build())
             .next(terminateTask)
 
@@ -417,31 +602,22 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
             .addCatch(terminateTask, CatchProps.builder().resultPath("$.error").build())
             .next(processingParallel)
 
+        // a streaming ingest has no original video to probe
+        val startChoice = Choice.Builder.create(this, "StartChoice")
+            .build()
+            .`when`(isStreamed(), processingParallel)
+            .otherwise(jobProbeTask)
+
         val logGroup = LogGroup.Builder.create(this, "VideoProcessingLogGroup")
             .build()
 
         // Create IAM Role for Step Function
         val role = Role.Builder.create(this, "VideoProcessingStepFuncRole")
             .assumedBy(ServicePrincipal.Builder.create("states.amazonaws.com").build())
-            .inlinePolicies(
-                Collections.singletonMap(
-                    "DetectLabelsPolicy",
-                    PolicyDocument.Builder.create()
-                        .statements(
-                            listOf(
-                                PolicyStatement.Builder.create()
-                                    .resources(listOf("*"))
-                                    .actions(listOf("rekognition:DetectLabels"))
-                                    .build()
-                            )
-                        )
-                        .build()
-                )
-            )
             .build()
 
         val statemachine = StateMachine.Builder.create(this, "VideoProcessingStateMachine")
-            .definitionBody(DefinitionBody.fromChainable(jobProbeTask))
+            .definitionBody(DefinitionBody.fromChainable(startChoice))
             .logs(
                 LogOptions.builder().destination(logGroup).level(LogLevel.ALL).build()
             )
@@ -454,6 +630,10 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
         return statemachine
     }
 
+    /** Whether the execution was started by a streaming ingest (see trigger_segment_processing). */
+    private fun isStreamed(): Condition =
+        Condition.and(Condition.isPresent("$.streamed"), Condition.booleanEquals("$.streamed", true))
+
     /**
      * Configures and adds all endpoints to the Rest API.
      */
@@ -475,6 +655,20 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
                 .suffix("original.mp4")
                 .build()
         )
+
+        // segments of a streaming ingest are processed as soon as they are uploaded,
+        // the suffix must not match the processed chunks, otherwise they would trigger themselves
+        videoProcessingStateMachine.grantStartExecution(triggerSegmentProcessingLambda)
+        processChunkLambda.grantInvoke(triggerSegmentProcessingLambda)
+        for (extension in listOf("ts", "mp4")) {
+            jobsBucket.addEventNotification(
+                EventType.OBJECT_CREATED,
+                LambdaDestination(triggerSegmentProcessingLambda),
+                NotificationKeyFilter.builder()
+                    .suffix(".ingest.$extension")
+                    .build()
+            )
+        }
     }
 
     /**
@@ -483,24 +677,63 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
     private fun grantPermissions() {
         jobsBucket.grantWrite(postJobLambda)
         jobsBucket.grantReadWrite(jobProbeLambda)
-        jobsBucket.grantReadWrite(extractAudioLambda)
+        jobsBucket.grantReadWrite(processAudioLambda)
+        jobsBucket.grantReadWrite(extractMetadataLambda)
         jobsBucket.grantReadWrite(preprocessLambda)
         jobsBucket.grantReadWrite(processChunkLambda)
         jobsBucket.grantReadWrite(reduceChunksLambda)
+        jobsBucket.grantReadWrite(reduceIncrementalLambda)
+        jobsBucket.grantReadWrite(aggregateUnitsLambda)
+        jobsBucket.grantReadWrite(finalizeIngestLambda)
         jobsBucket.grantReadWrite(cleanupLambda)
         jobsBucket.grantReadWrite(terminateLambda)
         jobsBucket.grantReadWrite(generateThumbnailLambda)
+        jobsBucket.grantRead(extractLabelsLambda)
         jobsBucket.grantReadWrite(benchmarkLambda)
         jobsTable.grantWriteData(postJobLambda)
         jobsTable.grantReadWriteData(jobProbeLambda)
         jobsTable.grantReadWriteData(preprocessLambda)
         jobsTable.grantReadWriteData(processChunkLambda)
+        jobsTable.grantReadWriteData(extractMetadataLambda)
+        jobsTable.grantReadWriteData(extractLabelsLambda)
         jobsTable.grantReadWriteData(reduceChunksLambda)
+        jobsTable.grantReadData(reduceIncrementalLambda)
+        jobsTable.grantReadData(finalizeIngestLambda)
+        jobsTable.grantReadWriteData(triggerSegmentProcessingLambda)
+        jobsTable.grantReadData(processAudioLambda)
         jobsTable.grantReadWriteData(cleanupLambda)
         jobsTable.grantReadWriteData(terminateLambda)
         jobsTable.grantReadWriteData(connectWsLambda)
         jobsTable.grantReadWriteData(disconnectWsLambda)
         websocketApi.grantManageConnections(terminateLambda)
+        // progress events are pushed while processing
+        websocketApi.grantManageConnections(preprocessLambda)
+        websocketApi.grantManageConnections(processChunkLambda)
+        websocketApi.grantManageConnections(reduceChunksLambda)
+        // split ingested segments are continued by invoking the function itself (by name, to avoid a cyclic reference)
+        processChunkLambda.addToRolePolicy(
+            PolicyStatement.Builder.create()
+                .resources(
+                    listOf(
+                        formatArn(
+                            ArnComponents.builder()
+                                .service("lambda")
+                                .resource("function")
+                                .resourceName("${PREFIX}process-chunk")
+                                .arnFormat(ArnFormat.COLON_RESOURCE_NAME)
+                                .build()
+                        )
+                    )
+                )
+                .actions(listOf("lambda:InvokeFunction"))
+                .build()
+        )
+        extractLabelsLambda.addToRolePolicy(
+            PolicyStatement.Builder.create()
+                .resources(listOf("*"))
+                .actions(listOf("rekognition:DetectLabels"))
+                .build()
+        )
     }
 
     /**
@@ -536,5 +769,10 @@ class ThetaTrimStack @JvmOverloads constructor(val scope: Construct?, id: String
          * Prefix of all resource names.
          */
         private const val PREFIX = "thetatrim-"
+
+        /**
+         * Key prefix of the results written by the distributed chunk map.
+         */
+        private const val MAP_RESULTS_PREFIX = "map-results"
     }
 }
\ No newline at end of file
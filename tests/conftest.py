@@ -0,0 +1,37 @@
+import os
+import sys
+
+import boto3
+# moto must be imported before the lambdas create their clients (at import)
+import moto
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# the lambdas import the common layer as `utils` and are deployed without a package structure
+for path in ('lambdas/common_layer', 'lambdas/ffmpeg_layer/python', 'lambdas/video_processing'):
+  sys.path.insert(0, os.path.join(ROOT, path))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('JOB_TABLE_NAME', 'jobs')
+os.environ.setdefault('OBJECT_BUCKET_NAME', 'objects')
+os.environ.setdefault('LABEL_PROVIDER', 'fake')
+
+
+@pytest.fixture
+def aws():
+  """
+  Mocked AWS services with the object bucket and the job table of the stack.
+  """
+  with moto.mock_aws():
+    boto3.client('s3').create_bucket(Bucket=os.environ['OBJECT_BUCKET_NAME'])
+    boto3.client('dynamodb').create_table(
+      TableName=os.environ['JOB_TABLE_NAME'],
+      KeySchema=[{'AttributeName': 'PK', 'KeyType': 'HASH'}, {'AttributeName': 'SK', 'KeyType': 'RANGE'}],
+      AttributeDefinitions=[{'AttributeName': 'PK', 'AttributeType': 'S'},
+                            {'AttributeName': 'SK', 'AttributeType': 'S'}],
+      BillingMode='PAY_PER_REQUEST'
+    )
+    yield
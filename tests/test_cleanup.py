@@ -0,0 +1,110 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+
+import cleanup
+from utils import constants
+from utils import utils
+
+BUCKET = os.environ['OBJECT_BUCKET_NAME']
+JOB_ID = 'job'
+PREFIXES = ['CHUNKS', 'PROCESSED', 'REFIMGS']
+
+
+@pytest.fixture
+def delete_calls(aws, monkeypatch):
+  """
+  Records the keys of each delete_objects request.
+  """
+  calls = []
+  delete_objects = cleanup.s3_client.delete_objects
+
+  def record_delete(**kwargs):
+    calls.append([o['Key'] for o in kwargs['Delete']['Objects']])
+    return delete_objects(**kwargs)
+
+  monkeypatch.setattr(cleanup.s3_client, 'delete_objects', record_delete)
+  monkeypatch.setattr(cleanup.time, 'sleep', lambda secs: None)
+  return calls
+
+
+def put_objects(keys: list[str]):
+  s3_client = boto3.client('s3')
+  with ThreadPoolExecutor(max_workers=16) as executor:
+    list(executor.map(lambda key: s3_client.put_object(Bucket=BUCKET, Key=key, Body=b''), keys))
+
+
+def list_keys(prefix: str) -> list[str]:
+  paginator = boto3.client('s3').get_paginator('list_objects_v2')
+  return [o['Key'] for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix) for o in page.get('Contents', [])]
+
+
+def test_delete_chunks_of_large_job(delete_calls):
+  keys = [f"{JOB_ID}/{prefix}/{i:05d}.mp4" for prefix in PREFIXES for i in range(3334)]
+  put_objects(keys + [f"{JOB_ID}/original.mp4", f"{JOB_ID}-other/CHUNKS/00000.mp4"])
+
+  cleanup.delete_chunks(JOB_ID)
+
+  for prefix in PREFIXES:
+    assert list_keys(f"{JOB_ID}/{prefix}/") == []
+  assert len(delete_calls) >= 10
+  assert all(len(batch) <= cleanup.DELETE_BATCH_SIZE for batch in delete_calls)
+  assert sorted(key for batch in delete_calls for key in batch) == sorted(keys)
+  # other objects of the job and other jobs are kept
+  assert list_keys(f"{JOB_ID}/original.mp4") == [f"{JOB_ID}/original.mp4"]
+  assert list_keys(f"{JOB_ID}-other/") == [f"{JOB_ID}-other/CHUNKS/00000.mp4"]
+
+
+def test_delete_batch_retries_failed_keys(delete_calls, monkeypatch):
+  keys = [f"{JOB_ID}/CHUNKS/{i:05d}.mp4" for i in range(10)]
+  put_objects(keys)
+
+  # the first request only deletes the first half of the keys, the others fail
+  record_delete = cleanup.s3_client.delete_objects
+
+  def partially_delete(**kwargs):
+    if delete_calls:
+      return record_delete(**kwargs)
+    objects = kwargs['Delete']['Objects']
+    record_delete(**{**kwargs, 'Delete': {'Objects': objects[:5], 'Quiet': True}})
+    delete_calls[0] = [o['Key'] for o in objects]  # the requested keys, not only the deleted ones
+    return {'Errors': [{'Key': o['Key'], 'Code': 'SlowDown'} for o in objects[5:]]}
+
+  monkeypatch.setattr(cleanup.s3_client, 'delete_objects', partially_delete)
+
+  assert cleanup.delete_batch(keys) == len(keys)
+  assert delete_calls == [keys, keys[5:]]
+  assert list_keys(f"{JOB_ID}/CHUNKS/") == []
+
+
+def test_delete_batch_gives_up_after_max_attempts(delete_calls, monkeypatch):
+  keys = [f"{JOB_ID}/CHUNKS/{i:05d}.mp4" for i in range(3)]
+
+  def fail_delete(**kwargs):
+    delete_calls.append([o['Key'] for o in kwargs['Delete']['Objects']])
+    return {'Errors': [{'Key': keys[0], 'Code': 'InternalError'}]}
+
+  monkeypatch.setattr(cleanup.s3_client, 'delete_objects', fail_delete)
+
+  with pytest.raises(utils.InternalError):
+    cleanup.delete_batch(keys)
+  assert len(delete_calls) == constants.MAX_DELETE_ATTEMPTS
+  assert delete_calls[1:] == [[keys[0]]] * (constants.MAX_DELETE_ATTEMPTS - 1)
+
+
+@pytest.mark.parametrize('transformations, error, kept', [
+  ([], None, []),
+  ([{'operation': 'exaudio'}], None, ['AUDIO.aac']),
+  ([{'operation': 'exaudio'}, {'operation': 'acodec', 'opts': 'mp3'}], None, ['AUDIO_TRACK.mp3']),
+  ([{'operation': 'exaudio'}], {'Error': 'FFmpegError'}, []),
+])
+def test_delete_intermediate_audio(delete_calls, transformations, error, kept):
+  boto3.resource('dynamodb').Table(os.environ['JOB_TABLE_NAME']).put_item(
+    Item={'PK': f"JOB#{JOB_ID}", 'SK': "DATA", 'transformations': transformations})
+  put_objects([f"{JOB_ID}/AUDIO.aac", f"{JOB_ID}/AUDIO_TRACK.mp3", f"{JOB_ID}/RESULT.mp4"])
+
+  cleanup.handler({'jobId': JOB_ID, 'error': error}, None)
+
+  assert list_keys(f"{JOB_ID}/") == sorted([f"{JOB_ID}/RESULT.mp4"] + [f"{JOB_ID}/{key}" for key in kept])
@@ -0,0 +1,168 @@
+import os
+
+import boto3
+import pytest
+
+import extract_labels
+from utils import constants
+from utils import manifest
+from utils.fake_rekognition import FakeRekognitionClient
+
+BUCKET = os.environ['OBJECT_BUCKET_NAME']
+JOB_ID = 'job'
+
+
+@pytest.fixture(autouse=True)
+def fake_rekognition(monkeypatch):
+  monkeypatch.setattr(extract_labels, 'rekognition_client', FakeRekognitionClient())
+  monkeypatch.setattr(extract_labels, 'REKOGNITION_TPS', 1000)
+  manifest.load_manifest.cache_clear()
+
+
+@pytest.fixture
+def updates(aws, monkeypatch):
+  """
+  Records the updates of the job entry.
+  """
+  calls = []
+  update_item = extract_labels.job_table.update_item
+
+  def record_update(**kwargs):
+    calls.append(kwargs)
+    return update_item(**kwargs)
+
+  monkeypatch.setattr(extract_labels.job_table, 'update_item', record_update)
+  return calls
+
+
+def processed_chunk(index: int, score: float, duration: float = 10.0, part: int = 0) -> dict:
+  name = f"{index:05d}-part{part}" if part else f"{index:05d}"
+  return {
+    'key': f"{JOB_ID}/PROCESSED/{name}.mp4",
+    'index': index,
+    'part': part,
+    'refimg_key': f"{JOB_ID}/REFIMGS/{name}.jpg",
+    'refimg_score': score,
+    'metadata': {'duration': duration}
+  }
+
+
+def labels(*names: str) -> dict:
+  return {'Labels': [{'Name': name, 'Confidence': 95.0} for name in names]}
+
+
+def create_job(processed_chunks: list[dict], durations: list[float] | None = None):
+  """
+  Creates the job entry, the processed chunks and (if durations are given) the chunk manifest.
+  """
+  chunk_count = len({c['index'] for c in processed_chunks})
+  boto3.resource('dynamodb').Table(os.environ['JOB_TABLE_NAME']).put_item(Item={
+    'PK': f"JOB#{JOB_ID}",
+    'SK': "DATA",
+    'chunks': {'length': chunk_count, 'done': chunk_count, 'items': [{'labels': []}] * chunk_count}
+  })
+  manifest.store_processed_chunks(BUCKET, JOB_ID, processed_chunks)
+
+  if durations is not None:
+    offsets = [sum(durations[:i]) for i in range(len(durations))]
+    chunks = [{'key': f"{JOB_ID}/CHUNKS/CHUNK-{i}.mp4", 'size': 1, 'offset': offset, 'duration': duration}
+              for i, (offset, duration) in enumerate(zip(offsets, durations))]
+    manifest.write_manifest(BUCKET, JOB_ID, 'mp4', chunks, [{'start': 0, 'end': len(chunks)}])
+
+
+def get_job() -> dict:
+  table = boto3.resource('dynamodb').Table(os.environ['JOB_TABLE_NAME'])
+  return table.get_item(Key={'PK': f"JOB#{JOB_ID}", 'SK': "DATA"})['Item']
+
+
+def expected_labels(refimg_key: str) -> list[str]:
+  response = FakeRekognitionClient().detect_labels(Image={'S3Object': {'Name': refimg_key}}, MinConfidence=90)
+  return [label['Name'] for label in response['Labels']]
+
+
+def test_label_index_joins_consecutive_chunks():
+  times = {i: (i * 10.0, (i + 1) * 10.0) for i in range(5)}
+  chunk_labels = dict(enumerate([labels('Person'), labels('Person', 'Face'), labels(), labels('Person'),
+                                 labels('Face')]))
+
+  index = extract_labels.build_label_index(times, chunk_labels)
+
+  assert index == {
+    'Person': [[0.0, 20.0], [30.0, 40.0]],
+    'Face': [[10.0, 20.0], [40.0, 50.0]],
+  }
+
+
+def test_chunk_times_are_read_from_the_manifest(aws):
+  # the durations of the processed chunks drift from the offsets of the manifest
+  chunks = [processed_chunk(i, 0, duration=10.04) for i in range(3)]
+  create_job(chunks, durations=[10.0, 9.5, 10.0])
+
+  assert extract_labels.get_chunk_times(JOB_ID, chunks) == {0: (0.0, 10.0), 1: (10.0, 19.5), 2: (19.5, 29.5)}
+
+
+def test_chunk_times_of_ingested_segments(aws):
+  # ingested segments have no manifest, the parts of a split segment extend its range
+  chunks = [processed_chunk(0, 0, duration=4.0), processed_chunk(1, 0, duration=3.0),
+            processed_chunk(1, 0, duration=2.5, part=1), processed_chunk(2, 0, duration=4.0)]
+  create_job(chunks)
+
+  assert extract_labels.get_chunk_times(JOB_ID, chunks) == {0: (0.0, 4.0), 1: (4.0, 9.5), 2: (9.5, 13.5)}
+
+
+def test_labels_of_all_chunks_are_stored_in_batches(updates, monkeypatch):
+  monkeypatch.setattr(constants, 'LABEL_BATCH_SIZE', 4)
+  count = 10
+  chunks = [processed_chunk(i, score=i % 4) for i in range(count)]
+  create_job(chunks, durations=[10.0] * count)
+
+  result = extract_labels.handler({'jobId': JOB_ID}, None)
+
+  # a single update per batch, the label index is stored last
+  chunk_updates, index_update = updates[:-1], updates[-1]
+  assert len(chunk_updates) == 3
+  assert [u['UpdateExpression'].count('chunks.#items') for u in chunk_updates] == [4, 4, 2]
+  assert chunk_updates[0]['UpdateExpression'] == 'SET ' + ', '.join(
+    f"chunks.#items[{i}].#labels = :l{i}" for i in range(4))
+  assert index_update['UpdateExpression'] == 'SET labelIndex = :index, #labels = :labels'
+
+  job = get_job()
+  for index, item in enumerate(job['chunks']['items']):
+    assert [label['name'] for label in item['labels']] == expected_labels(chunks[index]['refimg_key'])
+
+  detected = {name for chunk in chunks for name in expected_labels(chunk['refimg_key'])}
+  assert set(job['labelIndex']) == detected
+  assert job['labels'] == ",".join(sorted(detected))
+
+  # the best scored reference images are the thumbnail candidates
+  assert len(result) == constants.THUMBNAIL_CANDIDATES
+  assert sorted(r['refimg_score'] for r in result) == [1, 2, 2, 3, 3]
+
+
+def test_store_labels_of_split_chunks(updates):
+  # chunk 1 was split into three parts and chunk 3 into two
+  chunks = [
+    processed_chunk(0, 0.1),
+    processed_chunk(1, 0.9, duration=4.0), processed_chunk(1, 0.8, duration=4.0, part=1),
+    processed_chunk(1, 0.7, duration=2.0, part=2),
+    processed_chunk(2, 0.2),
+    processed_chunk(3, 0.3, duration=6.0), processed_chunk(3, 0.6, duration=4.0, part=1),
+  ] + [processed_chunk(i, 0.05) for i in range(4, 10)]
+  create_job(chunks, durations=[10.0] * 10)
+
+  result = extract_labels.handler({'jobId': JOB_ID}, None)
+
+  # the best part of each chunk is evaluated, one candidate per chunk
+  assert [(r['index'], r['refimg_key']) for r in result] == [
+    (0, f"{JOB_ID}/REFIMGS/00000.jpg"),
+    (1, f"{JOB_ID}/REFIMGS/00001.jpg"),
+    (2, f"{JOB_ID}/REFIMGS/00002.jpg"),
+    (3, f"{JOB_ID}/REFIMGS/00003-part1.jpg"),
+    (4, f"{JOB_ID}/REFIMGS/00004.jpg"),
+  ]
+
+  items = get_job()['chunks']['items']
+  assert len(items) == 10
+  best_parts = [chunks[i]['refimg_key'] for i in extract_labels.select_best_parts(chunks)]
+  for index, item in enumerate(items):
+    assert [label['name'] for label in item['labels']] == expected_labels(best_parts[index])
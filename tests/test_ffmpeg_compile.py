@@ -0,0 +1,103 @@
+import sys
+
+import ffmpeg
+import ffmpeg._run
+import pytest
+
+
+def recursive_topo_sort(downstream_nodes):
+  """
+  The recursive depth-first search the vendored ffmpeg-python used before topo_sort became iterative,
+  kept as the reference of the node and edge order.
+  """
+  marked_nodes = []
+  sorted_nodes = []
+  outgoing_edge_maps = {}
+
+  def visit(upstream_node, upstream_label, downstream_node, downstream_label, downstream_selector=None):
+    if upstream_node in marked_nodes:
+      raise RuntimeError('Graph is not a DAG')
+
+    if downstream_node is not None:
+      outgoing_edge_map = outgoing_edge_maps.get(upstream_node, {})
+      outgoing_edge_infos = outgoing_edge_map.get(upstream_label, [])
+      outgoing_edge_infos += [(downstream_node, downstream_label, downstream_selector)]
+      outgoing_edge_map[upstream_label] = outgoing_edge_infos
+      outgoing_edge_maps[upstream_node] = outgoing_edge_map
+
+    if upstream_node not in sorted_nodes:
+      marked_nodes.append(upstream_node)
+      for edge in upstream_node.incoming_edges:
+        visit(edge.upstream_node, edge.upstream_label, edge.downstream_node, edge.downstream_label,
+              edge.upstream_selector)
+      marked_nodes.remove(upstream_node)
+      sorted_nodes.append(upstream_node)
+
+  unmarked_nodes = [(node, None) for node in downstream_nodes]
+  while unmarked_nodes:
+    upstream_node, upstream_label = unmarked_nodes.pop()
+    visit(upstream_node, upstream_label, None, None)
+  return sorted_nodes, outgoing_edge_maps
+
+
+def reference_args(graph, monkeypatch) -> list[str]:
+  with monkeypatch.context() as m:
+    m.setattr(ffmpeg._run, 'topo_sort', recursive_topo_sort)
+    return graph.get_args()
+
+
+def multi_input_graph():
+  """
+  Split, overlay and concat over several inputs with several outputs, similar to the chunk command.
+  """
+  main = ffmpeg.input('main.mp4')
+  logo = ffmpeg.input('logo.png')
+  intro = ffmpeg.input('intro.mp4')
+
+  split = main.video.filter('scale', 640, 360).split()
+  overlaid = split[0].overlay(logo.video.filter('scale', 64, -1), x=10, y=10)
+  joined = ffmpeg.concat(intro.video, intro.audio, overlaid, main.audio, v=1, a=1).node
+  thumbnails = split[1].filter('select', 'gt(scene,0.3)').filter('scale', 160, 90)
+
+  return ffmpeg.merge_outputs(
+    ffmpeg.output(joined[0], joined[1], 'out.mp4', vcodec='libx264'),
+    ffmpeg.output(thumbnails, 'thumb-%03d.jpg', vsync='vfr'),
+    ffmpeg.output(main.audio.filter('silencedetect', d=0.5), '-', f='null'),
+  ).global_args('-nostdin')
+
+
+def test_multi_input_graph_compiles_like_the_recursive_sort(monkeypatch):
+  graph = multi_input_graph()
+
+  args = graph.get_args()
+
+  assert args == reference_args(graph, monkeypatch)
+  assert sorted(args[1:6:2]) == ['intro.mp4', 'logo.png', 'main.mp4']
+  assert args.count('-map') == 4
+
+
+@pytest.mark.parametrize('inputs', [1, 5])
+def test_overlay_chain_compiles_like_the_recursive_sort(inputs, monkeypatch):
+  stream = ffmpeg.input('base.mp4').video
+  for i in range(inputs):
+    stream = stream.overlay(ffmpeg.input(f'in-{i}.mp4').video, x=i, y=i)
+  graph = ffmpeg.output(stream, 'out.mp4')
+
+  assert graph.get_args() == reference_args(graph, monkeypatch)
+
+
+def test_chain_deeper_than_the_recursion_limit_compiles(monkeypatch):
+  depth = sys.getrecursionlimit() + 500
+  stream = ffmpeg.input('in.mp4').video
+  for i in range(depth):
+    stream = stream.filter('eq', brightness=(i % 10) / 100)
+  graph = ffmpeg.output(stream, 'out.mp4')
+
+  args = graph.get_args()
+
+  with pytest.raises(RecursionError):
+    reference_args(graph, monkeypatch)
+
+  filter_arg = args[args.index('-filter_complex') + 1]
+  assert filter_arg.count('eq=') == depth
+  assert args[-1] == 'out.mp4'
@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+import os
+import signal
+import sys
+import textwrap
+import time
+
+import pytest
+
+from utils import ffmpeg_runner
+from utils import utils
+
+# stands in for ffmpeg: writes its pid next to itself, reports progress, writes stdout_bytes to stdout
+# (endless if negative), sleeps sleep_secs and exits with exit_code.
+# Like ffmpeg, it finishes its outputs on SIGTERM, unless on_sigterm is 'ignore'.
+FAKE_FFMPEG = textwrap.dedent('''
+  import os, signal, sys, time
+  progress = os.fdopen(int(sys.argv[2].split(':')[1]), 'w')
+
+  def finish(signum, frame):
+    progress.write("out_time_us=1500000\\nprogress=end\\n")
+    progress.flush()
+    sys.exit(255)
+
+  signal.signal(signal.SIGTERM, signal.SIG_IGN if settings['on_sigterm'] == 'ignore' else finish)
+  with open(sys.argv[0] + '.pid', 'w') as f:
+    f.write(str(os.getpid()))
+  progress.write("out_time_us=1000000\\nprogress=continue\\n")
+  progress.flush()
+  size = settings['stdout_bytes']
+  written = 0
+  while size < 0 or written < size:
+    block = b'x' * min(65536, size - written if size >= 0 else 65536)
+    sys.stdout.buffer.write(block)
+    written += len(block)
+  sys.stdout.flush()
+  time.sleep(settings['sleep_secs'])
+  progress.write("out_time_us=2000000\\nprogress=end\\n")
+  sys.stderr.write("fake log\\n")
+  sys.exit(settings['exit_code'])
+''')
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+  count = itertools.count()
+
+  def command(stdout_bytes: int, exit_code: int = 0, sleep_secs: float = 0, on_sigterm: str = 'finish') -> list[str]:
+    # a script per command, so concurrent commands can differ
+    settings = dict(stdout_bytes=stdout_bytes, exit_code=exit_code, sleep_secs=sleep_secs, on_sigterm=on_sigterm)
+    path = tmp_path / f"ffmpeg-{next(count)}"
+    path.write_text(f"#!{sys.executable}\nsettings = {settings!r}\n{FAKE_FFMPEG}")
+    path.chmod(0o755)
+    return [str(path), '-i', 'in.mp4', 'pipe:1']
+
+  return command
+
+
+def test_captures_stdout_and_progress(fake_ffmpeg):
+  blocks = []
+  result = ffmpeg_runner.run_sync(fake_ffmpeg(1000), on_progress=blocks.append)
+
+  assert result.stdout == b'x' * 1000
+  assert result.log == "fake log\n"
+  assert result.out_time == 2.0
+  assert [b['progress'] for b in blocks] == ['continue', 'end']
+
+
+def test_streams_stdout(fake_ffmpeg):
+  received = []
+  result = ffmpeg_runner.run_sync(fake_ffmpeg(10 * 1024 * 1024),
+                                  on_stdout=lambda stream: received.append(stream.read()))
+
+  assert received == [b'x' * 10 * 1024 * 1024]
+  assert result.stdout == b''
+
+
+def test_kills_ffmpeg_if_stdout_consumer_fails(fake_ffmpeg):
+  def fail(stream):
+    stream.read(1024)
+    raise RuntimeError("upload failed")
+
+  start = time.monotonic()
+  # ffmpeg writes endlessly, it would block on the full pipe if it was not killed
+  with pytest.raises(RuntimeError, match="upload failed"):
+    ffmpeg_runner.run_sync(fake_ffmpeg(-1), on_stdout=fail)
+  assert time.monotonic() - start < 10
+
+
+def test_raises_on_failure(fake_ffmpeg):
+  with pytest.raises(utils.FFmpegError):
+    ffmpeg_runner.run_sync(fake_ffmpeg(0, exit_code=1), on_stdout=lambda stream: stream.read())
+
+  result = ffmpeg_runner.run_sync(fake_ffmpeg(0, exit_code=1), check=False)
+  assert result.returncode == 1
+
+
+def is_running(command: list[str]) -> bool:
+  with open(command[0] + '.pid') as f:
+    pid = int(f.read())
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  return True
+
+
+def test_stops_ffmpeg_at_the_deadline(fake_ffmpeg):
+  start = time.monotonic()
+  with pytest.raises(ffmpeg_runner.FFmpegDeadlineError) as e:
+    ffmpeg_runner.run_sync(fake_ffmpeg(0, sleep_secs=30), deadline=time.monotonic() + 0.5)
+
+  # ffmpeg was terminated and finished its outputs, the result holds its last progress
+  assert time.monotonic() - start < 5
+  assert e.value.result.returncode == 255
+  assert e.value.result.out_time == 1.5
+
+
+def test_kills_ffmpeg_if_it_ignores_the_termination(fake_ffmpeg, monkeypatch):
+  monkeypatch.setattr(ffmpeg_runner.constants, 'FFMPEG_KILL_GRACE_SECS', 0.5)
+
+  start = time.monotonic()
+  with pytest.raises(ffmpeg_runner.FFmpegDeadlineError) as e:
+    ffmpeg_runner.run_sync(fake_ffmpeg(0, sleep_secs=30, on_sigterm='ignore'), deadline=time.monotonic() + 0.5)
+
+  assert 1 <= time.monotonic() - start < 5
+  assert e.value.result.returncode == -signal.SIGKILL
+  assert e.value.result.out_time == 1.0
+
+
+def test_terminates_ffmpeg_if_cancelled(fake_ffmpeg):
+  command = fake_ffmpeg(0, sleep_secs=30)
+
+  async def cancel():
+    task = asyncio.ensure_future(ffmpeg_runner.run(command))
+    await asyncio.sleep(0.5)
+    task.cancel()
+    await task
+
+  with pytest.raises(asyncio.CancelledError):
+    asyncio.run(cancel())
+  assert not is_running(command)
+
+
+def test_failure_cancels_concurrent_ffmpeg_processes(fake_ffmpeg):
+  running = fake_ffmpeg(0, sleep_secs=30)
+
+  async def run_both():
+    async with asyncio.TaskGroup() as group:
+      group.create_task(ffmpeg_runner.run(running))
+      group.create_task(ffmpeg_runner.run(fake_ffmpeg(0, exit_code=1, sleep_secs=0.5)))
+
+  start = time.monotonic()
+  with pytest.raises(ExceptionGroup) as e:
+    asyncio.run(run_both())
+
+  assert e.group_contains(utils.FFmpegError)
+  assert time.monotonic() - start < 5
+  assert not is_running(running)
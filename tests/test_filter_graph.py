@@ -0,0 +1,39 @@
+import pytest
+
+from utils import config_utils
+from utils import filter_graph
+from utils import utils
+
+
+def create_filters(*operations: tuple[str, str | None]) -> list[filter_graph.VideoFilter]:
+  config = config_utils.Config([{'operation': op, 'opts': opts} for op, opts in operations])
+  return filter_graph.create_video_filters(config)
+
+
+@pytest.mark.parametrize('opts', ['640 360', '640 360 10 20'])
+def test_resize_accepts_the_options_of_the_config(opts):
+  resize, = create_filters(('resize', opts))
+  assert (resize.width, resize.height) == (640, 360)
+
+
+def test_crop_uses_the_position_of_the_config():
+  centered, = create_filters(('crop', '640 360'))
+  positioned, = create_filters(('crop', '640 360 10 20'))
+
+  assert (centered.x, centered.y) == ('(in_w-out_w)/2', '(in_h-out_h)/2')
+  assert (positioned.x, positioned.y) == (10, 20)
+
+
+@pytest.mark.parametrize('operation', [('resize', '640'), ('resize', '0 360'), ('crop', '640 360 -1 0'),
+                                       ('brightness', '2')])
+def test_invalid_filter_options_are_rejected(operation):
+  with pytest.raises(utils.ConfigError):
+    create_filters(operation)
+
+
+def test_video_filters_must_implement_apply():
+  class Incomplete(filter_graph.VideoFilter):
+    pass
+
+  with pytest.raises(TypeError):
+    Incomplete()
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+import extract_labels
+from utils import constants
+from utils import utils
+from utils.fake_rekognition import FakeRekognitionClient
+from utils.rate_limit import TokenBucket
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+  monkeypatch.setattr(extract_labels.random, 'uniform', lambda a, b: 0.0)
+
+
+def test_fake_provider_is_used():
+  assert isinstance(extract_labels.rekognition_client, FakeRekognitionClient)
+
+
+def test_token_bucket_limits_rate():
+  bucket = TokenBucket(rate=50, capacity=1)
+  start = time.monotonic()
+  for _ in range(11):
+    bucket.acquire()
+  # the first token is available immediately, the others at 50 TPS
+  assert time.monotonic() - start >= 0.18
+
+
+def test_token_bucket_throttle_and_recover():
+  bucket = TokenBucket(rate=8, min_rate=1)
+
+  bucket.throttle()
+  assert bucket.rate == 4
+  for _ in range(5):
+    bucket.throttle()
+  assert bucket.rate == 1
+  assert not bucket.try_acquire()
+
+  for _ in range(5):
+    bucket.recover()
+  assert bucket.rate == pytest.approx(5)
+  for _ in range(10):
+    bucket.recover()
+  assert bucket.rate == 8
+
+
+def test_detect_labels_retries_throttled_requests(no_backoff):
+  client = FakeRekognitionClient(throttle_every=2)
+  bucket = TokenBucket(rate=1000)
+
+  first = extract_labels.detect_labels(client, 'job/REFIMGS/00000.jpg', bucket)
+  assert bucket.rate == 1000
+  # the second request is throttled, the retry succeeds and the rate recovers partially
+  second = extract_labels.detect_labels(client, 'job/REFIMGS/00000.jpg', bucket)
+
+  assert client.calls == 3
+  assert first == second
+  assert bucket.rate == pytest.approx(600)
+
+
+def test_detect_labels_gives_up_after_max_attempts(no_backoff):
+  client = FakeRekognitionClient(throttle_every=1)
+  bucket = TokenBucket(rate=1000, min_rate=100)
+
+  with pytest.raises(utils.InternalError):
+    extract_labels.detect_labels(client, 'job/REFIMGS/00000.jpg', bucket)
+
+  assert client.calls == constants.MAX_LABEL_ATTEMPTS
+  assert bucket.rate == 100
+
+
+def test_detect_all_labels_keeps_the_order(no_backoff):
+  client = FakeRekognitionClient(throttle_every=3)
+  keys = [f"job/REFIMGS/{i:05d}.jpg" for i in range(20)]
+
+  labels = extract_labels.detect_all_labels(client, keys, TokenBucket(rate=1000))
+
+  expected = [FakeRekognitionClient().detect_labels(Image={'S3Object': {'Name': key}}, MaxLabels=10, MinConfidence=90)
+              for key in keys]
+  assert labels == expected
@@ -0,0 +1,21 @@
+from utils import metadata_utils
+
+
+def chunk_metadata(black=(), silence=(), duration=10.0) -> dict:
+  return {'duration': duration, 'black': [list(i) for i in black], 'silence': [list(i) for i in silence],
+          'frames': 250, 'keyframes': 5, 'size': 1000, 'bitrate': 800, 'maxKeyframeSecs': 2.0,
+          'avgKeyframeSecs': 2.0, 'loudness': None}
+
+
+def test_summary_only_keeps_aggregates_of_intervals():
+  chunks = [chunk_metadata(black=[(0.0, 1.0)], silence=[(9.0, 10.0)])] + \
+           [chunk_metadata(black=[(2.0, 2.5), (5.0, 7.0)], silence=[(0.0, 0.5)]) for _ in range(1000)]
+  metadata = metadata_utils.merge_chunk_metadata(chunks)
+
+  summary = metadata_utils.summarize_metadata(metadata)
+
+  assert 'chunks' not in summary
+  assert summary['black'] == {'count': 2001, 'totalSecs': 2501.0, 'longestSecs': 2.0}
+  # the silence at the end of the first chunk is joined with the one at the start of the second
+  assert summary['silence'] == {'count': 1000, 'totalSecs': 501.0, 'longestSecs': 1.5}
+  assert summary['duration'] == metadata['duration'] == 10010.0
@@ -0,0 +1,40 @@
+from concurrent.futures import Future
+
+import pytest
+
+import preprocess
+
+
+def finished_ffmpeg() -> Future:
+  future = Future()
+  future.set_result(None)
+  return future
+
+
+@pytest.fixture
+def chunk_dir(tmp_path):
+  for i in range(3):
+    (tmp_path / f"CHUNK-{i}.mp4").write_bytes(b'chunk')
+  return tmp_path
+
+
+def test_watch_and_upload_uploads_chunks_in_order(chunk_dir, monkeypatch):
+  monkeypatch.setattr(preprocess, 'upload_to_s3', lambda path, key: (key, 5))
+  emitted = []
+
+  chunks = preprocess.watch_and_upload(str(chunk_dir), finished_ffmpeg(), "CHUNK-%d.mp4", 'job', emitted.append)
+
+  assert chunks == [(f"job/CHUNKS/CHUNK-{i}.mp4", 5) for i in range(3)]
+  assert emitted == [1, 2, 3]
+
+
+def test_watch_and_upload_fails_if_a_chunk_upload_fails(chunk_dir, monkeypatch):
+  def upload(path, key):
+    if key.endswith("CHUNK-1.mp4"):
+      raise RuntimeError("upload failed")
+    return key, 5
+
+  monkeypatch.setattr(preprocess, 'upload_to_s3', upload)
+
+  with pytest.raises(RuntimeError, match="upload failed"):
+    preprocess.watch_and_upload(str(chunk_dir), finished_ffmpeg(), "CHUNK-%d.mp4", 'job')
@@ -0,0 +1,18 @@
+import os
+
+import boto3
+
+from utils import probe_utils
+
+
+def test_probe_is_cached_in_the_job_item(aws):
+  table = boto3.resource('dynamodb').Table(os.environ['JOB_TABLE_NAME'])
+  table.put_item(Item={'PK': "JOB#job", 'SK': "DATA"})
+  video_info = {'width': 1920, 'height': 1080, 'duration': 12.5, 'fps': 29.97,
+                'audioStreams': [{'index': 1, 'codec': 'aac', 'channels': 2, 'language': None}]}
+
+  probe_utils.store_probe(table, 'job', video_info)
+  cached = probe_utils.get_job_probe(table, 'job')
+
+  assert float(cached['duration']) == 12.5
+  assert cached['audioStreams'][0]['codec'] == 'aac'
@@ -0,0 +1,133 @@
+import os
+
+import boto3
+import pytest
+
+import process_chunk
+from utils import chunk_tracking
+from utils import ffmpeg_runner
+from utils import manifest
+from utils import utils
+
+BUCKET = os.environ['OBJECT_BUCKET_NAME']
+JOB_ID = 'job'
+CHUNK_COUNT = 2
+
+
+class FakeFFmpeg:
+  """
+  Stands in for ffmpeg_runner.run_sync: writes the processed chunk and stops at the deadline
+  after the seconds given per chunk name (once per chunk, so its continuation finishes).
+  """
+
+  def __init__(self):
+    self.stops: dict[str, float] = {}
+    self.commands: list[list[str]] = []
+
+  def __call__(self, command: list[str], **kwargs) -> ffmpeg_runner.FFmpegResult:
+    self.commands.append(command)
+    outpath = next(arg for arg in command if arg.startswith('/tmp/out/'))
+    with open(outpath, 'wb') as f:
+      f.write(b'chunk')
+
+    name = next((name for name in self.stops if name in command[command.index('-i') + 1]), None)
+    if name is not None:
+      out_time = self.stops.pop(name)
+      result = ffmpeg_runner.FFmpegResult(255, b'', '', {'out_time_us': str(int(out_time * 1_000_000))})
+      raise ffmpeg_runner.FFmpegDeadlineError("ffmpeg exceeded its deadline", result)
+    return ffmpeg_runner.FFmpegResult(0, b'', '', {})
+
+  def seeks(self) -> list[str | None]:
+    return [c[c.index('-ss') + 1] if '-ss' in c else None for c in self.commands]
+
+
+@pytest.fixture
+def ffmpeg(aws, monkeypatch):
+  """
+  A job of CHUNK_COUNT chunks in a single work unit, processed by a fake ffmpeg.
+  """
+  boto3.resource('dynamodb').Table(os.environ['JOB_TABLE_NAME']).put_item(Item={
+    'PK': f"JOB#{JOB_ID}",
+    'SK': "DATA",
+    'transformations': [{'operation': 'resize', 'opts': '640 360'}],
+    'chunks': {'length': CHUNK_COUNT, 'done': 0}
+  })
+  chunks = [{'key': f"{JOB_ID}/CHUNKS/CHUNK-{i}.mp4", 'size': 1, 'offset': i * 10.0, 'duration': 10.0}
+            for i in range(CHUNK_COUNT)]
+  manifest.write_manifest(BUCKET, JOB_ID, 'mp4', chunks, [{'start': 0, 'end': CHUNK_COUNT}])
+  manifest.load_manifest.cache_clear()
+
+  fake = FakeFFmpeg()
+  monkeypatch.setattr(process_chunk.ffmpeg_runner, 'run_sync', fake)
+  monkeypatch.setattr(process_chunk.probe_utils, 'probe_chunk', lambda path: {'duration': 1.0})
+  monkeypatch.setattr(process_chunk, 'process_ref_image',
+                      lambda *args: [{'time': 0.0, 'score': 0.5, 'sceneScore': 0.0}])
+  return fake
+
+
+def unit_event():
+  return {
+    'jobId': JOB_ID,
+    'manifestKey': manifest.get_manifest_key(JOB_ID),
+    'unit': {'start': 0, 'end': CHUNK_COUNT}
+  }
+
+
+def stored_parts() -> list[tuple[int, int, str]]:
+  return [(c['index'], c['part'], c['key']) for c in manifest.load_unit_result(BUCKET, JOB_ID, 0)]
+
+
+def test_chunk_is_split_at_the_deadline(ffmpeg):
+  ffmpeg.stops['CHUNK-0'] = 4.0
+
+  response = process_chunk.handler(unit_event(), None)
+
+  # the processed prefix is kept, the rest continues from the stop time
+  continuation = response['continuation']
+  assert (continuation['jobId'], continuation['unitStart']) == (JOB_ID, 0)
+  assert [(c['index'], c['part'], c['seek']) for c in continuation['chunks']] == [(0, 1, 4.0)]
+  assert stored_parts() == [(0, 0, f"{JOB_ID}/PROCESSED/CHUNK-0.mp4"), (1, 0, f"{JOB_ID}/PROCESSED/CHUNK-1.mp4")]
+  # only the complete chunk is marked as done
+  assert chunk_tracking.get_chunk_status(process_chunk.job_table, JOB_ID) == (1, CHUNK_COUNT, {1})
+
+
+def test_continuation_is_merged_into_the_unit_result(ffmpeg):
+  ffmpeg.stops['CHUNK-0'] = 4.0
+  continuation = process_chunk.handler(unit_event(), None)['continuation']
+
+  response = process_chunk.handler(continuation, None)
+
+  assert 'continuation' not in response
+  assert ffmpeg.seeks()[-1] == "4.000000"
+  assert stored_parts() == [(0, 0, f"{JOB_ID}/PROCESSED/CHUNK-0.mp4"),
+                            (0, 1, f"{JOB_ID}/PROCESSED/CHUNK-0-part1.mp4"),
+                            (1, 0, f"{JOB_ID}/PROCESSED/CHUNK-1.mp4")]
+  assert chunk_tracking.get_chunk_status(process_chunk.job_table, JOB_ID) == (2, CHUNK_COUNT, {0, 1})
+  assert chunk_tracking.get_split_parts(process_chunk.job_table, JOB_ID) == {0: 2}
+
+
+def test_continuation_of_a_split_part_is_split_again(ffmpeg):
+  ffmpeg.stops['CHUNK-0'] = 4.0
+  continuation = process_chunk.handler(unit_event(), None)['continuation']
+  ffmpeg.stops['CHUNK-0'] = 3.0
+
+  continuation = process_chunk.handler(continuation, None)['continuation']
+
+  assert [(c['index'], c['part'], c['seek']) for c in continuation['chunks']] == [(0, 2, 7.0)]
+  assert chunk_tracking.get_split_parts(process_chunk.job_table, JOB_ID) == {}
+
+
+def test_chunk_without_progress_is_continued_whole(ffmpeg):
+  ffmpeg.stops['CHUNK-0'] = 0.5
+
+  continuation = process_chunk.handler(unit_event(), None)['continuation']
+
+  assert continuation['chunks'] == [manifest.load_manifest(BUCKET, manifest.get_manifest_key(JOB_ID)).chunk(0)]
+  assert [c['index'] for c in manifest.load_unit_result(BUCKET, JOB_ID, 0)] == [1]
+
+
+def test_unit_without_progress_fails(ffmpeg):
+  ffmpeg.stops.update({'CHUNK-0': 0.5, 'CHUNK-1': 0.2})
+
+  with pytest.raises(utils.InternalError):
+    process_chunk.handler(unit_event(), None)
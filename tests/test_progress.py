@@ -0,0 +1,56 @@
+import os
+import time
+
+import boto3
+import pytest
+
+from utils import progress
+
+JOB_ID = 'job'
+
+
+@pytest.fixture
+def sent(aws, monkeypatch):
+  """
+  Records the events that are sent to the websocket clients.
+  """
+  events = []
+  monkeypatch.setenv('WS_URL', 'https://example.com')
+  monkeypatch.setattr(progress.ws_utils, 'broadcast', lambda client, table, job_id, event: events.append(event))
+  monkeypatch.setattr(progress, '_get_websocket_client', lambda: None)
+  return events
+
+
+@pytest.fixture
+def job_table(aws):
+  table = boto3.resource('dynamodb').Table(os.environ['JOB_TABLE_NAME'])
+  table.put_item(Item={'PK': f"JOB#{JOB_ID}", 'SK': "DATA"})
+  return table
+
+
+def test_done_of_work_units_is_coalesced_per_job(sent, job_table):
+  units = [progress.ProgressReporter(job_table, JOB_ID, 'process', interval=0.2) for _ in range(3)]
+  time.sleep(0.25)
+
+  # the first unit claims the send slot of the job, the second one is within the interval
+  units[0].done(last=False, chunks={'00000': {'done': True}})
+  units[1].done(last=False, chunks={'00001': {'done': True}})
+  # the last unit finishes the stage regardless of the rate limit
+  units[2].done(chunks={'00002': {'done': True}})
+
+  assert [(e['chunks'], e.get('done')) for e in sent] == [
+    ({'00000': {'done': True}}, None),
+    ({'00002': {'done': True}}, True),
+  ]
+
+
+def test_update_is_rate_limited(sent, job_table):
+  reporter = progress.ProgressReporter(job_table, JOB_ID, 'reduce', interval=0.2)
+
+  reporter.update(bytesUploaded=1)
+  time.sleep(0.25)
+  reporter.update(bytesUploaded=2)
+  reporter.update(bytesUploaded=3)
+  reporter.done()
+
+  assert [(e['bytesUploaded'], e.get('done')) for e in sent] == [(2, None), (3, True)]
@@ -0,0 +1,59 @@
+import pytest
+
+import process_chunk
+import reduce_chunks
+from utils import config_utils
+from utils import utils
+
+JOB_ID = 'job'
+
+
+def build_reduce_command(keys: list[str], audio_url=None) -> list[str]:
+  return reduce_chunks.build_command(["-f", "concat", "-safe", "0", "-i", "seglist"],
+                                     utils.get_extension_from_key(keys[0]), audio_url)
+
+
+def output_args(command: list[str]) -> list[str]:
+  return command[command.index("-c"):]
+
+
+def test_build_command_for_ingest_job():
+  # processed chunks of ingested .ts segments
+  keys = [f"{JOB_ID}/PROCESSED/{i:05d}.ts" for i in range(3)]
+
+  command = build_reduce_command(keys)
+
+  assert output_args(command) == ["-c", "copy", "-f", "mpegts", "pipe:1"]
+
+
+@pytest.mark.parametrize("ext, muxer", [("mp4", "mp4"), ("mov", "mov")])
+def test_build_command_fragments_mov_like_containers(ext, muxer):
+  command = build_reduce_command([f"{JOB_ID}/PROCESSED/CHUNK-0.{ext}"], audio_url="audio")
+
+  assert command[command.index("-map"):] == ["-map", "0:v", "-map", "1:a", "-c", "copy", "-f", muxer,
+                                             "-movflags", "frag_keyframe+empty_moov", "pipe:1"]
+
+
+@pytest.mark.parametrize("ext, muxer", [("mkv", "matroska"), ("webm", "webm"), ("avi", "avi")])
+def test_build_command_maps_extension_to_muxer(ext, muxer):
+  command = build_reduce_command([f"{JOB_ID}/PROCESSED/CHUNK-0.{ext}"])
+
+  assert output_args(command) == ["-c", "copy", "-f", muxer, "pipe:1"]
+
+
+def test_presegmented_ts_job_is_reduced_to_mpegts():
+  # segments of the client's --presegment, processed as chunks of their own (see trigger_segment_processing)
+  segment_key = utils.get_ingest_segment_key(JOB_ID, 0, 'ts')
+  job_id, index, ext = utils.parse_ingest_segment_key(segment_key)
+  chunk = {'key': segment_key, 'jobId': job_id, 'extension': ext, 'index': index}
+  config = config_utils.Config([{'operation': 'resize', 'opts': '640 360'}])
+
+  chunk_command, outpath, format_ = process_chunk.build_command("segment-url", f"/tmp/out/{process_chunk.get_part_name(chunk)}.ts",
+                                                    "/tmp/refimgs/00000", True, config, keep_audio=True)
+  processed_key = utils.get_processed_chunk_key(job_id, segment_key, format_)
+
+  # the muxer of the processed chunk follows its extension
+  assert outpath == "/tmp/out/00000.ts" and outpath in chunk_command
+  assert processed_key == f"{JOB_ID}/PROCESSED/00000.ts"
+  command = build_reduce_command([processed_key])
+  assert output_args(command) == ["-c", "copy", "-f", "mpegts", "pipe:1"]